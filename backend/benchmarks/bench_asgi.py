@@ -0,0 +1,138 @@
+"""
+WSGI vs ASGI load benchmark.
+
+Serves the same SQLite question bank from create_app() (werkzeug threaded
+server) and create_asgi_app() (uvicorn), each in its own process, and drives
+both with a concurrent httpx load generator. Reports requests/sec and
+p50/p99 latency per endpoint.
+
+    python benchmarks/bench_asgi.py [--size 10000] [--concurrency 64]
+
+Needs the optional async packages: starlette, uvicorn, aiosqlite, httpx.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND)
+
+import httpx
+
+from flaskr import create_app
+from synthetic import seed
+
+WSGI_PORT = 5071
+ASGI_PORT = 5072
+REQUESTS = [
+    ("GET", "/categories", None),
+    ("GET", "/questions?page=3", None),
+    ("GET", "/categories/2/questions", None),
+    ("POST", "/quizzes", {"previous_questions": [1, 2, 3], "quiz_category": {"id": 1}}),
+]
+
+
+def serve_wsgi(uri, port):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": uri})
+    server = make_server(
+        "127.0.0.1", port, app, threaded=True, request_handler=QuietHandler
+    )
+    server.serve_forever()
+
+
+def serve_asgi(uri, port):
+    import uvicorn
+    from flaskr.asgi import create_asgi_app
+
+    app = create_asgi_app({"SQLALCHEMY_DATABASE_URI": uri})
+    uvicorn.run(app, port=port, log_level="warning")
+
+
+async def load(port, method, path, body, total, concurrency):
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    base_url = "http://127.0.0.1:%d" % port
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.request(method, path, json=body)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return (
+        total / elapsed,
+        latencies[len(latencies) // 2] * 1000,
+        latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    )
+
+
+def wait_until_up(port):
+    for _ in range(100):
+        try:
+            httpx.get("http://127.0.0.1:%d/categories" % port)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError("server on port %d did not start" % port)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    uri = "sqlite:///" + path
+    seed(create_app({"SQLALCHEMY_DATABASE_URI": uri}), args.size)
+
+    servers = [
+        (mode, port, multiprocessing.Process(target=target, args=(uri, port), daemon=True))
+        for mode, port, target in [
+            ("wsgi", WSGI_PORT, serve_wsgi),
+            ("asgi", ASGI_PORT, serve_asgi),
+        ]
+    ]
+    for _, port, process in servers:
+        process.start()
+        wait_until_up(port)
+
+    print("%-6s %-28s %10s %10s %10s" % ("mode", "endpoint", "req/s", "p50 ms", "p99 ms"))
+    try:
+        for method, url, body in REQUESTS:
+            for mode, port, _ in servers:
+                rps, p50, p99 = asyncio.run(
+                    load(port, method, url, body, args.requests, args.concurrency)
+                )
+                endpoint = method + " " + url
+                print("%-6s %-28s %10.1f %10.2f %10.2f" % (mode, endpoint, rps, p50, p99))
+    finally:
+        for _, _, process in servers:
+            process.terminate()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Quiz selection benchmark.
+
+Seeds a throwaway SQLite question bank of increasing size and times
+POST /quizzes with growing previous_questions lists, next to the old
+NOT IN + random.choice query for comparison.
+
+    python benchmarks/bench_quiz.py [--sizes 1000,10000,100000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from flaskr import create_app
+from models import Question
+from synthetic import seed
+
+
+def legacy_pick(previous, category):
+    questions = Question.query.filter(
+        Question.id.notin_(previous), Question.category == category
+    ).all()
+    return random.choice(questions).format() if questions else None
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--previous", default="0,10,100,1000")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print("%10s %10s %14s %14s" % ("bank", "previous", "pool ms/req", "legacy ms/req"))
+    for size in [int(n) for n in args.sizes.split(",")]:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///" + path})
+        seed(app, size)
+        client = app.test_client()
+
+        for length in [int(n) for n in args.previous.split(",")]:
+            previous = random.sample(range(1, size + 1), min(length, size))
+            body = {"previous_questions": previous, "quiz_category": {"id": 1}}
+            client.post("/quizzes", json=body)  # warm the pool
+
+            pool_ms = timed(lambda: client.post("/quizzes", json=body), args.repeat)
+            with app.app_context():
+                legacy_ms = timed(lambda: legacy_pick(previous, 1), args.repeat)
+            print("%10d %10d %14.3f %14.3f" % (size, length, pool_ms, legacy_ms))
+
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
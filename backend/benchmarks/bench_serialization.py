@@ -0,0 +1,74 @@
+"""
+Serialization benchmark: Question.format() + jsonify vs the lean path.
+
+Times GET /questions and /categories/<id>/questions with and without
+LEAN_ENDPOINTS, and measures the objects allocated while building one page
+of dicts with tracemalloc.
+
+    python benchmarks/bench_serialization.py [--size 20000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from flaskr import create_app
+from flaskr.serializers import lean_questions
+from models import Question
+
+from synthetic import seed
+
+LEAN = {"available_questions", "category_question_list"}
+PAGE = 100
+
+
+def allocations(fn):
+    tracemalloc.start()
+    fn()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = snapshot.statistics("filename")
+    return sum(stat.count for stat in stats), sum(stat.size for stat in stats)
+
+
+def timed(client, url, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        client.get(url)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    uri = "sqlite:///" + path
+    seed(create_app({"SQLALCHEMY_DATABASE_URI": uri}), args.size)
+
+    format_app = create_app({"SQLALCHEMY_DATABASE_URI": uri})
+    with format_app.app_context():
+        selection = Question.query.order_by(Question.id).limit(PAGE)
+        blocks, size = allocations(lambda: [q.format() for q in selection])
+        print("format(): %6d blocks %8d bytes for %d rows" % (blocks, size, PAGE))
+        blocks, size = allocations(lambda: lean_questions(selection))
+        print("lean:     %6d blocks %8d bytes for %d rows" % (blocks, size, PAGE))
+
+    print("%-34s %12s %12s" % ("endpoint", "format ms", "lean ms"))
+    lean_app = create_app({"SQLALCHEMY_DATABASE_URI": uri, "LEAN_ENDPOINTS": LEAN})
+    for url in ["/questions?page=50", "/categories/0/questions?page=20"]:
+        format_ms = timed(format_app.test_client(), url, args.repeat)
+        lean_ms = timed(lean_app.test_client(), url, args.repeat)
+        print("%-34s %12.3f %12.3f" % (url, format_ms, lean_ms))
+
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Startup benchmark.
+
+Times, in a fresh interpreter per run, importing the app, create_app() and
+the first request, for each DB_INIT mode (all in ms), then the cost of every further
+create_app() in the same process (what a test suite pays per setUp).
+
+    python benchmarks/bench_startup.py [--size 10000] [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CHILD = "--child"
+
+
+def child(uri, mode, apps):
+    sys.path.insert(0, BACKEND)
+    start = time.perf_counter()
+    from flaskr import create_app
+
+    imported = time.perf_counter()
+    app = create_app({"SQLALCHEMY_DATABASE_URI": uri, "DB_INIT": mode})
+    created = time.perf_counter()
+    app.test_client().get("/questions/search?q=anc")
+    served = time.perf_counter()
+
+    for _ in range(apps):
+        create_app({"SQLALCHEMY_DATABASE_URI": uri, "DB_INIT": mode})
+    again = time.perf_counter()
+
+    print(
+        json.dumps(
+            {
+                "import": imported - start,
+                "create_app": created - imported,
+                "first_request": served - created,
+                "next_create_app": (again - served) / apps,
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--apps", type=int, default=20)
+    parser.add_argument("--modes", default="eager,lazy")
+    args = parser.parse_args()
+
+    from synthetic import bank_uri
+
+    uri = bank_uri(args.size)
+
+    print(
+        "%8s %10s %14s %16s %20s"
+        % ("mode", "import ms", "create_app ms", "first request", "next create_app ms")
+    )
+    for mode in args.modes.split(","):
+        runs = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, __file__, CHILD, uri, mode, str(args.apps)],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            runs.append(json.loads(output.splitlines()[-1]))
+
+        median = {
+            key: statistics.median(run[key] for run in runs) * 1000 for key in runs[0]
+        }
+        print(
+            "%8s %10.1f %14.1f %16.1f %20.2f"
+            % (
+                mode,
+                median["import"],
+                median["create_app"],
+                median["first_request"],
+                median["next_create_app"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == CHILD:
+        child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main()
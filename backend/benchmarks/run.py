@@ -0,0 +1,346 @@
+"""
+Load benchmark of every endpoint against a synthetic question bank.
+
+Each scenario drives one route through the Flask test client from
+`--threads` worker threads for `--requests` requests, after a warm-up, and
+reports throughput, p50/p99 latency and the peak traced allocation of a
+short single-threaded pass (tracemalloc slows requests down, so it is kept
+out of the timed run).
+
+    python benchmarks/run.py --sizes 10000,100000 [--scenarios quiz,search]
+    python benchmarks/run.py --save-baseline          # write baselines/<size>.json
+    python benchmarks/run.py --compare --tolerance 0.25
+    python benchmarks/run.py --offline        # read-only routes from a bank file
+    python benchmarks/run.py --metrics        # instrumented, plus /metrics/pool
+
+--compare exits non-zero when a scenario's p99 or throughput is worse than
+its baseline by more than the tolerance. Banks are generated once and kept
+in benchmarks/.banks/ (see synthetic.py).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from synthetic import BENCHMARKS, CATEGORIES, VOCABULARY, bank_file, bank_uri
+
+from flaskr import create_app
+
+BASELINE_DIR = os.path.join(BENCHMARKS, "baselines")
+MEMORY_REQUESTS = 50
+IMPORT_ROWS = 50
+# synthetic banks use difficulties 1-5: imported rows are told apart by this
+IMPORT_DIFFICULTY = 0
+
+
+## Scenarios: a function (client, rng, size) -> response for each route
+def categories(client, rng, size):
+    return client.get("/categories")
+
+
+def questions_page(client, rng, size):
+    return client.get("/questions?page=%d" % rng.randint(1, max(size // 10, 1)))
+
+
+def questions_after_id(client, rng, size):
+    return client.get("/questions?after_id=%d" % rng.randrange(size - 10))
+
+
+def category_questions(client, rng, size):
+    category = rng.randrange(len(CATEGORIES))
+    page = rng.randint(1, 5)
+    return client.get("/categories/%d/questions?page=%d" % (category, page))
+
+
+def search(client, rng, size):
+    return client.post("/questions", json={"searchTerm": rng.choice(VOCABULARY)})
+
+
+def search_prefix(client, rng, size):
+    return client.get("/questions/search?q=" + rng.choice(VOCABULARY)[:3])
+
+
+def quiz(client, rng, size):
+    body = {
+        "previous_questions": rng.sample(range(1, size + 1), 20),
+        "quiz_category": {"id": rng.randint(0, len(CATEGORIES))},
+    }
+    return client.post("/quizzes", json=body)
+
+
+def quiz_adaptive(client, rng, size):
+    body = {
+        "previous_questions": rng.sample(range(1, size + 1), 20),
+        "quiz_category": {"id": rng.randint(0, len(CATEGORIES))},
+        "answers": [
+            {"difficulty": rng.randint(1, 5), "correct": rng.random() < 0.5}
+            for _ in range(10)
+        ],
+    }
+    return client.post("/quizzes", json=body)
+
+
+_sessions = threading.local()
+
+
+def quiz_session(client, rng, size):
+    # one session per worker thread, restarted when it runs out of questions
+    response = None
+    if getattr(_sessions, "id", None) is not None:
+        response = client.post("/quizzes/sessions/%s/next" % _sessions.id)
+        if response.status_code == 200 and response.get_json()["question"]:
+            return response
+
+    response = client.post("/quizzes/sessions", json={"quiz_category": {"id": 0}})
+    _sessions.id = response.get_json().get("session_id")
+    return response
+
+
+def create_delete(client, rng, size):
+    body = {
+        "question": "benchmark question?",
+        "answer": "benchmark",
+        "category": rng.randint(1, len(CATEGORIES)),
+        "difficulty": 1,
+    }
+    created = client.post("/questions", json=body).get_json()["created"]
+    return client.delete("/questions/%d" % created)
+
+
+def import_bulk_delete(client, rng, size):
+    # import a batch, then remove it with one set-based DELETE
+    category = rng.randint(1, len(CATEGORIES))
+    row = {
+        "question": "benchmark import?",
+        "answer": "benchmark",
+        "category": category,
+        "difficulty": IMPORT_DIFFICULTY,
+    }
+    body = "\n".join(json.dumps(row) for _ in range(IMPORT_ROWS))
+    client.post("/questions/import", data=body, content_type="application/x-ndjson")
+    return client.delete(
+        "/questions", json={"category": category, "difficulty": IMPORT_DIFFICULTY}
+    )
+
+
+def export(client, rng, size):
+    response = client.get("/questions/export")
+    response.get_data()
+    return response
+
+
+def bulk_update(client, rng, size):
+    # rewrites a (category, difficulty) slice with the values it already has
+    difficulty = rng.randint(1, 5)
+    body = {
+        "category": rng.randint(1, len(CATEGORIES)),
+        "difficulty": difficulty,
+        "set": {"difficulty": difficulty},
+    }
+    return client.patch("/questions", json=body)
+
+
+def pool_metrics(client, rng, size):
+    return client.get("/metrics/pool")
+
+
+SCENARIOS = {
+    "categories": categories,
+    "questions_page": questions_page,
+    "questions_after_id": questions_after_id,
+    "category_questions": category_questions,
+    "search": search,
+    "search_prefix": search_prefix,
+    "quiz": quiz,
+    "quiz_adaptive": quiz_adaptive,
+    "quiz_session": quiz_session,
+    "create_delete": create_delete,
+    "import_bulk_delete": import_bulk_delete,
+    "export": export,
+    "bulk_update": bulk_update,
+    "pool_metrics": pool_metrics,
+}
+# served only with METRICS_ENABLED, which instruments every other route too
+METRICS_SCENARIOS = ("pool_metrics",)
+# the routes offline mode serves
+OFFLINE_SCENARIOS = (
+    "categories",
+    "questions_page",
+    "questions_after_id",
+    "category_questions",
+    "quiz",
+    "quiz_adaptive",
+)
+
+
+def percentile(sorted_values, fraction):
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def measure(app, scenario, size, requests, threads, warmup):
+    """Latencies of `requests` calls spread over `threads` workers."""
+
+    def worker(count, seed):
+        client = app.test_client()
+        rng = random.Random(seed)
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = scenario(client, rng, size)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 500:
+                raise RuntimeError(
+                    "%s returned %d" % (scenario.__name__, response.status_code)
+                )
+        return latencies
+
+    worker(warmup, -1)
+
+    per_thread = max(requests // threads, 1)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(worker, [per_thread] * threads, range(threads)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for result in results for latency in result)
+
+    tracemalloc.start()
+    worker(MEMORY_REQUESTS, threads)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_kb": peak / 1024,
+    }
+
+
+def baseline_path(size):
+    return os.path.join(BASELINE_DIR, "bank-%d.json" % size)
+
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for name, result in results.items():
+        expected = baseline.get("scenarios", {}).get(name)
+        if expected is None:
+            continue
+        if result["p99_ms"] > expected["p99_ms"] * (1 + tolerance):
+            found.append(
+                "%s: p99 %.2fms, baseline %.2fms"
+                % (name, result["p99_ms"], expected["p99_ms"])
+            )
+        if result["throughput"] < expected["throughput"] * (1 - tolerance):
+            found.append(
+                "%s: %.0f req/s, baseline %.0f req/s"
+                % (name, result["throughput"], expected["throughput"])
+            )
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000")
+    parser.add_argument("--scenarios", default=None)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--fresh", action="store_true", help="regenerate the banks")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument(
+        "--group-commit", action="store_true", help="create through the group commit writer"
+    )
+    parser.add_argument(
+        "--offline", action="store_true", help="serve from a question bank file"
+    )
+    parser.add_argument(
+        "--metrics", action="store_true", help="run with METRICS_ENABLED"
+    )
+    args = parser.parse_args()
+    if args.scenarios is None:
+        if args.offline:
+            args.scenarios = ",".join(OFFLINE_SCENARIOS)
+        else:
+            args.scenarios = ",".join(
+                name
+                for name in SCENARIOS
+                if args.metrics or name not in METRICS_SCENARIOS
+            )
+
+    failed = []
+    for size in [int(n) for n in args.sizes.split(",")]:
+        if args.offline:
+            app = create_app({"SNAPSHOT_PATH": bank_file(size, args.fresh)})
+        else:
+            app = create_app(
+                {
+                    "SQLALCHEMY_DATABASE_URI": bank_uri(size, args.fresh),
+                    "GROUP_COMMIT_ENABLED": args.group_commit,
+                    "METRICS_ENABLED": args.metrics,
+                }
+            )
+        results = {}
+
+        print("bank of %d questions" % size)
+        print(
+            "%20s %10s %10s %10s %10s"
+            % ("scenario", "req/s", "p50 ms", "p99 ms", "peak KB")
+        )
+        for name in args.scenarios.split(","):
+            result = measure(
+                app, SCENARIOS[name], size, args.requests, args.threads, args.warmup
+            )
+            results[name] = result
+            print(
+                "%20s %10.0f %10.2f %10.2f %10.0f"
+                % (
+                    name,
+                    result["throughput"],
+                    result["p50_ms"],
+                    result["p99_ms"],
+                    result["peak_kb"],
+                )
+            )
+
+        if args.compare:
+            if not os.path.exists(baseline_path(size)):
+                print("no baseline for bank of %d questions" % size)
+            else:
+                with open(baseline_path(size)) as source:
+                    failed += regressions(results, json.load(source), args.tolerance)
+
+        if args.save_baseline:
+            os.makedirs(BASELINE_DIR, exist_ok=True)
+            with open(baseline_path(size), "w") as output:
+                json.dump(
+                    {
+                        "python": platform.python_version(),
+                        "machine": platform.machine(),
+                        "threads": args.threads,
+                        "scenarios": results,
+                    },
+                    output,
+                    indent=2,
+                    sort_keys=True,
+                )
+            print("baseline saved to %s" % baseline_path(size))
+
+    for regression in failed:
+        print("REGRESSION " + regression)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Synthetic question banks for the benchmarks.
+
+generate_bank() fills a SQLite database with `size` questions spread over the
+six trivia categories. Question and answer text is drawn from a fixed
+vocabulary, so search terms have realistic selectivity, and a fixed seed
+makes every bank reproducible. Banks are cached under benchmarks/.banks/ and
+reused across runs.
+"""
+import os
+import random
+import sys
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, ".."))
+
+from flaskr import create_app
+from flaskr.bank import export_bank
+from models import db, Question, Category
+
+CATEGORIES = ["Science", "Art", "Geography", "History", "Entertainment", "Sports"]
+BANK_DIR = os.path.join(BENCHMARKS, ".banks")
+CHUNK = 10000
+SEED = 42
+
+VOCABULARY = (
+    "ancient empire river mountain painter novel planet element ocean desert "
+    "king queen battle treaty symphony composer athlete stadium trophy record "
+    "island capital volcano glacier molecule atom galaxy comet poet sculpture "
+    "museum dynasty revolution inventor engine bridge tower cathedral festival "
+    "film actor director album guitar league champion marathon olympic medal"
+).split()
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def seed(app, size, rng=None):
+    """Insert categories and `size` questions into the app's database."""
+    rng = rng or random.Random(SEED)
+    with app.app_context():
+        db.session.execute(
+            Category.__table__.insert(), [{"type": type} for type in CATEGORIES]
+        )
+        for start in range(0, size, CHUNK):
+            db.session.execute(
+                Question.__table__.insert(),
+                [
+                    {
+                        "question": "%s %d?" % (sentence(rng, 8), i),
+                        "answer": sentence(rng, 2),
+                        "category": rng.randrange(len(CATEGORIES)) + 1,
+                        "difficulty": rng.randrange(5) + 1,
+                    }
+                    for i in range(start, min(start + CHUNK, size))
+                ],
+            )
+            db.session.commit()
+
+
+def bank_uri(size, fresh=False):
+    """SQLite URI of a cached bank of `size` questions, generated if missing."""
+    os.makedirs(BANK_DIR, exist_ok=True)
+    path = os.path.join(BANK_DIR, "bank-%d.db" % size)
+    if fresh and os.path.exists(path):
+        os.remove(path)
+
+    uri = "sqlite:///" + path
+    if not os.path.exists(path):
+        partial = path + ".partial"
+        if os.path.exists(partial):
+            os.remove(partial)
+        seed(create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///" + partial}), size)
+        os.rename(partial, path)
+    return uri
+
+
+def bank_file(size, fresh=False):
+    """Path of the offline question bank file (flaskr.bank) of bank_uri(size)."""
+    uri = bank_uri(size, fresh)
+    path = os.path.join(BANK_DIR, "bank-%d.bin" % size)
+    if fresh or not os.path.exists(path):
+        app = create_app({"SQLALCHEMY_DATABASE_URI": uri})
+        with app.app_context():
+            export_bank(path)
+    return path
@@ -1,35 +1,135 @@
 ## crypt import methods & nis import cat 
-import os
-from unicodedata import category
+import json
+import queue
 
 ## resource import 
-from flask import Flask, request, abort, jsonify
-from flask_sqlalchemy import SQLAlchemy
+import click
+from flask import Flask, Response, g, request, abort, jsonify, stream_with_context
 from flask_cors import CORS
-import random
-
-from models import setup_db, Question, Category
-
-QUESTIONS_PER_PAGE = 10
-
-## Questions pagination <--Done
-def paginate_questions(request, selection):
-    page = request.args.get("page", 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-    questions = [question.format() for question in selection]
-
-    return questions[start:end]
+from werkzeug.exceptions import ServiceUnavailable
+
+from models import (
+    setup_db,
+    init_schema,
+    database_path,
+    db,
+    pool_stats,
+    use_replica,
+    on_primary,
+    Question,
+)
+from .pagination import paginate_questions
+from .serializers import json_response, question_fields, select_fields
+from .conditional import CONDITIONAL_ENDPOINTS, data_version
+from .bank import export_bank
+from .errors import register_error_handlers
+from .metrics import init_metrics
+from .compression import init_compression
+from .admission import init_admission
+from .cache import shared_cache
+from .group_commit import WriterUnavailable, init_group_commit
+from .precompute import precompute_stats, precompute_worker
+from .offline import init_offline
+from .counts import question_counts
+from .categories import category_cache
+from .snapshots import category_snapshots
+from .quiz import ALL_CATEGORIES, quiz_pool
+from .adaptive import adaptive_quiz, skill_estimate
+from .quiz_sessions import quiz_sessions
+from .search import question_search, tokenize
+from .bulk import (
+    QuestionImport,
+    IMPORT_BATCH_SIZE,
+    bulk_delete,
+    bulk_update,
+    export_questions,
+    question_criteria,
+    question_values,
+)
+
+
+READ_ONLY_ENDPOINTS = (
+    "available_categories_type",
+    "available_questions",
+    "category_question_list",
+    "search_questions_prefix",
+    "export_question_list",
+)
 
 
 def create_app(test_config=None):
     ## create and configure Triva app database <--Done
     app = Flask(__name__)
-    setup_db(app)
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+    ## Offline mode: SNAPSHOT_PATH serves the read-only endpoints from a
+    ## question bank file (`flask export-bank`) without any database
+    if app.config.get("SNAPSHOT_PATH"):
+        return init_offline(app)
+    setup_db(app, app.config.get("SQLALCHEMY_DATABASE_URI", database_path))
+    ## Opt-in cache shared by every worker (CACHE_BACKEND) for categories,
+    ## counts and question pages
+    shared_cache.init_app(app)
+    question_counts.reset()
+    category_cache.ttl = app.config.get("CATEGORY_CACHE_TTL", category_cache.ttl)
+    category_cache.invalidate()
+    quiz_pool.reset()
+    adaptive_quiz.reset()
+    category_snapshots.max_bytes = app.config.get(
+        "SNAPSHOT_MAX_BYTES", category_snapshots.max_bytes
+    )
+    category_snapshots.reset()
+    ## Quiz sessions go to the shared store when CACHE_BACKEND has one
+    quiz_sessions.init_app(app)
+    question_search.init_app(app)
+    data_version.init_app(app)
+    ## Opt-in background rebuild of categories, counts and quiz pools
+    precompute_worker.init_app(app)
+
+    ## Opt-in request metrics (/metrics) and slow-request profiling
+    if app.config.get("METRICS_ENABLED", False):
+        init_metrics(app)
+
+    ## Opt-in admission control: token buckets and concurrency limits
+    if app.config.get("ADMISSION_ENABLED", False):
+        init_admission(app)
+
+    ## Opt-in group commit: bursts of question creates share transactions
+    group_commit = init_group_commit(app)
+
+    ## Negotiated gzip/brotli compression of larger JSON bodies
+    if app.config.get("COMPRESSION_ENABLED", True):
+        init_compression(app)
 
     ## CORS setup <--Done
     CORS(app, resource={"/": {"origins": "*"}})
 
+    ## Read-only endpoints run on the DB_REPLICA_PATH engine when configured
+    read_only_endpoints = frozenset(
+        app.config.get("READ_ONLY_ENDPOINTS", READ_ONLY_ENDPOINTS)
+    )
+
+    @app.before_request
+    def route_reads_to_replica():
+        if request.endpoint in read_only_endpoints:
+            use_replica()
+
+    ## Conditional GETs: answer If-None-Match with 304 before any DB work
+    conditional_endpoints = frozenset(
+        app.config.get("CONDITIONAL_ENDPOINTS", CONDITIONAL_ENDPOINTS)
+    )
+
+    @app.before_request
+    def check_data_version():
+        if request.method != "GET" or request.endpoint not in conditional_endpoints:
+            return None
+
+        # remember the version the response is built from
+        g.etag = data_version.etag()
+        if request.if_none_match.contains_weak(g.etag):
+            return Response(status=304)
+        return None
+
     ## CORS Headers <--Done
     @app.after_request
     def after_request(response):
@@ -37,28 +137,78 @@ def create_app(test_config=None):
             "Access-Control-Allow-Headers", "Content-Type,Authorization,true"
         )
         response.headers.add(
-            "Access-Control-Allow-Methods", "GET,PUT,POST,DELETE,OPTIONS"
+            "Access-Control-Allow-Methods", "GET,PUT,POST,PATCH,DELETE,OPTIONS"
         )
+        ## ETag, Last-Modified and Cache-Control for the conditional endpoints
+        if "etag" in g and response.status_code in (200, 304):
+            response.set_etag(g.etag, weak=True)
+            response.last_modified = data_version.modified_at
+            response.headers["Cache-Control"] = "no-cache"
         return response
 
+    ## Lean serialization (column-only rows + fast JSON), opt-in per endpoint
+    ## name, e.g. LEAN_ENDPOINTS = {"available_questions"}
+    lean_endpoints = frozenset(app.config.get("LEAN_ENDPOINTS") or ())
+
+    def lean():
+        return request.endpoint in lean_endpoints
+
+    def respond(payload):
+        return json_response(payload) if lean() else jsonify(payload)
+
+    ## Category pages from pre-encoded snapshots (opt-in SNAPSHOTS_ENABLED;
+    ## with several workers, PRECOMPUTE_ENABLED brings in the others' writes)
+    use_snapshots = app.config.get("SNAPSHOTS_ENABLED", False)
+
+    ## Payload trimming: ?fields=id,question keeps only those question keys,
+    ## ?refresh=false drops the page of questions sent back after a mutation
+    @app.before_request
+    def parse_question_fields():
+        g.fields = None
+        if "fields" in request.args:
+            try:
+                g.fields = question_fields(request.args["fields"])
+            except ValueError:
+                abort(400)
+
+    def refresh():
+        return request.args.get("refresh", "true").lower() not in ("false", "0", "no")
+
+    def page_of_questions(selection):
+        return paginate_questions(request, selection, lean=lean(), fields=g.fields)
+
+    def cached_page_of_questions():
+        # ?page=N pages of all questions go through the shared cache; keyset
+        # (after_id) pages are cheap and unbounded in number, so they do not
+        if "after_id" in request.args or not shared_cache.enabled:
+            return page_of_questions(Question.query)
+        key = "questions:%d:%s" % (
+            request.args.get("page", 1, type=int),
+            ",".join(g.fields or ()),
+        )
+
+        def compute():
+            # every worker reads this page: never from a lagging replica
+            with on_primary():
+                return page_of_questions(Question.query)
+
+        return shared_cache.get_or_compute("pages", key, compute)
+
     ## Endpoint to handle GET requests for all available categories ---Done
 
     @app.route("/categories")
     def available_categories_type():
 
-        # get all type category
-        selection = Category.query.order_by(Category.id).all()
-        current_category = paginate_questions(request, selection)
+        # get all type category from the cache, already serialised
+        categories, fragment, _ = category_cache.fragments()
 
-        if len(current_category) == 0:
+        if len(categories) == 0:
             abort(404)
 
-        return jsonify(
-            {
-                "success": True,
-                "categories": {category.id: category.type for category in selection},
-                "total_categories": len(Category.query.all()),
-            }
+        return app.response_class(
+            '{"categories":%s,"success":true,"total_categories":%d}\n'
+            % (fragment, len(categories)),
+            mimetype="application/json",
         )
 
     # Endpoint to handling GET questions, pagination (10 questions). Endpoint returns a list of questions, number total questions, current categories.
@@ -66,22 +216,19 @@ def create_app(test_config=None):
     @app.route("/questions")
     def available_questions():
         try:
-            # get all questions 
-            selection = Question.query.order_by(Question.id).all()
-
             # get present questions in a page
-            current_questions = paginate_questions(request, selection)
+            current_questions = cached_page_of_questions()
 
             if len(current_questions) == 0:
                 abort(404)
 
-            return jsonify(
+            return respond(
                 {
                     "success": True,
                     "list_of_questions": current_questions,
-                    "total_questions": len(Question.query.all()),
+                    "total_questions": question_counts.total(),
                     "current_category": [],
-                    "categories": [category.type for category in Category.query.all()],
+                    "categories": category_cache.type_list(),
                 }
             )
         except Exception:
@@ -99,18 +246,16 @@ def create_app(test_config=None):
                 abort(404)
 
             question.delete()
-            selection = Question.query.order_by(Question.id).all()
-            # Post to reflect in front end
-            current_question = paginate_questions(request, selection)
 
-            return jsonify(
-                {
-                    "success": True,
-                    "deleted": question.id,
-                    "questions": current_question,
-                    "total_questions": len(Question.query.all()),
-                }
-            )
+            result = {
+                "success": True,
+                "deleted": question.id,
+                "total_questions": question_counts.total(),
+            }
+            # Post to reflect in front end
+            if refresh():
+                result["questions"] = page_of_questions(Question.query)
+            return respond(result)
 
         except Exception:
             abort(422)
@@ -130,84 +275,189 @@ def create_app(test_config=None):
         # Endpoint POST to get questions based on search term. Return questions from search term is a substring of question.
         try:
             if search:
-                selection = Question.query.order_by(Question.id).filter(
-                    Question.question.ilike(f"%{search}%")
+                # ranked full-text search over question and answer text
+                current_questions, total_questions = question_search.search(
+                    search, request.args.get("page", 1, type=int)
                 )
 
-                # Post latest state in the front end
-                current_questions = paginate_questions(request, selection)
-
-                categories = Category.query.all()
-                current_category = {
-                    category.id: category.type for category in categories
-                }
+                current_category = category_cache.types()
 
                 return jsonify(
                     {
                         "success": True,
-                        "questions": current_questions,
-                        "total_questions": len(selection.all()),
+                        "questions": select_fields(current_questions, g.fields),
+                        "total_questions": total_questions,
                         "current_category": current_category,
                     }
                 )
 
             # Endpoint to POST a new question, requiring the question and answer text, category, and difficulty score.
             else:
+                # form posts send numbers as strings; the change listeners
+                # key their structures on the stored integers
                 question = Question(
                     question=question,
                     answer=answer,
-                    category=category,
-                    difficulty=difficulty,
+                    category=int(category) if category is not None else None,
+                    difficulty=int(difficulty) if difficulty is not None else None,
                 )
-                question.insert()
-
-                selection = Question.query.order_by(Question.id).all()
+                if group_commit is not None:
+                    group_commit.insert(question)
+                else:
+                    question.insert()
 
+                result = {
+                    "success": True,
+                    "created": question.id,
+                    "question_created": question.question,
+                    "total_questions": question_counts.total(),
+                }
                 # Post latest state in the front end
-                current_questions = paginate_questions(request, selection)
+                if refresh():
+                    result["questions"] = page_of_questions(Question.query)
+                return respond(result)
+
+        except (queue.Full, WriterUnavailable):
+            # the group commit queue is at GROUP_COMMIT_QUEUE_DEPTH, or the
+            # writer is closed or too slow to commit
+            raise ServiceUnavailable(retry_after=1)
+        except Exception:
+            abort(422)
 
-                return jsonify(
-                    {
-                        "success": True,
-                        "created": question.id,
-                        "questions": current_questions,
-                        "question_created": question.question,
-                        "total_questions": len(Question.query.all()),
-                    }
-                )
+    # A GET endpoint for search-as-you-type: the last word of q matches as a
+    # prefix and results are served from an LRU cache cleared on changes.
+    @app.route("/questions/search")
+    def search_questions_prefix():
+        term = request.args.get("q", "", type=str)
+        page = request.args.get("page", 1, type=int)
+
+        if not tokenize(term):
+            abort(400)
+
+        current_questions, total_questions = question_search.prefix_search(term, page)
+
+        return jsonify(
+            {
+                "success": True,
+                "questions": select_fields(current_questions, g.fields),
+                "total_questions": total_questions,
+                "current_category": category_cache.types(),
+            }
+        )
+
+    # Bulk import: POST an NDJSON body, one question object per line. Lines
+    # are parsed as they stream in and inserted in batches with one commit each.
+    @app.route("/questions/import", methods=["POST"])
+    def import_questions():
+        job = QuestionImport(app.config.get("IMPORT_BATCH_SIZE", IMPORT_BATCH_SIZE))
+        job.run(request.stream)
 
+        if job.imported == 0 and job.failed == 0:
+            abort(400)
+
+        return jsonify(
+            {
+                "success": True,
+                "imported": job.imported,
+                "failed": job.failed,
+                "errors": job.errors,
+            }
+        )
+
+    # Bulk export: streams every question as NDJSON
+    @app.route("/questions/export")
+    def export_question_list():
+        return Response(
+            stream_with_context(export_questions()),
+            mimetype="application/x-ndjson",
+        )
+
+    # Bulk DELETE over ids and/or category/difficulty filters, as a single
+    # set-based statement. Returns only the number of deleted rows.
+    @app.route("/questions", methods=["DELETE"])
+    def delete_questions():
+        body = request.get_json(silent=True) or {}
+
+        try:
+            criteria = question_criteria(body)
+        except (ValueError, TypeError):
+            abort(400)
+
+        try:
+            deleted = bulk_delete(criteria)
         except Exception:
             abort(422)
 
+        return jsonify({"success": True, "deleted": deleted})
+
+    # Bulk PATCH: same filters, body["set"] holds the new field values
+    @app.route("/questions", methods=["PATCH"])
+    def update_questions():
+        body = request.get_json(silent=True) or {}
+
+        try:
+            criteria = question_criteria(body)
+        except (ValueError, TypeError):
+            abort(400)
+
+        # a null or mistyped value is unprocessable, not stored as a string
+        try:
+            values = question_values(body.get("set"))
+        except ValueError:
+            abort(400)
+        except TypeError:
+            abort(422)
+
+        try:
+            updated = bulk_update(criteria, values)
+        except Exception:
+            abort(422)
+
+        return jsonify({"success": True, "updated": updated})
+
     # A GET endpoint to get question from category type
     @app.route("/categories/<int:category_id>/questions")
     def category_question_list(category_id):
         try:
             c_id = category_id + 1
 
-            # fetch question of category by the id
-            category = Category.query.filter(Category.id == c_id).one_or_none()
+            # fetch category type of the category by the id
+            category_type = category_cache.types().get(c_id)
 
-            if category is None:
+            if category_type is None:
                 abort(404)
 
+            # plain page requests are served from the pre-encoded snapshot
+            if use_snapshots and g.fields is None and "after_id" not in request.args:
+                page = category_snapshots.page(
+                    c_id, request.args.get("page", 1, type=int)
+                )
+                if page is not None:
+                    return app.response_class(
+                        b'{"categories":%s,"current_category":%s,"questions":%s,'
+                        b'"success":true,"total_questions":%d}\n'
+                        % (
+                            category_cache.list_fragment().encode(),
+                            json.dumps(category_type).encode(),
+                            page,
+                            question_counts.total(),
+                        ),
+                        mimetype="application/json",
+                    )
+
             # fetch all question in the selected category
-            selection = (
-                Question.query.filter(Question.category == category.id)
-                .order_by(Question.id)
-                .all()
-            )
+            selection = Question.query.filter(Question.category == c_id)
 
             # Post latest status in the front end
-            current_questions = paginate_questions(request, selection)
+            current_questions = page_of_questions(selection)
 
-            return jsonify(
+            return respond(
                 {
                     "success": True,
                     "questions": current_questions,
-                    "total_questions": len(Question.query.all()),
-                    "categories": [category.type for category in Category.query.all()],
-                    "current_category": category.type,
+                    "total_questions": question_counts.total(),
+                    "categories": category_cache.type_list(),
+                    "current_category": category_type,
                 }
             )
         except Exception:
@@ -222,79 +472,161 @@ def create_app(test_config=None):
         body = request.get_json()
         quiz_category = body.get("quiz_category", None)
         previous_questions = body.get("previous_questions", None)
+        answers = body.get("answers", None)
         category_id = quiz_category["id"]
 
         try:
+            previous = set(previous_questions)
+            category = int(category_id)
 
-            # Filter available questions by all category and new questions
-            if category_id == 0:
-                questions = Question.query.filter(
-                    Question.id.notin_(previous_questions)
-                ).all()
+            # unknown category
+            if category != ALL_CATEGORIES and category not in category_cache.types():
+                abort(404)
+
+            next_question = None
+
+            if answers is not None:
+                # adaptive quiz: aim at the player's running skill estimate
+                skill = skill_estimate(answers)
+
+                def pick():
+                    return adaptive_quiz.pick(category, previous, skill)
 
             else:
-                category = Category.query.get(category_id)
-                # Filter available questions by chosen category & new questions
-                if category is not None:
-                    questions = Question.query.filter(
-                        Question.id.notin_(previous_questions),
-                        Question.category == category_id,
-                    ).all()
 
-            next_question = None
+                def pick():
+                    return quiz_pool.sample(category, previous)
+
+            # randomize the question from the in-memory pool, fetch it by id
+            question_id = pick()
+            while question_id is not None:
+                question = Question.query.get(question_id)
+                if question is not None:
+                    next_question = question.format()
+                    break
+                # removed by another worker since the pool was loaded
+                quiz_pool.discard(question_id)
+                adaptive_quiz.discard(question_id)
+                question_id = pick()
+
+            result = {
+                "success": True,
+                "question": next_question,
+                "total_questions": quiz_pool.remaining(category, previous),
+            }
+            if answers is not None:
+                result["skill"] = round(skill, 2)
+            return jsonify(result)
 
-            # randomize the question
-            if len(questions) > 0:
-                next_question = random.choice(questions).format()
+        except Exception:
+            abort(404)
 
-            return jsonify(
-                {
-                    "success": True,
-                    "question": next_question,
-                    "total_questions": len(questions),
-                }
-            )
+    # Quiz sessions: the server keeps a shuffled queue of question ids per
+    # player, so a turn sends no previous_questions and costs one id lookup.
+
+    @app.route("/quizzes/sessions", methods=["POST"])
+    def start_quiz_session():
+        body = request.get_json()
 
+        try:
+            category = int(body["quiz_category"]["id"])
         except Exception:
+            abort(400)
+
+        if category != ALL_CATEGORIES and category not in category_cache.types():
             abort(404)
 
-    ### Error handlers: 404 error when user access page not existing
-    
-    @app.errorhandler(404)
-    def file_absent(error):
-        return (
-            jsonify({"success": False, "error": 404, "message": "resource not found"}),
-            404,
-        )
-    ### 422 error when server understand content type but unable to process content instructions
-    @app.errorhandler(422)
-    def unprocessable_path(error):
-        return (
-            jsonify({"success": False, "error": 422, "message": "unprocessable"}),
-            422,
-        )
+        session = quiz_sessions.start(category)
 
-    ### 400 error when server can't process request due to client error
-    @app.errorhandler(400)
-    def bad_request_log(error):
-        return jsonify({"success": False, "error": 400, "message": "bad request"}), 400
-
-    ### 405 error when target resource does not support the method
-    @app.errorhandler(405)
-    def file_absent(error):
-        return (
-            jsonify({"success": False, "error": 405, "message": "method not allowed"}),
-            405,
+        return jsonify(
+            {
+                "success": True,
+                "session_id": session.id,
+                "total_questions": quiz_sessions.remaining(session),
+                "expires_in": quiz_sessions.ttl,
+            }
         )
 
-    ### 505 error where Http version in request is not supported by the server
-    @app.errorhandler(505)
-    def file_absent(error):
-        return (
-            jsonify(
-                {"success": False, "error": 505, "message": "Internal server error"}
-            ),
-            405,
+    @app.route("/quizzes/sessions/<session_id>/next", methods=["POST"])
+    def next_quiz_question(session_id):
+        session = quiz_sessions.get(session_id)
+
+        if session is None:
+            abort(404)
+
+        next_question = None
+
+        # skip ids deleted since the session started
+        question_id = quiz_sessions.next_id(session)
+        while question_id is not None:
+            question = Question.query.get(question_id)
+            if question is not None:
+                next_question = question.format()
+                break
+            question_id = quiz_sessions.next_id(session)
+
+        return jsonify(
+            {
+                "success": True,
+                "question": next_question,
+                "total_questions": quiz_sessions.remaining(session),
+            }
         )
 
+    @app.route("/quizzes/sessions/<session_id>", methods=["DELETE"])
+    def end_quiz_session(session_id):
+        if not quiz_sessions.end(session_id):
+            abort(404)
+
+        return jsonify({"success": True, "ended": session_id})
+
+    # Connection pool checkout wait times and current pool status
+    if app.config.get("METRICS_ENABLED", False):
+
+        @app.route("/metrics/pool")
+        def pool_metrics():
+            return jsonify(
+                {
+                    "success": True,
+                    "checkout": pool_stats.snapshot(),
+                    "status": db.engine.pool.status(),
+                }
+            )
+
+    ## `flask init-db` creates or migrates the schema, e.g. with DB_INIT = "manual"
+    @app.cli.command("init-db")
+    def init_db():
+        applied = init_schema(db.get_engine(app), force=True)
+        if applied:
+            click.echo("Applied migrations %s" % ", ".join(map(str, applied)))
+        else:
+            click.echo("Schema is up to date")
+
+    ## `flask precompute` runs the rebuilds in the foreground, e.g. as its own
+    ## process filling a shared CACHE_BACKEND; --once runs a single pass
+    @app.cli.command("precompute")
+    @click.option("--once", is_flag=True)
+    def precompute(once):
+        precompute_worker.stop()
+        precompute_worker.app = app
+        if once:
+            precompute_worker.run_once()
+            if precompute_stats.errors:
+                raise click.ClickException("precompute pass failed")
+            click.echo(
+                "Rebuilt %d structures in %.3fs"
+                % (precompute_stats.swaps, precompute_stats.last_seconds)
+            )
+        else:
+            precompute_worker.run()
+
+    ## `flask export-bank PATH` writes the question bank file for offline mode
+    @app.cli.command("export-bank")
+    @click.argument("path")
+    def export_bank_command(path):
+        count = export_bank(path)
+        click.echo("Exported %d questions to %s" % (count, path))
+
+    register_error_handlers(app)
+
     return app
\ No newline at end of file
@@ -0,0 +1,204 @@
+import math
+import random
+import threading
+from array import array
+
+from models import db, on_primary, Question, on_question_change
+from .quiz import ALL_CATEGORIES
+
+DIFFICULTIES = (1, 2, 3, 4, 5)
+INITIAL_SKILL = 3.0
+SKILL_STEP = 0.8
+RECENT_ANSWERS = 10
+MAX_PICK_TRIES = 16
+
+
+def skill_estimate(answers):
+    """
+    Running estimate of a player's skill on the difficulty scale from their
+    last RECENT_ANSWERS answers ({"difficulty": d, "correct": bool}): each
+    answer moves the estimate by how surprising it was (a Rasch/Elo step).
+    """
+    skill = INITIAL_SKILL
+    for answer in answers[-RECENT_ANSWERS:]:
+        difficulty = float(answer["difficulty"])
+        expected = 1 / (1 + math.exp(difficulty - skill))
+        skill += SKILL_STEP * (bool(answer["correct"]) - expected)
+    return min(max(skill, DIFFICULTIES[0]), DIFFICULTIES[-1])
+
+
+def difficulty_order(skill):
+    """Difficulties from the one closest to skill outwards."""
+    target = min(max(round(skill), DIFFICULTIES[0]), DIFFICULTIES[-1])
+    return sorted(
+        DIFFICULTIES, key=lambda difficulty: (abs(difficulty - target), -difficulty)
+    )
+
+
+class Bucket:
+    """Unordered question ids with their positions: O(1) add, remove and pick."""
+
+    __slots__ = ("ids", "positions")
+
+    def __init__(self):
+        self.ids = array("i")
+        self.positions = {}
+
+    def add(self, question_id):
+        if question_id not in self.positions:
+            self.positions[question_id] = len(self.ids)
+            self.ids.append(question_id)
+
+    def remove(self, question_id):
+        position = self.positions.pop(question_id, None)
+        if position is None:
+            return
+        # swap-remove: the last id takes the freed position
+        last = self.ids.pop()
+        if last != question_id:
+            self.ids[position] = last
+            self.positions[last] = position
+
+    def pick(self, previous):
+        """Random id not in previous (a set), or None."""
+        size = len(self.ids)
+        if size == 0:
+            return None
+
+        for _ in range(MAX_PICK_TRIES):
+            question_id = self.ids[random.randrange(size)]
+            if question_id not in previous:
+                return question_id
+
+        # nearly every id has been played; pick from what is left
+        left = [question_id for question_id in self.ids if question_id not in previous]
+        return random.choice(left) if left else None
+
+
+## Adaptive quiz engine: per-(category, difficulty) buckets kept in memory
+class AdaptiveQuiz:
+    """
+    Question ids bucketed by (category, difficulty), with every question also
+    in its (ALL_CATEGORIES, difficulty) bucket.
+
+    Buckets are loaded once with a column-only query and patched by the
+    Question change listeners; the precompute worker swaps in rebuilt ones
+    with build() and install(). pick() tries the bucket closest to the
+    player's skill estimate first and widens one difficulty at a time, so a
+    turn looks at no more than len(DIFFICULTIES) buckets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = None
+        self._where = None
+        self.changes = 0
+
+    @staticmethod
+    def _key(category):
+        try:
+            return int(category)
+        except (TypeError, ValueError):
+            return None
+
+    def reset(self):
+        with self._lock:
+            self._buckets = None
+            self._where = None
+
+    @staticmethod
+    def _place(buckets, where, question_id, category, difficulty):
+        where[question_id] = (category, difficulty)
+        for key in ((category, difficulty), (ALL_CATEGORIES, difficulty)):
+            buckets.setdefault(key, Bucket()).add(question_id)
+
+    def _add(self, question_id, category, difficulty):
+        # callers hold self._lock
+        self._place(self._buckets, self._where, question_id, category, difficulty)
+
+    def _remove(self, question_id):
+        # callers hold self._lock
+        location = self._where.pop(question_id, None)
+        if location is None:
+            return
+        category, difficulty = location
+        for key in ((category, difficulty), (ALL_CATEGORIES, difficulty)):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.remove(question_id)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Buckets from (id, category, difficulty) rows."""
+        buckets, where = {}, {}
+        for question_id, category, difficulty in rows:
+            cls._place(buckets, where, question_id, cls._key(category), difficulty)
+        return buckets, where
+
+    def build(self):
+        """Buckets read from the database, without taking the lock."""
+        with on_primary():
+            return self.from_rows(
+                db.session.query(Question.id, Question.category, Question.difficulty)
+            )
+
+    def generation(self):
+        """Token for install(): how many changes have been applied."""
+        return self.changes
+
+    def install(self, built, generation):
+        """Swap in build()'s buckets unless a change was applied meanwhile."""
+        with self._lock:
+            if self.changes != generation:
+                return False
+            self._buckets, self._where = built
+            return True
+
+    def loaded(self):
+        return self._buckets is not None
+
+    def _load(self):
+        # callers hold self._lock
+        if self._buckets is None:
+            self._buckets, self._where = self.build()
+        return self._buckets
+
+    def pick(self, category, previous, skill):
+        """Id of a question in category, not in previous (a set), near skill."""
+        with self._lock:
+            buckets = self._load()
+            for difficulty in difficulty_order(skill):
+                bucket = buckets.get((category, difficulty))
+                if bucket is not None:
+                    question_id = bucket.pick(previous)
+                    if question_id is not None:
+                        return question_id
+            return None
+
+    def discard(self, question_id):
+        with self._lock:
+            self.changes += 1
+            if self._buckets is not None:
+                self._remove(question_id)
+
+    def on_change(self, action, question):
+        if action == "delete":
+            self.discard(question.id)
+            return
+
+        with self._lock:
+            self.changes += 1
+            if self._buckets is None:
+                return
+            if action == "insert":
+                self._add(
+                    question.id, self._key(question.category), question.difficulty
+                )
+            else:
+                # an update can move a question between buckets; reload
+                self._buckets = None
+                self._where = None
+
+
+adaptive_quiz = AdaptiveQuiz()
+on_question_change(adaptive_quiz.on_change)
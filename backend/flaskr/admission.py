@@ -0,0 +1,189 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, request
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+from .metrics import request_metrics
+
+# (tokens per second, burst)
+CLIENT_RATE_LIMIT = (20, 40)
+ENDPOINT_RATE_LIMITS = {
+    "create_question": (200, 400),
+    "search_questions_prefix": (400, 800),
+    "fetch_quizzes_list": (400, 800),
+}
+# requests in flight per process
+CONCURRENCY_LIMITS = {
+    "create_question": 8,
+    "search_questions_prefix": 8,
+    "fetch_quizzes_list": 16,
+}
+MAX_BUCKETS = 100000
+SATURATED_RETRY_AFTER = 1
+
+
+## Token buckets: take(key, rate, burst) -> 0 when admitted, else seconds to wait
+class LocalBuckets:
+    """
+    In-process token buckets, the default backend. Keys are kept in LRU
+    order and the least recently used one is dropped past max_buckets, so a
+    flood of distinct clients cannot grow memory without bound.
+    """
+
+    def __init__(self, max_buckets=MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens')) or burst
+local updated_at = tonumber(redis.call('HGET', KEYS[1], 'updated_at')) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """
+    Token buckets shared by every process, kept in Redis and updated
+    atomically by a Lua script. `client` is anything with redis-py's
+    eval(script, numkeys, *keys_and_args). LocalBuckets has the same take()
+    and stands in for it in tests and single-process deployments.
+    """
+
+    def __init__(self, client, prefix="trivia:bucket:"):
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key, rate, burst):
+        wait = self.client.eval(TOKEN_BUCKET_SCRIPT, 1, self.prefix + key, rate, burst)
+        return float(wait)
+
+
+class ConcurrencyLimiter:
+    """At most `limit` requests in flight; the next one is refused, not queued."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit) if limit > 0 else None
+
+    def try_acquire(self):
+        return self._slots is not None and self._slots.acquire(blocking=False)
+
+    def release(self):
+        self._slots.release()
+
+
+class AdmissionStats:
+    def __init__(self):
+        self.rate_limited = 0
+        self.saturated = 0
+
+    def reset(self):
+        self.rate_limited = 0
+        self.saturated = 0
+
+
+admission_stats = AdmissionStats()
+
+
+## Admission control: shed load with 429/503 before any database work
+def init_admission(app):
+    """
+    Opt-in (ADMISSION_ENABLED). Every request takes a token from its
+    client's bucket (CLIENT_RATE_LIMIT) and from its endpoint's bucket
+    (ENDPOINT_RATE_LIMITS) and is refused with 429 and Retry-After when
+    either is empty. Endpoints in CONCURRENCY_LIMITS then need a free slot
+    or get 503. ADMISSION_BACKEND swaps the in-process buckets for a shared
+    store such as RedisBuckets; ADMISSION_TRUST_PROXY identifies clients by
+    X-Forwarded-For instead of the peer address.
+    """
+    buckets = app.config.get("ADMISSION_BACKEND") or LocalBuckets()
+    client_limit = app.config.get("CLIENT_RATE_LIMIT", CLIENT_RATE_LIMIT)
+    endpoint_limits = app.config.get("ENDPOINT_RATE_LIMITS", ENDPOINT_RATE_LIMITS)
+    limiters = {
+        endpoint: ConcurrencyLimiter(limit)
+        for endpoint, limit in app.config.get(
+            "CONCURRENCY_LIMITS", CONCURRENCY_LIMITS
+        ).items()
+    }
+    trust_proxy = app.config.get("ADMISSION_TRUST_PROXY", False)
+    admission_stats.reset()
+
+    def client_id():
+        if trust_proxy and request.access_route:
+            return request.access_route[0]
+        return request.remote_addr or "unknown"
+
+    @app.before_request
+    def admit_request():
+        if request.method == "OPTIONS":
+            return None
+
+        wait = 0.0
+        if client_limit:
+            wait = buckets.take("client:" + client_id(), *client_limit)
+        endpoint_limit = endpoint_limits.get(request.endpoint)
+        if not wait and endpoint_limit:
+            wait = buckets.take("endpoint:%s" % request.endpoint, *endpoint_limit)
+        if wait:
+            admission_stats.rate_limited += 1
+            raise TooManyRequests(retry_after=max(1, math.ceil(wait)))
+
+        limiter = limiters.get(request.endpoint)
+        if limiter is not None:
+            if not limiter.try_acquire():
+                admission_stats.saturated += 1
+                raise ServiceUnavailable(retry_after=SATURATED_RETRY_AFTER)
+            g.admission_slot = limiter
+        return None
+
+    @app.teardown_request
+    def release_admission_slot(error):
+        limiter = g.pop("admission_slot", None)
+        if limiter is not None:
+            limiter.release()
+
+
+def _admission_gauges():
+    return [
+        (
+            "trivia_admission_rate_limited",
+            "Requests refused with 429 by the token buckets.",
+            admission_stats.rate_limited,
+        ),
+        (
+            "trivia_admission_saturated",
+            "Requests refused with 503 by the concurrency limits.",
+            admission_stats.saturated,
+        ),
+    ]
+
+
+request_metrics.add_gauges(_admission_gauges)
@@ -0,0 +1,740 @@
+"""
+Async (ASGI) serving mode of the trivia API.
+
+create_asgi_app() serves the same routes and JSON contracts as create_app()
+on Starlette, with queries on SQLAlchemy's asyncio extension (asyncpg for
+Postgres, aiosqlite for SQLite) and one AsyncSession per request:
+
+    uvicorn --factory flaskr.asgi:create_asgi_app
+
+Requires the optional packages starlette, uvicorn and asyncpg/aiosqlite.
+The in-process caches of the WSGI app are not shared with this mode: the
+app keeps its own quiz pool, adaptive quiz buckets, quiz sessions and
+search index (see QuestionState).
+"""
+import functools
+import json
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from models import database_path, notify_question_change, pool_stats, Question, Category
+from .pagination import QUESTIONS_PER_PAGE
+from .serializers import QUESTION_COLUMNS, QUESTION_KEYS, question_fields, select_fields
+from .quiz import ALL_CATEGORIES, QuizPool
+from .adaptive import AdaptiveQuiz, skill_estimate
+from .quiz_sessions import QuizSessionStore
+from .search import (
+    InvertedIndexSearch,
+    SearchResultCache,
+    full_text_match,
+    page_bounds,
+    search_backend_name,
+    tokenize,
+)
+from .bulk import (
+    QuestionImport,
+    EXPORT_BATCH_SIZE,
+    IMPORT_BATCH_SIZE,
+    question_criteria,
+    question_values,
+)
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+ERROR_MESSAGES = {
+    400: "bad request",
+    404: "resource not found",
+    405: "method not allowed",
+    422: "unprocessable",
+}
+
+
+def async_database_url(path):
+    url = make_url(path)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """models.TimedQueuePool for the async engine: checkout waits for /metrics/pool."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.observe(time.perf_counter() - start)
+
+
+async def load(structure, session, *columns):
+    """
+    Load a QuizPool, AdaptiveQuiz or InvertedIndexSearch from an async
+    column-only query, once: its own build() would block the event loop on
+    the Flask-SQLAlchemy session. Retried when a change lands mid-query.
+    """
+    while not structure.loaded():
+        generation = structure.generation()
+        rows = await session.execute(select(*columns).order_by(Question.id))
+        structure.install(structure.from_rows(rows), generation)
+    return structure
+
+
+## Derived question state of one ASGI app
+class QuestionState:
+    """
+    The quiz pool, adaptive quiz buckets, quiz sessions and search index the
+    Flask app keeps per process, held per ASGI app. Each structure is loaded
+    on first use and patched after the app's own writes; bulk writes and
+    imports drop them for a reload. Postgres databases search with full-text
+    queries instead of the index.
+
+    Writes also reach the process-wide Question change listeners, so the
+    shared cache is invalidated for every worker and a Flask app in the same
+    process stays current. The write's own transaction bumps data_version.
+    """
+
+    def __init__(self, full_text):
+        self.quiz_pool = QuizPool()
+        self.adaptive_quiz = AdaptiveQuiz()
+        self.quiz_sessions = QuizSessionStore(pool=self.quiz_pool)
+        self.search_index = None if full_text else InvertedIndexSearch()
+        self.search_cache = SearchResultCache()
+
+    async def pool(self, session):
+        return await load(self.quiz_pool, session, Question.id, Question.category)
+
+    async def buckets(self, session):
+        return await load(
+            self.adaptive_quiz,
+            session,
+            Question.id,
+            Question.category,
+            Question.difficulty,
+        )
+
+    async def search(self, session, term, page=1, prefix=False):
+        """Page of questions matching term, and the number of matches."""
+        if page < 1:
+            return [], 0
+        start, end = page_bounds(page)
+
+        if self.search_index is None:
+            match, rank = full_text_match(term, prefix)
+            rows = await session.execute(
+                select(*QUESTION_COLUMNS)
+                .where(match)
+                .order_by(rank.desc(), Question.id)
+                .offset(start)
+                .limit(QUESTIONS_PER_PAGE)
+            )
+            current = [dict(zip(QUESTION_KEYS, row)) for row in rows]
+            return current, await count_questions(session, match)
+
+        index = await load(
+            self.search_index, session, Question.id, Question.question, Question.answer
+        )
+        ranked = index.rank(tokenize(term), prefix)
+        page_ids = ranked[start:end]
+        if not page_ids:
+            return [], len(ranked)
+
+        rows = await session.execute(
+            select(*QUESTION_COLUMNS).where(Question.id.in_(page_ids))
+        )
+        found = {row[0]: dict(zip(QUESTION_KEYS, row)) for row in rows}
+        return [found[id] for id in page_ids if id in found], len(ranked)
+
+    async def prefix_search(self, session, term, page=1):
+        key = (" ".join(tokenize(term)), page)
+        result = self.search_cache.get(key)
+        if result is None:
+            result = await self.search(session, term, page, prefix=True)
+            self.search_cache.put(key, result)
+        return result
+
+    def on_change(self, action, question=None):
+        self.quiz_pool.on_change(action, question)
+        self.adaptive_quiz.on_change(action, question)
+        if self.search_index is not None:
+            self.search_index.on_change(action, question)
+        self.search_cache.clear()
+        notify_question_change(action, question)
+
+
+## Bulk import over an AsyncSession and a streamed request body
+class AsyncQuestionImport(QuestionImport):
+    def __init__(self, session, batch_size=IMPORT_BATCH_SIZE):
+        super().__init__(batch_size)
+        self.session = session
+
+    async def _flush(self, batch):
+        if not batch:
+            return
+
+        table = Question.__table__
+        try:
+            await self.session.execute(table.insert(), [row for _, row in batch])
+            await self.session.commit()
+            self.imported += len(batch)
+            return
+        except SQLAlchemyError:
+            await self.session.rollback()
+
+        for line_number, row in batch:
+            try:
+                await self.session.execute(table.insert(), row)
+                await self.session.commit()
+                self.imported += 1
+            except SQLAlchemyError as error:
+                await self.session.rollback()
+                reason = getattr(error, "orig", None) or error
+                self._error(line_number, str(reason).strip())
+
+    async def run(self, lines):
+        batch = []
+        line_number = 0
+        async for line in lines:
+            line_number += 1
+            if self._parse(batch, line_number, line):
+                await self._flush(batch)
+                batch = []
+        await self._flush(batch)
+        return self
+
+
+async def body_lines(request):
+    """Lines of the request body, as it streams in."""
+    pending = b""
+    async for chunk in request.stream():
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+def with_session(handler):
+    """Open an AsyncSession for the request and pass it to the handler."""
+
+    @functools.wraps(handler)
+    async def endpoint(request):
+        async with AsyncSession(
+            request.app.state.engine, expire_on_commit=False
+        ) as session:
+            return await handler(request, session)
+
+    return endpoint
+
+
+def int_param(request, name, default=None):
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def page_number(request):
+    return int_param(request, "page", 1)
+
+
+def fields_param(request):
+    """?fields= as question keys, None when absent; 400 on unknown keys."""
+    if "fields" not in request.query_params:
+        return None
+    try:
+        return question_fields(request.query_params["fields"])
+    except ValueError:
+        raise HTTPException(400)
+
+
+def refresh(request):
+    value = request.query_params.get("refresh", "true")
+    return value.lower() not in ("false", "0", "no")
+
+
+async def question_page(session, request, *criteria):
+    """One page of questions, by ?page= or keyset ?after_id=, trimmed to ?fields=."""
+    keys = fields_param(request) or QUESTION_KEYS
+    columns = [column for column in QUESTION_COLUMNS if column.key in keys]
+    selection = select(*columns).where(*criteria).order_by(Question.id)
+
+    after_id = int_param(request, "after_id")
+    if after_id is not None:
+        selection = selection.where(Question.id > after_id)
+    else:
+        page = page_number(request)
+        if page < 1:
+            return []
+        selection = selection.offset((page - 1) * QUESTIONS_PER_PAGE)
+
+    rows = await session.execute(selection.limit(QUESTIONS_PER_PAGE))
+    return [dict(zip(keys, row)) for row in rows]
+
+
+async def question_by_id(session, question_id):
+    row = (
+        await session.execute(
+            select(*QUESTION_COLUMNS).where(Question.id == question_id)
+        )
+    ).first()
+    return None if row is None else dict(zip(QUESTION_KEYS, row))
+
+
+async def count_questions(session, *criteria):
+    return await session.scalar(select(func.count(Question.id)).where(*criteria))
+
+
+async def category_types(session):
+    selection = select(Category.id, Category.type).order_by(Category.id)
+    rows = await session.execute(selection)
+    return {id: type for id, type in rows}
+
+
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(400)
+    if not isinstance(body, dict):
+        raise HTTPException(400)
+    return body
+
+
+async def read_json_or_empty(request):
+    # Flask's get_json(silent=True) or {}
+    try:
+        body = await request.json()
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+
+## Endpoints, mirroring flaskr.create_app
+
+@with_session
+async def available_categories_type(request, session):
+    categories = await category_types(session)
+
+    if len(categories) == 0:
+        raise HTTPException(404)
+
+    return JSONResponse(
+        {
+            "success": True,
+            "categories": {str(id): type for id, type in categories.items()},
+            "total_categories": len(categories),
+        }
+    )
+
+
+@with_session
+async def available_questions(request, session):
+    current_questions = await question_page(session, request)
+
+    if len(current_questions) == 0:
+        raise HTTPException(422)
+
+    categories = await category_types(session)
+    return JSONResponse(
+        {
+            "success": True,
+            "list_of_questions": current_questions,
+            "total_questions": await count_questions(session),
+            "current_category": [],
+            "categories": list(categories.values()),
+        }
+    )
+
+
+@with_session
+async def delete_question(request, session):
+    question_id = request.path_params["question_id"]
+
+    question = await question_by_id(session, question_id)
+    if question is None:
+        raise HTTPException(422)
+    await session.execute(delete(Question).where(Question.id == question_id))
+    await session.commit()
+    request.app.state.questions.on_change("delete", SimpleNamespace(**question))
+
+    result = {
+        "success": True,
+        "deleted": question_id,
+        "total_questions": await count_questions(session),
+    }
+    if refresh(request):
+        result["questions"] = await question_page(session, request)
+    return JSONResponse(result)
+
+
+@with_session
+async def create_question(request, session):
+    body = await read_json(request)
+    search = body.get("searchTerm", None)
+
+    if search:
+        current_questions, total_questions = await request.app.state.questions.search(
+            session, search, page_number(request)
+        )
+        return JSONResponse(
+            {
+                "success": True,
+                "questions": select_fields(current_questions, fields_param(request)),
+                "total_questions": total_questions,
+                "current_category": {
+                    str(id): type
+                    for id, type in (await category_types(session)).items()
+                },
+            }
+        )
+
+    values = {field: body.get(field) for field in QUESTION_KEYS if field != "id"}
+    if values["question"] is None or values["answer"] is None:
+        raise HTTPException(422)
+
+    try:
+        values = {
+            "question": str(values["question"]),
+            "answer": str(values["answer"]),
+            "category": int(values["category"]),
+            "difficulty": int(values["difficulty"]),
+        }
+        result = await session.execute(insert(Question).values(**values))
+        await session.commit()
+    except Exception:
+        raise HTTPException(422)
+
+    question_id = result.inserted_primary_key[0]
+    request.app.state.questions.on_change(
+        "insert", SimpleNamespace(id=question_id, **values)
+    )
+
+    result = {
+        "success": True,
+        "created": question_id,
+        "question_created": values["question"],
+        "total_questions": await count_questions(session),
+    }
+    if refresh(request):
+        result["questions"] = await question_page(session, request)
+    return JSONResponse(result)
+
+
+@with_session
+async def search_questions_prefix(request, session):
+    term = request.query_params.get("q", "")
+
+    if not tokenize(term):
+        raise HTTPException(400)
+
+    fields = fields_param(request)
+    current_questions, total_questions = await request.app.state.questions.prefix_search(
+        session, term, page_number(request)
+    )
+
+    return JSONResponse(
+        {
+            "success": True,
+            "questions": select_fields(current_questions, fields),
+            "total_questions": total_questions,
+            "current_category": {
+                str(id): type for id, type in (await category_types(session)).items()
+            },
+        }
+    )
+
+
+@with_session
+async def import_questions(request, session):
+    batch_size = request.app.state.config.get("IMPORT_BATCH_SIZE", IMPORT_BATCH_SIZE)
+    job = await AsyncQuestionImport(session, batch_size).run(body_lines(request))
+
+    if job.imported == 0 and job.failed == 0:
+        raise HTTPException(400)
+    if job.imported:
+        # rows were inserted in batches; derived state is reloaded
+        request.app.state.questions.on_change("reset")
+
+    return JSONResponse(
+        {
+            "success": True,
+            "imported": job.imported,
+            "failed": job.failed,
+            "errors": job.errors,
+        }
+    )
+
+
+async def export_question_list(request):
+    engine = request.app.state.engine
+
+    async def lines():
+        # the stream outlives the handler: it holds its own connection
+        async with engine.connect() as connection:
+            result = await connection.stream(
+                select(*QUESTION_COLUMNS).order_by(Question.id)
+            )
+            async for rows in result.partitions(EXPORT_BATCH_SIZE):
+                yield "".join(json.dumps(row._asdict()) + "\n" for row in rows)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def bulk_write(request, session, statement):
+    """Run a bulk DELETE/UPDATE, returning its row count; 422 on failure."""
+    try:
+        result = await session.execute(
+            statement.execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    except Exception:
+        raise HTTPException(422)
+
+    if result.rowcount:
+        request.app.state.questions.on_change("reset")
+    return result.rowcount
+
+
+@with_session
+async def delete_questions(request, session):
+    body = await read_json_or_empty(request)
+
+    try:
+        criteria = question_criteria(body)
+    except (ValueError, TypeError):
+        raise HTTPException(400)
+
+    deleted = await bulk_write(request, session, delete(Question).where(criteria))
+    return JSONResponse({"success": True, "deleted": deleted})
+
+
+@with_session
+async def update_questions(request, session):
+    body = await read_json_or_empty(request)
+
+    try:
+        criteria = question_criteria(body)
+    except (ValueError, TypeError):
+        raise HTTPException(400)
+
+    try:
+        values = question_values(body.get("set"))
+    except ValueError:
+        raise HTTPException(400)
+    except TypeError:
+        raise HTTPException(422)
+
+    updated = await bulk_write(
+        request, session, update(Question).where(criteria).values(**values)
+    )
+    return JSONResponse({"success": True, "updated": updated})
+
+
+@with_session
+async def category_question_list(request, session):
+    c_id = request.path_params["category_id"] + 1
+    categories = await category_types(session)
+
+    if c_id not in categories:
+        raise HTTPException(400)
+
+    criteria = Question.category == c_id
+    return JSONResponse(
+        {
+            "success": True,
+            "questions": await question_page(session, request, criteria),
+            "total_questions": await count_questions(session),
+            "categories": list(categories.values()),
+            "current_category": categories[c_id],
+        }
+    )
+
+
+@with_session
+async def fetch_quizzes_list(request, session):
+    body = await read_json(request)
+    state = request.app.state.questions
+    answers = body.get("answers", None)
+
+    try:
+        previous = set(body["previous_questions"])
+        category = int(body["quiz_category"]["id"])
+        skill = skill_estimate(answers) if answers is not None else None
+    except Exception:
+        raise HTTPException(404)
+
+    if category != ALL_CATEGORIES and category not in await category_types(session):
+        raise HTTPException(404)
+
+    async def pick():
+        # reloaded here if a write dropped the structure during an await
+        if answers is not None:
+            return (await state.buckets(session)).pick(category, previous, skill)
+        return (await state.pool(session)).sample(category, previous)
+
+    # randomize the question from the in-memory pool, fetch it by id
+    next_question = None
+    question_id = await pick()
+    while question_id is not None:
+        next_question = await question_by_id(session, question_id)
+        if next_question is not None:
+            break
+        # removed by another process since the pool was loaded
+        state.quiz_pool.discard(question_id)
+        state.adaptive_quiz.discard(question_id)
+        question_id = await pick()
+
+    result = {
+        "success": True,
+        "question": next_question,
+        "total_questions": (await state.pool(session)).remaining(category, previous),
+    }
+    if answers is not None:
+        result["skill"] = round(skill, 2)
+    return JSONResponse(result)
+
+
+@with_session
+async def start_quiz_session(request, session):
+    body = await read_json(request)
+    state = request.app.state.questions
+
+    try:
+        category = int(body["quiz_category"]["id"])
+    except Exception:
+        raise HTTPException(400)
+
+    if category != ALL_CATEGORIES and category not in await category_types(session):
+        raise HTTPException(404)
+
+    await state.pool(session)
+    quiz = state.quiz_sessions.start(category)
+
+    return JSONResponse(
+        {
+            "success": True,
+            "session_id": quiz.id,
+            "total_questions": state.quiz_sessions.remaining(quiz),
+            "expires_in": state.quiz_sessions.ttl,
+        }
+    )
+
+
+@with_session
+async def next_quiz_question(request, session):
+    quiz_sessions = request.app.state.questions.quiz_sessions
+    quiz = quiz_sessions.get(request.path_params["session_id"])
+
+    if quiz is None:
+        raise HTTPException(404)
+
+    next_question = None
+
+    # skip ids deleted since the session started
+    question_id = quiz_sessions.next_id(quiz)
+    while question_id is not None:
+        next_question = await question_by_id(session, question_id)
+        if next_question is not None:
+            break
+        question_id = quiz_sessions.next_id(quiz)
+
+    return JSONResponse(
+        {
+            "success": True,
+            "question": next_question,
+            "total_questions": quiz_sessions.remaining(quiz),
+        }
+    )
+
+
+async def end_quiz_session(request):
+    session_id = request.path_params["session_id"]
+
+    if not request.app.state.questions.quiz_sessions.end(session_id):
+        raise HTTPException(404)
+
+    return JSONResponse({"success": True, "ended": session_id})
+
+
+async def pool_metrics(request):
+    return JSONResponse(
+        {
+            "success": True,
+            "checkout": pool_stats.snapshot(),
+            "status": request.app.state.engine.pool.status(),
+        }
+    )
+
+
+async def http_error(request, exc):
+    message = ERROR_MESSAGES.get(exc.status_code, exc.detail)
+    return JSONResponse(
+        {"success": False, "error": exc.status_code, "message": message},
+        status_code=exc.status_code,
+    )
+
+
+def create_asgi_app(test_config=None):
+    config = dict(test_config or {})
+    config.setdefault("SQLALCHEMY_DATABASE_URI", database_path)
+    url = async_database_url(config["SQLALCHEMY_DATABASE_URI"])
+
+    options = {}
+    if url.get_backend_name() != "sqlite" or url.database:
+        # timed checkouts for /metrics/pool; aiosqlite file databases would
+        # otherwise default to NullPool, a new connection (and thread) per
+        # request
+        options["poolclass"] = TimedAsyncQueuePool
+    options.update(config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+    engine = create_async_engine(url, **options)
+
+    routes = [
+        Route("/categories", available_categories_type),
+        Route("/questions", available_questions, methods=["GET"]),
+        Route("/questions", create_question, methods=["POST"]),
+        Route("/questions", delete_questions, methods=["DELETE"]),
+        Route("/questions", update_questions, methods=["PATCH"]),
+        Route("/questions/{question_id:int}", delete_question, methods=["DELETE"]),
+        Route("/questions/search", search_questions_prefix),
+        Route("/questions/import", import_questions, methods=["POST"]),
+        Route("/questions/export", export_question_list),
+        Route("/categories/{category_id:int}/questions", category_question_list),
+        Route("/quizzes", fetch_quizzes_list, methods=["POST"]),
+        Route("/quizzes/sessions", start_quiz_session, methods=["POST"]),
+        Route(
+            "/quizzes/sessions/{session_id}/next", next_quiz_question, methods=["POST"]
+        ),
+        Route("/quizzes/sessions/{session_id}", end_quiz_session, methods=["DELETE"]),
+    ]
+    if config.get("METRICS_ENABLED", False):
+        routes.append(Route("/metrics/pool", pool_metrics))
+    middleware = [
+        Middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_headers=["Content-Type", "Authorization"],
+            allow_methods=["GET", "PUT", "POST", "PATCH", "DELETE", "OPTIONS"],
+        )
+    ]
+
+    app = Starlette(
+        routes=routes,
+        middleware=middleware,
+        exception_handlers={HTTPException: http_error},
+        on_shutdown=[engine.dispose],
+    )
+    app.state.config = config
+    app.state.engine = engine
+    app.state.questions = QuestionState(search_backend_name(config) == "postgres")
+    return app
@@ -0,0 +1,261 @@
+import bisect
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+
+from models import db, Question, Category
+from .quiz import ALL_CATEGORIES, MAX_SAMPLE_TRIES
+from .serializers import QUESTION_COLUMNS
+
+MAGIC = b"TRIVBANK"
+FORMAT_VERSION = 1
+# (name, array typecode); each section starts on an 8-byte boundary
+SECTIONS = (
+    ("ids", "i"),
+    ("categories", "i"),
+    ("difficulties", "i"),
+    ("nulls", "B"),
+    ("question_offsets", "I"),
+    ("question_text", "B"),
+    ("answer_offsets", "I"),
+    ("answer_text", "B"),
+    ("category_ids", "i"),
+    ("type_offsets", "I"),
+    ("type_text", "B"),
+    ("category_index", "I"),
+    ("category_positions", "i"),
+)
+HEADER = struct.Struct("<8sIIII" + "QQ" * len(SECTIONS))
+
+# nulls: one byte of flags per question
+NULL_QUESTION = 1
+NULL_ANSWER = 2
+NULL_CATEGORY = 4
+NULL_DIFFICULTY = 8
+
+
+class StringTable:
+    """UTF-8 strings end to end, with n + 1 offsets delimiting them."""
+
+    def __init__(self):
+        self.offsets = array("I", [0])
+        self.text = bytearray()
+
+    def append(self, value):
+        self.text += (value or "").encode()
+        self.offsets.append(len(self.text))
+
+
+def _padding(length):
+    return -length % 8
+
+
+## Exporter: questions and categories as a columnar, offset-indexed file
+def export_bank(path):
+    """
+    Write every question and category to path and return the number of
+    questions. Column-only queries, in id order; the file is written next
+    to path and renamed over it, so readers never see half a bank.
+    Needs an app context.
+    """
+    ids, categories, difficulties = array("i"), array("i"), array("i")
+    nulls = bytearray()
+    questions, answers, types = StringTable(), StringTable(), StringTable()
+    category_ids = array("i")
+    by_category = {}
+
+    for row in db.session.query(Category.id, Category.type).order_by(Category.id):
+        category_ids.append(row[0])
+        types.append(row[1])
+        by_category[row[0]] = array("i")
+
+    rows = db.session.query(*QUESTION_COLUMNS).order_by(Question.id)
+    for position, (id, question, answer, category, difficulty) in enumerate(rows):
+        flags = 0
+        flags |= NULL_QUESTION if question is None else 0
+        flags |= NULL_ANSWER if answer is None else 0
+        flags |= NULL_CATEGORY if category is None else 0
+        flags |= NULL_DIFFICULTY if difficulty is None else 0
+        ids.append(id)
+        categories.append(category or 0)
+        difficulties.append(difficulty or 0)
+        nulls.append(flags)
+        questions.append(question)
+        answers.append(answer)
+        if category in by_category:
+            by_category[category].append(position)
+
+    category_index = array("I", [0])
+    category_positions = array("i")
+    for category in category_ids:
+        category_positions.extend(by_category[category])
+        category_index.append(len(category_positions))
+
+    sections = {
+        "ids": ids,
+        "categories": categories,
+        "difficulties": difficulties,
+        "nulls": nulls,
+        "question_offsets": questions.offsets,
+        "question_text": questions.text,
+        "answer_offsets": answers.offsets,
+        "answer_text": answers.text,
+        "category_ids": category_ids,
+        "type_offsets": types.offsets,
+        "type_text": types.text,
+        "category_index": category_index,
+        "category_positions": category_positions,
+    }
+
+    blobs, table = [], []
+    offset = HEADER.size + _padding(HEADER.size)
+    for name, _ in SECTIONS:
+        section = sections[name]
+        if isinstance(section, array) and sys.byteorder != "little":
+            section = array(section.typecode, section)
+            section.byteswap()
+        data = bytes(section)
+        blobs.append(data + bytes(_padding(len(data))))
+        table += [offset, len(data)]
+        offset += len(blobs[-1])
+
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, len(ids), len(category_ids), 0, *table
+    )
+    partial = "%s.%d.tmp" % (path, os.getpid())
+    with open(partial, "wb") as target:
+        target.write(header + bytes(_padding(len(header))))
+        for blob in blobs:
+            target.write(blob)
+    os.replace(partial, path)
+    return len(ids)
+
+
+## Read side: the bank file mapped into memory, columns read in place
+class QuestionBank:
+    """
+    Read-only view of a file written by export_bank(). The file is
+    memory-mapped and its columns are memoryviews into the mapping, so
+    opening it reads only the header and the category table, and every
+    process serving the same file shares its pages through the OS cache.
+    """
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise ValueError("question bank files are little-endian")
+        with open(path, "rb") as source:
+            self._map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+
+        fields = HEADER.unpack_from(self._map, 0)
+        magic, version, self.size, category_count, _ = fields[:5]
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("%s is not a version %d question bank" % (path, FORMAT_VERSION))
+        table = fields[5:]
+        for i, (name, typecode) in enumerate(SECTIONS):
+            offset, length = table[2 * i], table[2 * i + 1]
+            setattr(self, name, view[offset : offset + length].cast(typecode))
+
+        self.types = {
+            self.category_ids[i]: self._string(self.type_offsets, self.type_text, i)
+            for i in range(category_count)
+        }
+        self._rows = {id: i for i, id in enumerate(self.category_ids)}
+        self._by_difficulty = {}
+
+    @staticmethod
+    def _string(offsets, text, i):
+        return str(text[offsets[i] : offsets[i + 1]], "utf-8")
+
+    def question(self, position):
+        """The Question.format() dict of the question at position."""
+        flags = self.nulls[position]
+        return {
+            "id": self.ids[position],
+            "question": None
+            if flags & NULL_QUESTION
+            else self._string(self.question_offsets, self.question_text, position),
+            "answer": None
+            if flags & NULL_ANSWER
+            else self._string(self.answer_offsets, self.answer_text, position),
+            "category": None
+            if flags & NULL_CATEGORY
+            else self.categories[position],
+            "difficulty": None
+            if flags & NULL_DIFFICULTY
+            else self.difficulties[position],
+        }
+
+    def positions(self, category=ALL_CATEGORIES):
+        """Positions of the questions in category, in id order."""
+        if category == ALL_CATEGORIES:
+            return range(self.size)
+        row = self._rows.get(category)
+        if row is None:
+            return range(0)
+        return self.category_positions[
+            self.category_index[row] : self.category_index[row + 1]
+        ]
+
+    def position(self, question_id):
+        i = bisect.bisect_left(self.ids, question_id)
+        if i < self.size and self.ids[i] == question_id:
+            return i
+        return None
+
+    def after(self, positions, question_id):
+        """Index in positions of the first question with id > question_id."""
+        low, high = 0, len(positions)
+        while low < high:
+            middle = (low + high) // 2
+            if self.ids[positions[middle]] <= question_id:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def in_category(self, position, category):
+        return category == ALL_CATEGORIES or (
+            not self.nulls[position] & NULL_CATEGORY
+            and self.categories[position] == category
+        )
+
+    def with_difficulty(self, category, difficulty):
+        """Positions in category at difficulty; built on first use."""
+        key = (category, difficulty)
+        positions = self._by_difficulty.get(key)
+        if positions is None:
+            positions = array(
+                "i",
+                (
+                    position
+                    for position in self.positions(category)
+                    if not self.nulls[position] & NULL_DIFFICULTY
+                    and self.difficulties[position] == difficulty
+                ),
+            )
+            self._by_difficulty[key] = positions
+        return positions
+
+    def sample(self, positions, previous):
+        """Random position whose id is not in previous, or None."""
+        if len(positions) == 0:
+            return None
+        for _ in range(MAX_SAMPLE_TRIES):
+            position = positions[random.randrange(len(positions))]
+            if self.ids[position] not in previous:
+                return position
+        left = [position for position in positions if self.ids[position] not in previous]
+        return random.choice(left) if left else None
+
+    def remaining(self, category, previous):
+        """Number of questions in category that are not in previous."""
+        used = 0
+        for question_id in previous:
+            position = self.position(question_id)
+            if position is not None and self.in_category(position, category):
+                used += 1
+        return len(self.positions(category)) - used
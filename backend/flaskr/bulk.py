@@ -0,0 +1,196 @@
+import json
+
+from sqlalchemy import and_, delete, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Question, notify_question_change
+
+IMPORT_BATCH_SIZE = 500
+EXPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+QUESTION_FIELDS = ("question", "answer", "category", "difficulty")
+QUESTION_TYPES = {"question": str, "answer": str, "category": int, "difficulty": int}
+
+
+def integer(value, field):
+    """
+    value as an int. JSON integers and strings of one are accepted; bools,
+    floats and anything else raise TypeError, and other strings ValueError.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise TypeError("%s must be an integer" % field)
+    return int(value)
+
+
+def parse_question_line(line):
+    """Validate one NDJSON line and return the row to insert."""
+    data = json.loads(line)
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+
+    missing = [field for field in QUESTION_FIELDS if data.get(field) in (None, "")]
+    if missing:
+        raise ValueError("missing " + ", ".join(missing))
+
+    return {
+        "question": str(data["question"]),
+        "answer": str(data["answer"]),
+        "category": integer(data["category"], "category"),
+        "difficulty": integer(data["difficulty"], "difficulty"),
+    }
+
+
+## Bulk import: parse NDJSON incrementally, insert in executemany batches
+class QuestionImport:
+    """
+    Inserts every valid line of an NDJSON stream, `batch_size` rows per
+    INSERT executemany and commit. When a batch is rejected by the database
+    it is rolled back and retried row by row, so only the offending lines
+    are reported.
+    """
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def _error(self, line_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "error": message})
+
+    def _flush(self, batch):
+        if not batch:
+            return
+
+        table = Question.__table__
+        try:
+            db.session.execute(table.insert(), [row for _, row in batch])
+            db.session.commit()
+            self.imported += len(batch)
+            return
+        except SQLAlchemyError:
+            db.session.rollback()
+
+        for line_number, row in batch:
+            try:
+                db.session.execute(table.insert(), row)
+                db.session.commit()
+                self.imported += 1
+            except SQLAlchemyError as error:
+                db.session.rollback()
+                reason = getattr(error, "orig", None) or error
+                self._error(line_number, str(reason).strip())
+
+    def _parse(self, batch, line_number, line):
+        """Add the row of one line to batch; True once the batch is full."""
+        if not line.strip():
+            return False
+        try:
+            batch.append((line_number, parse_question_line(line)))
+        except (ValueError, TypeError) as error:
+            self._error(line_number, str(error))
+        return len(batch) >= self.batch_size
+
+    def run(self, lines):
+        batch = []
+        for line_number, line in enumerate(lines, 1):
+            if self._parse(batch, line_number, line):
+                self._flush(batch)
+                batch = []
+        self._flush(batch)
+
+        if self.imported:
+            # rows were inserted behind the ORM; derived state is rebuilt
+            notify_question_change("reset")
+        return self
+
+
+## Bulk delete / update: one set-based statement in one transaction
+def question_criteria(body):
+    """
+    WHERE clause from the `ids`, `category` and `difficulty` keys of a bulk
+    request body, ANDed together. At least one is required so a malformed
+    request never touches the whole table. `ids` must be a list of JSON
+    integers; anything else raises TypeError.
+    """
+    clauses = []
+    ids = body.get("ids")
+    if ids is not None:
+        if not isinstance(ids, list) or not all(
+            isinstance(id, int) and not isinstance(id, bool) for id in ids
+        ):
+            raise TypeError("ids must be a list of integers")
+        clauses.append(Question.id.in_(ids))
+    if body.get("category") is not None:
+        clauses.append(Question.category == integer(body["category"], "category"))
+    if body.get("difficulty") is not None:
+        clauses.append(
+            Question.difficulty == integer(body["difficulty"], "difficulty")
+        )
+
+    if not clauses:
+        raise ValueError("no ids, category or difficulty given")
+    return and_(*clauses)
+
+
+def question_values(values):
+    """
+    The `set` of a bulk update. ValueError when it is empty or names an
+    unknown field, TypeError when a value is null or of the wrong JSON type
+    (ints are not strings, and neither takes a bool).
+    """
+    if not isinstance(values, dict) or not values:
+        raise ValueError("nothing to set")
+
+    unknown = set(values) - set(QUESTION_TYPES)
+    if unknown:
+        raise ValueError("unknown fields " + ", ".join(sorted(unknown)))
+
+    for field, value in values.items():
+        if isinstance(value, bool) or not isinstance(value, QUESTION_TYPES[field]):
+            raise TypeError(
+                "%s must be a %s" % (field, QUESTION_TYPES[field].__name__)
+            )
+    return dict(values)
+
+
+def _execute_bulk(statement):
+    try:
+        count = db.session.execute(
+            statement.execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+
+    if count:
+        notify_question_change("reset")
+    return count
+
+
+def bulk_delete(criteria):
+    return _execute_bulk(delete(Question).where(criteria))
+
+
+def bulk_update(criteria, values):
+    return _execute_bulk(update(Question).where(criteria).values(**values))
+
+
+## Streaming export: one NDJSON line per question, never the whole table
+def export_questions(batch_size=EXPORT_BATCH_SIZE):
+    rows = (
+        db.session.query(
+            Question.id,
+            Question.question,
+            Question.answer,
+            Question.category,
+            Question.difficulty,
+        )
+        .order_by(Question.id)
+        .yield_per(batch_size)
+    )
+    for row in rows:
+        yield json.dumps(row._asdict()) + "\n"
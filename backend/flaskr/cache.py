@@ -0,0 +1,752 @@
+import hashlib
+import json
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import settings
+from models import on_question_change
+from .metrics import request_metrics
+from .serializers import encode
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; MmapStore is unavailable there
+    fcntl = None
+
+CACHE_TTL = 300
+CACHE_LOCAL_ENTRIES = 4096
+CACHE_LOCAL_BYTES = 16 * 1024 * 1024
+# how long a worker trusts its copy of a namespace version when the store
+# broadcasts invalidations; a lost message is covered after this long
+CACHE_VERSION_TTL = 1.0
+# single-flight: how long a recomputation may hold its lease
+CACHE_LEASE_TTL = 5
+CACHE_LEASE_POLL = 0.005
+MMAP_SLOTS = 4096
+MMAP_SLOT_SIZE = 16 * 1024
+
+
+## Bounded LRU: the in-process tier, also behind the search result cache
+class LRUCache:
+    """
+    Evicts least recently used entries once more than `max_entries` are
+    held or their estimated size passes `max_bytes`. Subclasses override
+    _size() when put() is not given the size of a value.
+    """
+
+    def __init__(self, max_entries=CACHE_LOCAL_ENTRIES, max_bytes=CACHE_LOCAL_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    @staticmethod
+    def _size(value):
+        return 64
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        if size is None:
+            size = self._size(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def discard(self, predicate):
+        """Drop every entry whose key matches predicate."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def size(self):
+        with self._lock:
+            return self._bytes
+
+
+## Shared stores: get/set/add/delete/incr over bytes, seen by every worker
+class MmapStore:
+    """
+    A file of fixed-size slots mapped into every worker on one node (put it
+    on /dev/shm to keep it in memory). A key lives in the slot its hash
+    picks, overwriting whatever was there, so this is a cache, never a
+    store of record; values too big for a slot are not kept. Counters live
+    in their own table and are never evicted. Slots are guarded by fcntl
+    byte-range locks across processes and a lock within this one.
+    """
+
+    ENTRY = struct.Struct("<8sdHI")  # key digest, expires at, key and value lengths
+    COUNTERS = 256
+    COUNTER = struct.Struct("<q")
+
+    def __init__(self, path, slots=MMAP_SLOTS, slot_size=MMAP_SLOT_SIZE):
+        if fcntl is None:
+            raise RuntimeError("MmapStore needs fcntl")
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self._base = self.COUNTERS * self.COUNTER.size
+        self._lock = threading.Lock()
+
+        size = self._base + slots * slot_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.blake2b(key, digest_size=8).digest()
+
+    @contextmanager
+    def _locked(self, start, length, exclusive):
+        # fcntl locks are per process, so threads also take self._lock
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH, length, start)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+
+    def _slot(self, key):
+        key = key.encode()
+        digest = self._digest(key)
+        index = int.from_bytes(digest, "little") % self.slots
+        return key, digest, self._base + index * self.slot_size
+
+    def _read(self, key, digest, offset):
+        # callers hold the slot lock
+        entry_digest, expires_at, key_length, value_length = self.ENTRY.unpack_from(
+            self._map, offset
+        )
+        if entry_digest != digest or (expires_at and expires_at < time.time()):
+            return None
+        start = offset + self.ENTRY.size
+        if self._map[start : start + key_length] != key:
+            return None
+        start += key_length
+        return self._map[start : start + value_length]
+
+    def _write(self, key, digest, offset, value, ttl):
+        # callers hold the slot lock
+        expires_at = time.time() + ttl if ttl else 0.0
+        self.ENTRY.pack_into(self._map, offset, digest, expires_at, len(key), len(value))
+        start = offset + self.ENTRY.size
+        self._map[start : start + len(key)] = key
+        start += len(key)
+        self._map[start : start + len(value)] = value
+
+    def _fits(self, key, value):
+        return self.ENTRY.size + len(key) + len(value) <= self.slot_size
+
+    def get(self, key):
+        key, digest, offset = self._slot(key)
+        with self._locked(offset, self.slot_size, False):
+            return self._read(key, digest, offset)
+
+    def set(self, key, value, ttl=None):
+        key, digest, offset = self._slot(key)
+        if not self._fits(key, value):
+            return False
+        with self._locked(offset, self.slot_size, True):
+            self._write(key, digest, offset, value, ttl)
+        return True
+
+    def add(self, key, value, ttl=None):
+        """set() unless the key is already held; True when it was added."""
+        key, digest, offset = self._slot(key)
+        if not self._fits(key, value):
+            return False
+        with self._locked(offset, self.slot_size, True):
+            if self._read(key, digest, offset) is not None:
+                return False
+            self._write(key, digest, offset, value, ttl)
+        return True
+
+    def delete(self, key):
+        key, digest, offset = self._slot(key)
+        with self._locked(offset, self.slot_size, True):
+            if self._read(key, digest, offset) is not None:
+                self.ENTRY.pack_into(self._map, offset, bytes(8), 0.0, 0, 0)
+
+    def incr(self, key, amount=1):
+        # counters that share a hash share a value, which only ever means
+        # an extra invalidation for versions
+        digest = self._digest(key.encode())
+        offset = int.from_bytes(digest, "little") % self.COUNTERS * self.COUNTER.size
+        with self._locked(offset, self.COUNTER.size, bool(amount)):
+            (value,) = self.COUNTER.unpack_from(self._map, offset)
+            if amount:
+                value += amount
+                self.COUNTER.pack_into(self._map, offset, value)
+            return value
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class RespError(Exception):
+    pass
+
+
+def _command(*args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+def _reply(stream):
+    line = stream.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest
+    if kind == b"-":
+        raise RespError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        data = stream.read(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(rest)
+        return None if length < 0 else [_reply(stream) for _ in range(length)]
+    raise RespError("unexpected reply %r" % line)
+
+
+## Minimal Redis client speaking RESP, for the commands the app needs
+class RespClient:
+    """
+    One connection, shared under a lock and reopened after an error. It
+    offers the subset of redis-py the app uses (get, set, delete, incr,
+    publish, eval, pubsub), so redis.Redis or FakeRedis can replace it.
+    """
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None, timeout=5):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._socket = None
+        self._stream = None
+
+    @classmethod
+    def from_url(cls, url):
+        parts = urlsplit(url)
+        return cls(
+            parts.hostname or "localhost",
+            parts.port or 6379,
+            int(parts.path.strip("/") or 0),
+            parts.password,
+        )
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        stream = sock.makefile("rb")
+        for args in (("AUTH", self.password), ("SELECT", self.db)):
+            if args[1]:
+                sock.sendall(_command(*args))
+                _reply(stream)
+        return sock, stream
+
+    def execute(self, *args):
+        with self._lock:
+            if self._socket is None:
+                self._socket, self._stream = self.connect()
+            try:
+                self._socket.sendall(_command(*args))
+                return _reply(self._stream)
+            except (OSError, ConnectionError):
+                self._socket.close()
+                self._socket = self._stream = None
+                raise
+
+    def get(self, name):
+        return self.execute("GET", name)
+
+    def set(self, name, value, ex=None, nx=False):
+        args = ["SET", name, value]
+        if ex:
+            args += ["EX", int(ex)]
+        if nx:
+            args.append("NX")
+        return self.execute(*args) is not None
+
+    def delete(self, *names):
+        return self.execute("DEL", *names)
+
+    def incr(self, name, amount=1):
+        return self.execute("INCRBY", name, amount)
+
+    def publish(self, channel, message):
+        return self.execute("PUBLISH", channel, message)
+
+    def eval(self, script, numkeys, *keys_and_args):
+        return self.execute("EVAL", script, numkeys, *keys_and_args)
+
+    def pubsub(self):
+        return RespPubSub(self)
+
+
+class RespPubSub:
+    """redis-py style: subscribe(**{channel: handler}) then run_in_thread()."""
+
+    def __init__(self, client):
+        self.client = client
+        self.handlers = {}
+        self._running = False
+        self._socket = None
+
+    def subscribe(self, **handlers):
+        self.handlers.update(handlers)
+
+    def run_in_thread(self, sleep_time=1.0, daemon=True):
+        """Listen on a connection of its own; returns self, stop() ends it."""
+        self._running = True
+        threading.Thread(target=self._listen, args=(sleep_time,), daemon=daemon).start()
+        return self
+
+    def _listen(self, sleep_time):
+        while self._running:
+            try:
+                self._socket, stream = self.client.connect()
+                self._socket.settimeout(None)
+                self._socket.sendall(_command("SUBSCRIBE", *self.handlers))
+                while self._running:
+                    kind, channel, data = _reply(stream)
+                    handler = self.handlers.get(channel.decode())
+                    if kind == b"message" and handler is not None:
+                        handler({"type": "message", "channel": channel, "data": data})
+            except (OSError, ConnectionError, RespError, ValueError):
+                if self._running:
+                    time.sleep(sleep_time)
+
+    def stop(self):
+        self._running = False
+        if self._socket is not None:
+            self._socket.close()
+
+
+## In-process stand-in for a Redis server, for tests and single-process use
+class FakeRedis:
+    """
+    The RespClient subset on a dict. Messages are delivered to subscribers
+    synchronously inside publish(), so two caches sharing one FakeRedis
+    behave like two workers sharing a Redis server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+        self._subscribers = []
+
+    def _live(self, name):
+        # callers hold self._lock
+        entry = self._data.get(name)
+        if entry is not None and entry[1] and entry[1] < time.monotonic():
+            del self._data[name]
+            return None
+        return entry
+
+    def get(self, name):
+        with self._lock:
+            entry = self._live(name)
+            return None if entry is None else entry[0]
+
+    def set(self, name, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._live(name) is not None:
+                return False
+            if not isinstance(value, bytes):
+                value = str(value).encode()
+            self._data[name] = (value, time.monotonic() + ex if ex else 0)
+            return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            entry = self._live(name)
+            value = int(entry[0]) + amount if entry is not None else amount
+            self._data[name] = (str(value).encode(), entry[1] if entry else 0)
+            return value
+
+    def publish(self, channel, message):
+        if not isinstance(message, bytes):
+            message = str(message).encode()
+        with self._lock:
+            handlers = [
+                pubsub.handlers[channel]
+                for pubsub in self._subscribers
+                if channel in pubsub.handlers
+            ]
+        for handler in handlers:
+            handler({"type": "message", "channel": channel.encode(), "data": message})
+        return len(handlers)
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+
+class FakePubSub:
+    def __init__(self, server):
+        self.server = server
+        self.handlers = {}
+
+    def subscribe(self, **handlers):
+        self.handlers.update(handlers)
+        with self.server._lock:
+            if self not in self.server._subscribers:
+                self.server._subscribers.append(self)
+
+    def run_in_thread(self, sleep_time=1.0, daemon=True):
+        # delivery happens in publish(); nothing to run
+        return self
+
+    def stop(self):
+        with self.server._lock:
+            if self in self.server._subscribers:
+                self.server._subscribers.remove(self)
+
+
+class RedisStore:
+    """
+    Shared store on a Redis server through `client` (RespClient, redis.Redis
+    or FakeRedis). Unlike MmapStore it broadcasts invalidations: publish()
+    and subscribe() ride on a pub/sub channel.
+    """
+
+    def __init__(self, client, prefix="trivia:cache:"):
+        self.client = client
+        self.prefix = prefix
+        self.channel = prefix + "invalidate"
+        self._worker = None
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        return bool(self.client.set(self.prefix + key, value, ex=ttl))
+
+    def add(self, key, value, ttl=None):
+        return bool(self.client.set(self.prefix + key, value, ex=ttl, nx=True))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key, amount=1):
+        return int(self.client.incr(self.prefix + key, amount))
+
+    def publish(self, message):
+        self.client.publish(self.channel, message)
+
+    def subscribe(self, callback):
+        pubsub = self.client.pubsub()
+        pubsub.subscribe(**{self.channel: lambda message: callback(message["data"])})
+        self._worker = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def close(self):
+        if self._worker is not None:
+            self._worker.stop()
+            self._worker = None
+
+
+def open_store(url):
+    """Shared store for a CACHE_BACKEND url: mmap:///dev/shm/x or redis://host:port/db."""
+    parts = urlsplit(url)
+    if parts.scheme == "mmap":
+        return MmapStore(parts.path)
+    if parts.scheme in ("redis", "rediss"):
+        return RedisStore(RespClient.from_url(url))
+    raise ValueError("unknown cache backend %r" % url)
+
+
+class Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+## Tiered cache: local LRU in front of a shared store, with versioned keys
+class TieredCache:
+    """
+    Values live under "<namespace>:<version>:<key>", first in this worker's
+    LRU and then in the shared store. invalidate(namespace) bumps the
+    namespace version in the shared store, which orphans every older key in
+    every worker at once; stores that can broadcast (RedisStore) also tell
+    the other workers to drop their local copies right away.
+
+    Recomputation is single-flight: one thread per worker computes a missing
+    key while the others wait for it, and across workers the first to take
+    a lease in the shared store computes while the rest poll for its result.
+
+    Off by default; init_app() turns it on from CACHE_BACKEND, and callers
+    fall back to their in-process memoisation while it is off.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.shared = None
+        self.ttl = CACHE_TTL
+        self.local = LRUCache()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._version_ttl = float("inf")
+        self._flights = {}
+
+    def configure(self, backend=None, ttl=CACHE_TTL,
+                  local_entries=CACHE_LOCAL_ENTRIES, local_bytes=CACHE_LOCAL_BYTES):
+        """
+        backend is None (off), "memory" (local tier only), a url for
+        open_store() or a store object.
+        """
+        if isinstance(backend, str) and backend not in ("", "memory"):
+            backend = open_store(backend)
+        if self.shared is not None and self.shared is not backend:
+            close = getattr(self.shared, "close", None)
+            if close is not None:
+                close()
+
+        self.enabled = bool(backend)
+        self.shared = None if backend in (None, "", "memory") else backend
+        self.ttl = ttl
+        self.local = LRUCache(local_entries, local_bytes)
+        self.local_hits = self.shared_hits = self.misses = self.coalesced = 0
+        self._versions = {}
+        if self.shared is None:
+            self._version_ttl = float("inf")
+        elif hasattr(self.shared, "subscribe"):
+            self._version_ttl = CACHE_VERSION_TTL
+            self.shared.subscribe(self._on_message)
+        else:
+            # nothing is broadcast; read the version on every lookup
+            self._version_ttl = 0.0
+
+    def init_app(self, app):
+        self.configure(
+            app.config.get("CACHE_BACKEND", settings.CACHE_BACKEND),
+            app.config.get("CACHE_TTL", CACHE_TTL),
+            app.config.get("CACHE_LOCAL_ENTRIES", CACHE_LOCAL_ENTRIES),
+            app.config.get("CACHE_LOCAL_BYTES", CACHE_LOCAL_BYTES),
+        )
+
+    def version(self, namespace):
+        now = time.monotonic()
+        cached = self._versions.get(namespace)
+        if cached is not None and now - cached[1] < self._version_ttl:
+            return cached[0]
+        version = self.shared.incr("version:" + namespace, 0) if self.shared else 0
+        self._set_version(namespace, version, now)
+        return version
+
+    def _set_version(self, namespace, version, now=None):
+        with self._lock:
+            cached = self._versions.get(namespace)
+            if cached is not None and cached[0] > version:
+                return
+            self._versions[namespace] = (version, now or time.monotonic())
+        if cached is not None and cached[0] != version:
+            prefix, current = namespace + ":", "%s:%d:" % (namespace, version)
+            self.local.discard(
+                lambda key: key.startswith(prefix) and not key.startswith(current)
+            )
+
+    def _on_message(self, message):
+        namespace, _, version = message.decode().rpartition(":")
+        self._set_version(namespace, int(version))
+
+    def invalidate(self, *namespaces):
+        if not self.enabled:
+            return
+        for namespace in namespaces:
+            if self.shared is None:
+                version = self.version(namespace) + 1
+            else:
+                version = self.shared.incr("version:" + namespace)
+                if hasattr(self.shared, "publish"):
+                    self.shared.publish("%s:%d" % (namespace, version))
+            self._set_version(namespace, version)
+
+    def put(self, namespace, key, value, encode=encode, ttl=None, version=None):
+        """
+        Store value as if computed here, e.g. by the precompute worker. With
+        version it is stored under that namespace version, so a value built
+        before an invalidation is never read after it.
+        """
+        if not self.enabled:
+            return
+        ttl = ttl or self.ttl
+        if version is None:
+            version = self.version(namespace)
+        name = "%s:%d:%s" % (namespace, version, key)
+        data = encode(value)
+        if self.shared is not None:
+            self.shared.set(name, data, ttl)
+        self.local.put(name, (time.monotonic() + ttl, value), len(data))
+
+    def get_or_compute(self, namespace, key, compute, encode=encode,
+                       decode=json.loads, ttl=None):
+        """
+        Cached value of compute() for key in namespace. encode/decode turn
+        it into the bytes kept in the shared store; the local tier keeps
+        the decoded value.
+        """
+        if not self.enabled:
+            return compute()
+
+        name = "%s:%d:%s" % (namespace, self.version(namespace), key)
+        entry = self.local.get(name)
+        if entry is not None and entry[0] > time.monotonic():
+            self.local_hits += 1
+            return entry[1]
+
+        with self._lock:
+            flight = self._flights.get(name)
+            leader = flight is None
+            if leader:
+                flight = self._flights[name] = Flight()
+
+        if not leader:
+            self.coalesced += 1
+            if flight.done.wait(CACHE_LEASE_TTL) and flight.error is None:
+                return flight.value
+            # the leader failed or stalled: do the work here
+            return compute()
+
+        try:
+            flight.value = self._fill(name, compute, encode, decode, ttl or self.ttl)
+            return flight.value
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[name]
+            flight.done.set()
+
+    def _fill(self, name, compute, encode, decode, ttl):
+        lease = "lease:" + name
+        leased = False
+        if self.shared is not None:
+            data = self.shared.get(name)
+            if data is None:
+                leased = self.shared.add(lease, b"1", CACHE_LEASE_TTL)
+                if not leased:
+                    data = self._await(name)
+            if data is not None:
+                self.shared_hits += 1
+                value = decode(data)
+                self.local.put(name, (time.monotonic() + ttl, value), len(data))
+                return value
+
+        self.misses += 1
+        try:
+            value = compute()
+            data = encode(value)
+            if self.shared is not None:
+                self.shared.set(name, data, ttl)
+        finally:
+            if leased:
+                self.shared.delete(lease)
+        self.local.put(name, (time.monotonic() + ttl, value), len(data))
+        return value
+
+    def _await(self, name):
+        """Value another worker is computing under its lease, or None."""
+        deadline = time.monotonic() + CACHE_LEASE_TTL
+        while time.monotonic() < deadline:
+            time.sleep(CACHE_LEASE_POLL)
+            data = self.shared.get(name)
+            if data is not None:
+                return data
+            if self.shared.get("lease:" + name) is None:
+                return None
+        return None
+
+    def on_change(self, action, question):
+        # every committed question change can move totals and pages
+        self.invalidate("counts", "pages")
+
+
+shared_cache = TieredCache()
+on_question_change(shared_cache.on_change)
+
+
+def _shared_cache_gauges():
+    return [
+        (
+            "trivia_cache_local_hits",
+            "Cache lookups served by the worker's LRU.",
+            shared_cache.local_hits,
+        ),
+        (
+            "trivia_cache_shared_hits",
+            "Cache lookups served by the shared store.",
+            shared_cache.shared_hits,
+        ),
+        ("trivia_cache_misses", "Cached values recomputed.", shared_cache.misses),
+        (
+            "trivia_cache_coalesced",
+            "Lookups that waited on a recomputation in flight.",
+            shared_cache.coalesced,
+        ),
+        (
+            "trivia_cache_local_bytes",
+            "Bytes held by the worker's LRU.",
+            shared_cache.local.size(),
+        ),
+    ]
+
+
+request_metrics.add_gauges(_shared_cache_gauges)
@@ -0,0 +1,170 @@
+import json
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import on_primary, Category
+from .cache import shared_cache
+from .metrics import request_metrics
+
+CATEGORY_CACHE_TTL = 300
+
+
+## In-process categories cache (id -> type map and its JSON fragment)
+class CategoryCache:
+    """
+    Caches the categories table, which almost never changes.
+
+    Holds the id -> type map, the same map pre-serialised as a JSON object
+    and the list of types as a JSON array, refreshed after `ttl` seconds or on invalidate(). hits/misses
+    count how often the database was avoided. With the shared cache on the
+    table is kept there, under the "categories" namespace, instead. The
+    precompute worker reloads it with build() and install().
+    """
+
+    def __init__(self, ttl=CATEGORY_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._types = None
+        self._json = None
+        self._list_json = None
+        self._loaded_at = 0.0
+        self.changes = 0
+
+    @staticmethod
+    def _fragments(types):
+        return (
+            types,
+            json.dumps(
+                {str(id): type for id, type in types.items()}, separators=(",", ":")
+            ),
+            json.dumps(list(types.values()), separators=(",", ":")),
+        )
+
+    @staticmethod
+    def _encode(fragments):
+        return json.dumps(list(fragments[0].items())).encode()
+
+    def _decode(self, data):
+        return self._fragments(dict(json.loads(data)))
+
+    def _query(self):
+        self.misses += 1
+        with on_primary():
+            selection = Category.query.order_by(Category.id).all()
+        return {category.id: category.type for category in selection}
+
+    def build(self):
+        """The table and its fragments, read without taking the lock."""
+        return self._fragments(self._query())
+
+    def generation(self):
+        if shared_cache.enabled:
+            return shared_cache.version("categories")
+        return self.changes
+
+    def install(self, fragments, generation):
+        """Swap in build()'s fragments unless invalidated meanwhile."""
+        if shared_cache.enabled:
+            shared_cache.put(
+                "categories", "all", fragments, self._encode, self.ttl, generation
+            )
+            return True
+
+        with self._lock:
+            if self.changes != generation:
+                return False
+            self._types, self._json, self._list_json = fragments
+            self._loaded_at = time.monotonic()
+            return True
+
+    def _load(self):
+        if shared_cache.enabled:
+            return shared_cache.get_or_compute(
+                "categories",
+                "all",
+                self.build,
+                encode=self._encode,
+                decode=self._decode,
+                ttl=self.ttl,
+            )
+
+        with self._lock:
+            now = time.monotonic()
+            if self._types is not None and now - self._loaded_at < self.ttl:
+                self.hits += 1
+                return self._types, self._json, self._list_json
+
+            self._types, self._json, self._list_json = self.build()
+            self._loaded_at = now
+            return self._types, self._json, self._list_json
+
+    def fragments(self):
+        """
+        (id -> type map, its JSON object, the JSON array of types) from one
+        load, for requests that need more than one of them.
+        """
+        return self._load()
+
+    def types(self):
+        """id -> type map, shared between callers: do not mutate."""
+        return self._load()[0]
+
+    def type_list(self):
+        return list(self.types().values())
+
+    def json_fragment(self):
+        return self._load()[1]
+
+    def list_fragment(self):
+        return self._load()[2]
+
+    def invalidate(self):
+        with self._lock:
+            self.changes += 1
+            self._types = None
+            self._json = None
+            self._list_json = None
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+category_cache = CategoryCache()
+
+
+@event.listens_for(Category, "after_insert")
+@event.listens_for(Category, "after_update")
+@event.listens_for(Category, "after_delete")
+def _mark_categories_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["categories_changed"] = True
+
+
+## Both caches are cleared only once the change is committed, so no reader
+## can reload the categories from the old rows after the invalidation
+@event.listens_for(Session, "after_commit")
+def _invalidate_category_cache(session):
+    if session.info.pop("categories_changed", False):
+        category_cache.invalidate()
+        shared_cache.invalidate("categories")
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_category_changes(session):
+    session.info.pop("categories_changed", None)
+
+
+def _cache_gauges():
+    return [
+        ("trivia_category_cache_hits", "Category cache hits.", category_cache.hits),
+        ("trivia_category_cache_misses", "Category cache misses.", category_cache.misses),
+    ]
+
+
+request_metrics.add_gauges(_cache_gauges)
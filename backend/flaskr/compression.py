@@ -0,0 +1,72 @@
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only otherwise
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 6
+COMPRESS_MIMETYPES = ("application/json", "text/plain")
+
+
+def choose_encoding(accept_encodings):
+    """Best of br/gzip by the client's q-values, br winning ties."""
+    best, best_quality = None, 0
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding, level=COMPRESS_LEVEL):
+    if encoding == "br":
+        # brotli quality runs 0-11; scale the gzip-style 1-9 level
+        return brotli.compress(data, quality=min(11, round(level * 11 / 9)))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+## Negotiated response compression (Accept-Encoding: br, gzip)
+def init_compression(app):
+    """
+    Compresses JSON and text bodies of at least COMPRESS_MIN_SIZE bytes with
+    brotli (when installed) or gzip, whichever the client prefers.
+    Streamed responses (the NDJSON export) are left alone. COMPRESSION_ENABLED
+    = False turns it off, e.g. behind a proxy that already compresses.
+    """
+    min_size = app.config.get("COMPRESS_MIN_SIZE", COMPRESS_MIN_SIZE)
+    level = app.config.get("COMPRESS_LEVEL", COMPRESS_LEVEL)
+    mimetypes = frozenset(app.config.get("COMPRESS_MIMETYPES", COMPRESS_MIMETYPES))
+
+    @app.after_request
+    def compress_response(response):
+        if response.mimetype not in mimetypes:
+            return response
+        # the body depends on Accept-Encoding from here on, compressed or not
+        response.vary.add("Accept-Encoding")
+
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 304)
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        response.set_data(compress(data, encoding, level))
+        response.headers["Content-Encoding"] = encoding
+        return response
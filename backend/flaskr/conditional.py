@@ -0,0 +1,131 @@
+import threading
+import time
+
+from sqlalchemy import Column, Float, Integer, MetaData, Table, event, select, update
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Category, Question
+
+CONDITIONAL_ENDPOINTS = (
+    "available_categories_type",
+    "available_questions",
+    "category_question_list",
+)
+# seconds a worker trusts the version it last read from the database
+DATA_VERSION_TTL = 1.0
+
+# the one-row table created by migration 5 in migrations.py
+data_version_table = Table(
+    "data_version",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("version", Integer),
+    Column("modified_at", Float),
+)
+# tables whose writes change what the conditional endpoints return
+VERSIONED_TABLES = frozenset(("questions", "categories"))
+
+
+def bump_statement():
+    return (
+        update(data_version_table)
+        .where(data_version_table.c.id == 1)
+        .values(version=data_version_table.c.version + 1, modified_at=time.time())
+    )
+
+
+## Data version for conditional GETs (ETag / Last-Modified / 304)
+class DataVersion:
+    """
+    Counter in the data_version table, bumped by every transaction that
+    writes questions or categories, inside that transaction (see the
+    session hooks below), so every worker and process behind a load
+    balancer issues and accepts the same ETags, `W/"<version>-<ms>"`. The
+    modification time in the tag keeps a recreated database from confirming
+    tags of the old one.
+
+    A worker reads the row at most once per `ttl` seconds and at once after
+    its own bumps, so a change made through another worker can take up to
+    `ttl` seconds to reach its tags.
+    """
+
+    def __init__(self, ttl=DATA_VERSION_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.version = 0
+        self.modified_at = 0.0
+        self._read_at = None
+
+    def init_app(self, app):
+        self.ttl = app.config.get("DATA_VERSION_TTL", DATA_VERSION_TTL)
+        self._read_at = None
+
+    def forget(self):
+        """Read the row again on the next etag(): this process just bumped it."""
+        with self._lock:
+            self._read_at = None
+
+    def _refresh(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._read_at is not None and now - self._read_at < self.ttl:
+                return
+        # always the primary: a lagging replica would confirm stale tags
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                select(data_version_table.c.version, data_version_table.c.modified_at)
+                .where(data_version_table.c.id == 1)
+            ).one()
+        with self._lock:
+            self.version, self.modified_at = row
+            self._read_at = now
+
+    def etag(self):
+        self._refresh()
+        return "%d-%d" % (self.version, self.modified_at * 1000)
+
+
+data_version = DataVersion()
+
+
+## Sessions that write questions or categories bump the version in the same
+## transaction, just before it commits: no extra commit per write, and the
+## row lock is held only for the commit itself
+@event.listens_for(Question, "after_insert")
+@event.listens_for(Question, "after_update")
+@event.listens_for(Question, "after_delete")
+@event.listens_for(Category, "after_insert")
+@event.listens_for(Category, "after_update")
+@event.listens_for(Category, "after_delete")
+def _mark_data_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["data_changed"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_statement_changed(orm_execute_state):
+    # bulk DELETE/UPDATE and executemany INSERTs bypass the mapper events
+    if orm_execute_state.is_select:
+        return
+    table = getattr(orm_execute_state.statement, "table", None)
+    if getattr(table, "name", None) in VERSIONED_TABLES:
+        orm_execute_state.session.info["data_changed"] = True
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_in_transaction(session):
+    session.flush()
+    if session.info.get("data_changed"):
+        session.connection().execute(bump_statement())
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_data_version(session):
+    if session.info.pop("data_changed", False):
+        data_version.forget()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_data_changes(session):
+    session.info.pop("data_changed", None)
@@ -0,0 +1,115 @@
+import json
+import threading
+
+from sqlalchemy import func
+
+from models import db, on_primary, Question, on_question_change
+from .cache import shared_cache
+from .serializers import encode
+
+
+## Total-count service: SQL COUNT(*) once, then patched in memory
+class QuestionCounts:
+    """
+    Keeps question totals per category.
+
+    Counts are loaded lazily with a single GROUP BY COUNT(*) query and then
+    updated incrementally from the Question change listeners, so most
+    requests never hit the database to count rows. With the shared cache on
+    they are kept there instead, under the "counts" namespace, so every
+    worker sees the same totals. The precompute worker recounts with
+    build() and install().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_category = None
+        self.changes = 0
+
+    @staticmethod
+    def _key(category):
+        try:
+            return int(category)
+        except (TypeError, ValueError):
+            return None
+
+    def reset(self):
+        with self._lock:
+            self._by_category = None
+
+    @staticmethod
+    def _encode(counts):
+        return encode(list(counts.items()))
+
+    @staticmethod
+    def _decode(data):
+        return {c: n for c, n in json.loads(data)}
+
+    def build(self):
+        """Counts read from the database, without taking the lock."""
+        with on_primary():
+            rows = (
+                db.session.query(Question.category, func.count(Question.id))
+                .group_by(Question.category)
+                .all()
+            )
+        return {self._key(c): n for c, n in rows}
+
+    def generation(self):
+        if shared_cache.enabled:
+            return shared_cache.version("counts")
+        return self.changes
+
+    def install(self, by_category, generation):
+        """Swap in build()'s counts unless a change was applied meanwhile."""
+        if shared_cache.enabled:
+            shared_cache.put(
+                "counts", "per_category", by_category, self._encode, version=generation
+            )
+            return True
+
+        with self._lock:
+            if self.changes != generation:
+                return False
+            self._by_category = by_category
+            return True
+
+    def _per_category(self):
+        if shared_cache.enabled:
+            return shared_cache.get_or_compute(
+                "counts",
+                "per_category",
+                self.build,
+                encode=self._encode,
+                decode=self._decode,
+            )
+
+        with self._lock:
+            if self._by_category is None:
+                self._by_category = self.build()
+            return self._by_category
+
+    def total(self):
+        return sum(self._per_category().values())
+
+    def for_category(self, category):
+        return self._per_category().get(self._key(category), 0)
+
+    def on_change(self, action, question):
+        key = self._key(question.category) if question is not None else None
+
+        with self._lock:
+            self.changes += 1
+            if self._by_category is None:
+                return
+            if action == "insert":
+                self._by_category[key] = self._by_category.get(key, 0) + 1
+            elif action == "delete":
+                self._by_category[key] = max(self._by_category.get(key, 0) - 1, 0)
+            else:
+                # an update can move a question between categories; reload
+                self._by_category = None
+
+
+question_counts = QuestionCounts()
+on_question_change(question_counts.on_change)
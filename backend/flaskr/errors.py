@@ -0,0 +1,65 @@
+from flask import jsonify
+
+
+def register_error_handlers(app):
+    """JSON bodies for the error statuses, shared by both app factories."""
+    ### Error handlers: 404 error when user access page not existing
+
+    @app.errorhandler(404)
+    def file_absent(error):
+        return (
+            jsonify({"success": False, "error": 404, "message": "resource not found"}),
+            404,
+        )
+    ### 422 error when server understand content type but unable to process content instructions
+    @app.errorhandler(422)
+    def unprocessable_path(error):
+        return (
+            jsonify({"success": False, "error": 422, "message": "unprocessable"}),
+            422,
+        )
+
+    ### 400 error when server can't process request due to client error
+    @app.errorhandler(400)
+    def bad_request_log(error):
+        return jsonify({"success": False, "error": 400, "message": "bad request"}), 400
+
+    ### 405 error when target resource does not support the method
+    @app.errorhandler(405)
+    def file_absent(error):
+        return (
+            jsonify({"success": False, "error": 405, "message": "method not allowed"}),
+            405,
+        )
+
+    ### 429 error when a client or endpoint is over its rate limit
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        response = jsonify(
+            {"success": False, "error": 429, "message": "too many requests"}
+        )
+        response.status_code = 429
+        if error.retry_after is not None:
+            response.headers["Retry-After"] = str(error.retry_after)
+        return response
+
+    ### 503 error when an expensive endpoint is at its concurrency limit
+    @app.errorhandler(503)
+    def service_unavailable(error):
+        response = jsonify(
+            {"success": False, "error": 503, "message": "service unavailable"}
+        )
+        response.status_code = 503
+        if error.retry_after is not None:
+            response.headers["Retry-After"] = str(error.retry_after)
+        return response
+
+    ### 505 error where Http version in request is not supported by the server
+    @app.errorhandler(505)
+    def file_absent(error):
+        return (
+            jsonify(
+                {"success": False, "error": 505, "message": "Internal server error"}
+            ),
+            405,
+        )
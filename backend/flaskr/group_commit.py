@@ -0,0 +1,253 @@
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from models import db, notify_question_change
+from .metrics import Histogram, request_metrics
+
+GROUP_COMMIT_MAX_BATCH = 64
+# seconds the first queued row waits for company
+GROUP_COMMIT_MAX_DELAY = 0.005
+GROUP_COMMIT_QUEUE_DEPTH = 1024
+# seconds a request waits for its row to be committed
+GROUP_COMMIT_TIMEOUT = 10
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class GroupCommitStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.commit_seconds = Histogram()
+        self.rejected = 0
+        self.failed = 0
+
+
+group_commit_stats = GroupCommitStats()
+
+
+class WriterUnavailable(Exception):
+    """The writer is closed, or did not commit a row within its timeout."""
+
+
+## Group commit: concurrent inserts share one transaction
+class GroupCommitWriter:
+    """
+    Questions handed to insert() wait in a queue of at most max_queue rows.
+    A flusher thread takes the first one, gathers whatever else arrives
+    within max_delay seconds (up to max_batch rows) and commits them in one
+    transaction, so a burst of POSTs pays for one commit instead of one
+    each, data version bump included. insert() returns the id the row was
+    given.
+
+    If the batch fails it is retried one row per transaction, so a bad row
+    only fails its own request. A full queue raises queue.Full right away;
+    a closed writer, or a row not committed within `timeout` seconds,
+    raises WriterUnavailable.
+    """
+
+    def __init__(
+        self,
+        app,
+        max_batch=GROUP_COMMIT_MAX_BATCH,
+        max_delay=GROUP_COMMIT_MAX_DELAY,
+        max_queue=GROUP_COMMIT_QUEUE_DEPTH,
+        timeout=GROUP_COMMIT_TIMEOUT,
+    ):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.closed = False
+        self._queue = queue.Queue(max_queue)
+        self._thread = threading.Thread(
+            target=self._run, name="group-commit", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, question):
+        """Future of the id of question, once committed."""
+        if self.closed:
+            raise WriterUnavailable("the group commit writer is closed")
+        future = Future()
+        try:
+            self._queue.put_nowait((question, future))
+        except queue.Full:
+            group_commit_stats.rejected += 1
+            raise
+        return future
+
+    def insert(self, question):
+        try:
+            return self.submit(question).result(self.timeout)
+        except FutureTimeoutError:
+            # still queued or committing: the row may yet be committed
+            raise WriterUnavailable("no commit within %s seconds" % self.timeout)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def close(self):
+        """Commit what is queued, then stop the flusher."""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put((None, None))
+        self._thread.join()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch and batch[-1][0] is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1][0] is None
+            if stop:
+                batch.pop()
+            if batch:
+                try:
+                    with self.app.app_context():
+                        self._flush(batch)
+                except Exception as error:
+                    # the flusher must outlive any batch, or later inserts hang
+                    self.app.logger.exception("group commit batch failed")
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(error)
+            if stop:
+                return
+
+    def _flush(self, batch):
+        # objects stay readable after commit, for the listeners and callers
+        session = db.create_session({"expire_on_commit": False})()
+        generated = [question.id is None for question, _ in batch]
+        start = time.perf_counter()
+        try:
+            session.add_all(question for question, _ in batch)
+            session.commit()
+            committed = batch
+        except Exception:
+            session.rollback()
+            committed = self._one_by_one(session, batch, generated)
+        finally:
+            session.close()
+
+        group_commit_stats.batch_sizes.observe(len(batch))
+        group_commit_stats.commit_seconds.observe(time.perf_counter() - start)
+        # the batch bumped the data version once, in its own transaction;
+        # the in-process listeners are patched before the callers return, so
+        # a request reads its own insert, but they can never hold a row back
+        try:
+            for question, _ in committed:
+                notify_question_change("insert", question)
+        except Exception:
+            self.app.logger.exception("group commit listeners failed")
+        finally:
+            for question, future in committed:
+                future.set_result(question.id)
+
+    def _one_by_one(self, session, batch, generated):
+        committed = []
+        for (question, future), reset_id in zip(batch, generated):
+            # the rolled back flush leaves the ids it generated behind
+            if reset_id:
+                question.id = None
+            try:
+                session.add(question)
+                session.commit()
+                # out of reach of the rollback of a later row, which would
+                # expire it
+                session.expunge(question)
+                committed.append((question, future))
+            except Exception as error:
+                session.rollback()
+                group_commit_stats.failed += 1
+                future.set_exception(error)
+        return committed
+
+
+_writer = None
+
+
+def close_group_commit():
+    """Commit the rows still queued and stop the writer; runs at exit."""
+    global _writer
+    writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+
+atexit.register(close_group_commit)
+
+
+def init_group_commit(app):
+    """
+    Opt-in (GROUP_COMMIT_ENABLED): POST /questions creates go through a
+    GroupCommitWriter, sized by GROUP_COMMIT_MAX_BATCH, GROUP_COMMIT_MAX_DELAY,
+    GROUP_COMMIT_QUEUE_DEPTH and GROUP_COMMIT_TIMEOUT. The writer is
+    app.extensions["group_commit"], or None when off. A writer left by an
+    earlier app is closed.
+    """
+    global _writer
+    close_group_commit()
+    if not app.config.get("GROUP_COMMIT_ENABLED", False):
+        return None
+
+    group_commit_stats.reset()
+    _writer = GroupCommitWriter(
+        app,
+        app.config.get("GROUP_COMMIT_MAX_BATCH", GROUP_COMMIT_MAX_BATCH),
+        app.config.get("GROUP_COMMIT_MAX_DELAY", GROUP_COMMIT_MAX_DELAY),
+        app.config.get("GROUP_COMMIT_QUEUE_DEPTH", GROUP_COMMIT_QUEUE_DEPTH),
+        app.config.get("GROUP_COMMIT_TIMEOUT", GROUP_COMMIT_TIMEOUT),
+    )
+    app.extensions["group_commit"] = _writer
+    return _writer
+
+
+def _group_commit_gauges():
+    return [
+        (
+            "trivia_group_commit_rejected",
+            "Inserts refused because the group commit queue was full.",
+            group_commit_stats.rejected,
+        ),
+        (
+            "trivia_group_commit_failed",
+            "Inserts that failed in their own transaction.",
+            group_commit_stats.failed,
+        ),
+    ]
+
+
+def _group_commit_histograms():
+    return [
+        (
+            "trivia_group_commit_batch_size",
+            "Rows committed per group commit transaction.",
+            group_commit_stats.batch_sizes,
+        ),
+        (
+            "trivia_group_commit_seconds",
+            "Time to commit one group commit batch.",
+            group_commit_stats.commit_seconds,
+        ),
+    ]
+
+
+request_metrics.add_gauges(_group_commit_gauges)
+request_metrics.add_histograms(_group_commit_histograms)
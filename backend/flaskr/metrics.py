@@ -0,0 +1,306 @@
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import pool_stats, Question, Category
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+PROFILE_SLOW_MS = 200
+
+COUNTERS = (
+    ("trivia_sql_statements_total", "SQL statements executed.", "sql_statements"),
+    ("trivia_sql_seconds_total", "Time spent in SQL statements.", "sql_seconds"),
+    ("trivia_rows_total", "Rows read (ORM loads and lean rows) plus rows written.", "rows"),
+    (
+        "trivia_serialization_seconds_total",
+        "Time spent encoding JSON.",
+        "serialization_seconds",
+    ),
+)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # counts are cumulative, as Prometheus expects
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.serialization_seconds = 0.0
+
+
+## Per-endpoint request metrics, rendered in the Prometheus text format
+class RequestMetrics:
+    """
+    Latency histogram, SQL statement count and time (engine events), rows
+    (ORM loads plus DML row counts) and JSON serialization time per endpoint.
+    Values are gathered on flask.g during a request and folded in at the end.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = defaultdict(EndpointStats)
+        self.extra = []
+        self.histograms = []
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+
+    def record(
+        self, endpoint, seconds, sql_statements, sql_seconds, rows, serialization
+    ):
+        with self._lock:
+            stats = self.endpoints[endpoint]
+            stats.latency.observe(seconds)
+            stats.sql_statements += sql_statements
+            stats.sql_seconds += sql_seconds
+            stats.rows += rows
+            stats.serialization_seconds += serialization
+
+    def add_gauges(self, collect):
+        """
+        Register collect(), returning (name, help, value) triples that are
+        rendered as gauges; modules with their own stats register at import.
+        """
+        self.extra.append(collect)
+
+    def add_histograms(self, collect):
+        """Like add_gauges(), with (name, help, Histogram) triples."""
+        self.histograms.append(collect)
+
+    def render(self):
+        lines = [
+            "# HELP trivia_request_duration_seconds Request latency per endpoint.",
+            "# TYPE trivia_request_duration_seconds histogram",
+        ]
+        totals = []
+        with self._lock:
+            for endpoint, stats in sorted(self.endpoints.items()):
+                label = 'endpoint="%s"' % endpoint
+                for bound, n in zip(stats.latency.buckets, stats.latency.counts):
+                    lines.append(
+                        'trivia_request_duration_seconds_bucket{%s,le="%s"} %d'
+                        % (label, bound, n)
+                    )
+                lines.append(
+                    'trivia_request_duration_seconds_bucket{%s,le="+Inf"} %d'
+                    % (label, stats.latency.count)
+                )
+                lines.append(
+                    "trivia_request_duration_seconds_sum{%s} %f"
+                    % (label, stats.latency.sum)
+                )
+                lines.append(
+                    "trivia_request_duration_seconds_count{%s} %d"
+                    % (label, stats.latency.count)
+                )
+                totals.append((label, stats))
+
+        for name, help, attribute in COUNTERS:
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s counter" % name)
+            for label, stats in totals:
+                lines.append("%s{%s} %s" % (name, label, getattr(stats, attribute)))
+
+        for collect in self.extra:
+            for name, help, value in collect():
+                lines.append("# HELP %s %s" % (name, help))
+                lines.append("# TYPE %s gauge" % name)
+                lines.append("%s %s" % (name, value))
+
+        for collect in self.histograms:
+            for name, help, histogram in collect():
+                lines.append("# HELP %s %s" % (name, help))
+                lines.append("# TYPE %s histogram" % name)
+                for bound, n in zip(histogram.buckets, histogram.counts):
+                    lines.append('%s_bucket{le="%s"} %d' % (name, bound, n))
+                lines.append('%s_bucket{le="+Inf"} %d' % (name, histogram.count))
+                lines.append("%s_sum %f" % (name, histogram.sum))
+                lines.append("%s_count %d" % (name, histogram.count))
+
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics()
+
+
+def _collecting():
+    return has_request_context() and "metrics_start" in g
+
+
+## SQL statement count/time and rows, through SQLAlchemy events
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, params, context, executemany):
+    if _collecting():
+        g.sql_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, params, context, executemany):
+    if _collecting() and "sql_started" in g:
+        g.sql_statements += 1
+        g.sql_seconds += time.perf_counter() - g.sql_started
+        if context.isinsert or context.isupdate or context.isdelete:
+            g.rows += max(cursor.rowcount, 0)
+
+
+@event.listens_for(Question, "load")
+@event.listens_for(Category, "load")
+def _on_load(target, context):
+    if _collecting():
+        g.rows += 1
+
+
+def record_rows(count):
+    # column-only reads bypass the ORM load event
+    if _collecting():
+        g.rows += count
+
+
+def record_serialization(seconds):
+    if _collecting():
+        g.serialization_seconds += seconds
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            record_serialization(time.perf_counter() - start)
+
+
+## Sampling profiler: dumps profiles of slow requests
+class SampledProfile:
+    """cProfile, or pyinstrument when PROFILER = "pyinstrument"."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        if kind == "pyinstrument":
+            from pyinstrument import Profiler
+
+            self.profiler = Profiler()
+            self.profiler.start()
+        else:
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop(self):
+        if self.kind == "pyinstrument":
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+
+    def dump(self, directory, endpoint):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "%s-%d" % (endpoint, time.time() * 1000))
+        if self.kind == "pyinstrument":
+            with open(path + ".html", "w") as output:
+                output.write(self.profiler.output_html())
+        else:
+            self.profiler.dump_stats(path + ".prof")
+
+
+def init_metrics(app):
+    """
+    Opt-in instrumentation (METRICS_ENABLED): per-request hooks and the
+    /metrics endpoint. PROFILE_SAMPLE_RATE (0-1) profiles that share of
+    requests with PROFILER ("cprofile" or "pyinstrument") and keeps the
+    ones slower than PROFILE_SLOW_MS in PROFILE_DIR.
+    """
+    sample_rate = app.config.get("PROFILE_SAMPLE_RATE", 0)
+    slow_ms = app.config.get("PROFILE_SLOW_MS", PROFILE_SLOW_MS)
+    profile_dir = app.config.get("PROFILE_DIR", "profiles")
+    profiler_kind = app.config.get("PROFILER", "cprofile")
+
+    app.json = TimedJSONProvider(app)
+    request_metrics.reset()
+
+    @app.before_request
+    def start_metrics():
+        g.metrics_start = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+        g.rows = 0
+        g.serialization_seconds = 0.0
+        if sample_rate and random.random() < sample_rate:
+            g.profiler = SampledProfile(profiler_kind)
+
+    @app.after_request
+    def record_metrics(response):
+        if "metrics_start" not in g:
+            return response
+
+        seconds = time.perf_counter() - g.metrics_start
+        endpoint = request.endpoint or "unmatched"
+        request_metrics.record(
+            endpoint,
+            seconds,
+            g.sql_statements,
+            g.sql_seconds,
+            g.rows,
+            g.serialization_seconds,
+        )
+
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.stop()
+            if seconds * 1000 >= slow_ms:
+                profiler.dump(profile_dir, endpoint)
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(
+            request_metrics.render(), mimetype="text/plain; version=0.0.4"
+        )
+
+
+def _pool_gauges():
+    stats = pool_stats.snapshot()
+    return [
+        (
+            "trivia_db_pool_checkouts",
+            "Connections checked out of the pool.",
+            stats["checkouts"],
+        ),
+        (
+            "trivia_db_pool_wait_seconds",
+            "Total time spent waiting for a pooled connection.",
+            stats["wait_seconds_total"],
+        ),
+        (
+            "trivia_db_pool_wait_seconds_max",
+            "Longest wait for a pooled connection.",
+            stats["wait_seconds_max"],
+        ),
+    ]
+
+
+request_metrics.add_gauges(_pool_gauges)
@@ -0,0 +1,159 @@
+from flask import g, request, abort, jsonify
+from flask_cors import CORS
+
+from .adaptive import difficulty_order, skill_estimate
+from .bank import QuestionBank
+from .compression import init_compression
+from .errors import register_error_handlers
+from .pagination import QUESTIONS_PER_PAGE
+from .quiz import ALL_CATEGORIES
+from .serializers import question_fields, select_fields
+
+
+## Offline mode: the read-only endpoints served from a question bank file
+def init_offline(app):
+    """
+    Serves /categories, /questions, /categories/<id>/questions and /quizzes
+    from the bank file at SNAPSHOT_PATH (see bank.export_bank, `flask
+    export-bank`) with the same JSON as the database-backed app. No database
+    is opened; every other endpoint is a 404.
+    """
+    bank = QuestionBank(app.config["SNAPSHOT_PATH"])
+    app.extensions["question_bank"] = bank
+    type_list = list(bank.types.values())
+
+    if app.config.get("COMPRESSION_ENABLED", True):
+        init_compression(app)
+
+    CORS(app, resource={"/": {"origins": "*"}})
+
+    @app.after_request
+    def after_request(response):
+        response.headers.add(
+            "Access-Control-Allow-Headers", "Content-Type,Authorization,true"
+        )
+        response.headers.add(
+            "Access-Control-Allow-Methods", "GET,PUT,POST,PATCH,DELETE,OPTIONS"
+        )
+        return response
+
+    @app.before_request
+    def parse_question_fields():
+        g.fields = None
+        if "fields" in request.args:
+            try:
+                g.fields = question_fields(request.args["fields"])
+            except ValueError:
+                abort(400)
+
+    def page_of_questions(positions):
+        # same ?page= / ?after_id= contract as pagination.paginate_questions
+        after_id = request.args.get("after_id", None, type=int)
+        if after_id is not None:
+            start = bank.after(positions, after_id)
+        else:
+            page = request.args.get("page", 1, type=int)
+            if page < 1:
+                return []
+            start = (page - 1) * QUESTIONS_PER_PAGE
+        questions = [
+            bank.question(position)
+            for position in positions[start : start + QUESTIONS_PER_PAGE]
+        ]
+        return select_fields(questions, g.fields)
+
+    @app.route("/categories")
+    def available_categories_type():
+        if len(bank.types) == 0:
+            abort(404)
+
+        return jsonify(
+            {
+                "success": True,
+                "categories": bank.types,
+                "total_categories": len(bank.types),
+            }
+        )
+
+    @app.route("/questions")
+    def available_questions():
+        try:
+            current_questions = page_of_questions(bank.positions())
+
+            if len(current_questions) == 0:
+                abort(404)
+
+            return jsonify(
+                {
+                    "success": True,
+                    "list_of_questions": current_questions,
+                    "total_questions": bank.size,
+                    "current_category": [],
+                    "categories": type_list,
+                }
+            )
+        except Exception:
+            abort(422)
+
+    @app.route("/categories/<int:category_id>/questions")
+    def category_question_list(category_id):
+        try:
+            c_id = category_id + 1
+            category_type = bank.types.get(c_id)
+
+            if category_type is None:
+                abort(404)
+
+            return jsonify(
+                {
+                    "success": True,
+                    "questions": page_of_questions(bank.positions(c_id)),
+                    "total_questions": bank.size,
+                    "categories": type_list,
+                    "current_category": category_type,
+                }
+            )
+        except Exception:
+            abort(400)
+
+    @app.route("/quizzes", methods=["POST"])
+    def fetch_quizzes_list():
+        body = request.get_json()
+        quiz_category = body.get("quiz_category", None)
+        previous_questions = body.get("previous_questions", None)
+        answers = body.get("answers", None)
+        category_id = quiz_category["id"]
+
+        try:
+            previous = set(previous_questions)
+            category = int(category_id)
+
+            if category != ALL_CATEGORIES and category not in bank.types:
+                abort(404)
+
+            position = None
+            if answers is not None:
+                skill = skill_estimate(answers)
+                for difficulty in difficulty_order(skill):
+                    position = bank.sample(
+                        bank.with_difficulty(category, difficulty), previous
+                    )
+                    if position is not None:
+                        break
+            else:
+                position = bank.sample(bank.positions(category), previous)
+
+            result = {
+                "success": True,
+                "question": None if position is None else bank.question(position),
+                "total_questions": bank.remaining(category, previous),
+            }
+            if answers is not None:
+                result["skill"] = round(skill, 2)
+            return jsonify(result)
+
+        except Exception:
+            abort(404)
+
+    register_error_handlers(app)
+    return app
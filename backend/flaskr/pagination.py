@@ -0,0 +1,36 @@
+from models import Question
+from .serializers import lean_questions
+
+QUESTIONS_PER_PAGE = 10
+
+
+## Questions pagination pushed into SQL (LIMIT/OFFSET or keyset on Question.id)
+def paginate_questions(request, selection, lean=False, fields=None):
+    """
+    Return one page of formatted questions from an (unordered) Question query.
+
+    ?page=N    -> OFFSET (N - 1) * QUESTIONS_PER_PAGE LIMIT QUESTIONS_PER_PAGE
+    ?after_id= -> WHERE id > after_id LIMIT QUESTIONS_PER_PAGE (keyset cursor,
+                  cheap for deep pages because no rows are skipped)
+
+    With lean the page is read as column-only rows instead of ORM objects;
+    fields (see serializers.question_fields) selects only those columns.
+    """
+    after_id = request.args.get("after_id", None, type=int)
+
+    if after_id is not None:
+        selection = selection.filter(Question.id > after_id).order_by(Question.id)
+    else:
+        page = request.args.get("page", 1, type=int)
+        if page < 1:
+            return []
+        selection = selection.order_by(Question.id).offset(
+            (page - 1) * QUESTIONS_PER_PAGE
+        )
+
+    selection = selection.limit(QUESTIONS_PER_PAGE)
+    if fields is not None:
+        return lean_questions(selection, fields)
+    if lean:
+        return lean_questions(selection)
+    return [question.format() for question in selection]
@@ -0,0 +1,154 @@
+import threading
+import time
+
+from models import db, on_question_change
+from .adaptive import adaptive_quiz
+from .categories import category_cache
+from .counts import question_counts
+from .metrics import request_metrics
+from .quiz import quiz_pool
+from .snapshots import category_snapshots
+
+# seconds between rebuilds when nothing changes
+PRECOMPUTE_INTERVAL = 30
+# seconds a change notification waits for the rest of a burst
+PRECOMPUTE_DEBOUNCE = 0.05
+
+COMPONENTS = (
+    ("categories", category_cache),
+    ("counts", question_counts),
+    ("quiz_pool", quiz_pool),
+    ("adaptive_quiz", adaptive_quiz),
+    ("category_snapshots", category_snapshots),
+)
+
+
+class PrecomputeStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.passes = 0
+        self.swaps = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_seconds = 0.0
+
+
+precompute_stats = PrecomputeStats()
+
+
+def rebuild(components=COMPONENTS):
+    """
+    One pass: build each component from the database, off its lock, and
+    install it. A component changed while it was being built keeps its own
+    (patched) state; the change has asked for another pass anyway.
+    Needs an app context.
+    """
+    start = time.perf_counter()
+    for _, component in components:
+        generation = component.generation()
+        if component.install(component.build(), generation):
+            precompute_stats.swaps += 1
+        else:
+            precompute_stats.skipped += 1
+    precompute_stats.passes += 1
+    precompute_stats.last_seconds = time.perf_counter() - start
+
+
+## Background precompute: quiz pools and aggregates rebuilt off the request path
+class PrecomputeWorker:
+    """
+    A daemon thread that runs rebuild() at start, every `interval` seconds
+    and `debounce` seconds after a committed question change, so requests
+    find the structures loaded and other workers' writes are picked up
+    without a restart.
+    """
+
+    def __init__(self, interval=PRECOMPUTE_INTERVAL, debounce=PRECOMPUTE_DEBOUNCE):
+        self.interval = interval
+        self.debounce = debounce
+        self.app = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        """
+        Opt-in (PRECOMPUTE_ENABLED), timed by PRECOMPUTE_INTERVAL and
+        PRECOMPUTE_DEBOUNCE. A worker left by an earlier app is stopped.
+        """
+        self.stop()
+        precompute_stats.reset()
+        if not app.config.get("PRECOMPUTE_ENABLED", False):
+            return
+        self.interval = app.config.get("PRECOMPUTE_INTERVAL", PRECOMPUTE_INTERVAL)
+        self.debounce = app.config.get("PRECOMPUTE_DEBOUNCE", PRECOMPUTE_DEBOUNCE)
+        self.start(app)
+
+    def start(self, app):
+        self.app = app
+        self._stopped.clear()
+        self._wake.clear()
+        self._thread = threading.Thread(target=self.run, name="precompute", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+
+    def notify(self, *args):
+        self._wake.set()
+
+    def run_once(self):
+        with self.app.app_context():
+            try:
+                rebuild()
+            except Exception:
+                precompute_stats.errors += 1
+                self.app.logger.exception("precompute pass failed")
+            finally:
+                db.session.remove()
+
+    def run(self):
+        """Rebuild until stop(); `flask precompute` runs it in the foreground."""
+        while not self._stopped.is_set():
+            self.run_once()
+            self._wake.wait(self.interval)
+            if self._stopped.is_set():
+                break
+            # let the rest of a burst of changes arrive first
+            self._stopped.wait(self.debounce)
+            self._wake.clear()
+
+
+precompute_worker = PrecomputeWorker()
+on_question_change(precompute_worker.notify)
+
+
+def _precompute_gauges():
+    return [
+        ("trivia_precompute_passes", "Precompute passes run.", precompute_stats.passes),
+        (
+            "trivia_precompute_swaps",
+            "Structures swapped in by the precompute worker.",
+            precompute_stats.swaps,
+        ),
+        (
+            "trivia_precompute_skipped",
+            "Rebuilt structures dropped because they changed meanwhile.",
+            precompute_stats.skipped,
+        ),
+        ("trivia_precompute_errors", "Failed precompute passes.", precompute_stats.errors),
+        (
+            "trivia_precompute_last_seconds",
+            "Duration of the last precompute pass.",
+            precompute_stats.last_seconds,
+        ),
+    ]
+
+
+request_metrics.add_gauges(_precompute_gauges)
@@ -0,0 +1,165 @@
+import bisect
+import random
+import threading
+from array import array
+
+from models import db, on_primary, Question, on_question_change
+
+ALL_CATEGORIES = 0
+MAX_SAMPLE_TRIES = 32
+
+
+## Quiz selection engine: per-category id arrays sampled in memory
+class QuizPool:
+    """
+    Sorted array('i') of question ids per category, plus one for all
+    categories (key 0).
+
+    The arrays are loaded once with a column-only query and patched by the
+    Question change listeners. A quiz step samples an id at random, rejects
+    ids already in `previous`, and the handler then fetches a single row by
+    primary key. The precompute worker swaps in whole rebuilt arrays with
+    build() and install().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = None
+        self.changes = 0
+
+    @staticmethod
+    def _key(category):
+        try:
+            return int(category)
+        except (TypeError, ValueError):
+            return None
+
+    def reset(self):
+        with self._lock:
+            self._ids = None
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Pools from (id, category) rows in id order."""
+        pools = {ALL_CATEGORIES: array("i")}
+        for question_id, category in rows:
+            pools[ALL_CATEGORIES].append(question_id)
+            pools.setdefault(cls._key(category), array("i")).append(question_id)
+        return pools
+
+    def build(self):
+        """Pools read from the database, without taking the lock."""
+        with on_primary():
+            return self.from_rows(
+                db.session.query(Question.id, Question.category).order_by(Question.id)
+            )
+
+    def generation(self):
+        """Token for install(): how many changes have been applied."""
+        return self.changes
+
+    def install(self, pools, generation):
+        """
+        Swap in pools from build(), unless a change was applied since
+        `generation` was read: the pools could have missed it.
+        """
+        with self._lock:
+            if self.changes != generation:
+                return False
+            self._ids = pools
+            return True
+
+    def loaded(self):
+        return self._ids is not None
+
+    def _pools(self):
+        # callers hold self._lock
+        if self._ids is None:
+            self._ids = self.build()
+        return self._ids
+
+    @staticmethod
+    def _contains(ids, question_id):
+        i = bisect.bisect_left(ids, question_id)
+        return i < len(ids) and ids[i] == question_id
+
+    def ids(self, category):
+        """Copy of the question ids in category."""
+        with self._lock:
+            return list(self._pools().get(category, ()))
+
+    def remaining(self, category, previous):
+        """Number of questions in category that are not in previous."""
+        with self._lock:
+            ids = self._pools().get(category, ())
+            used = sum(1 for question_id in previous if self._contains(ids, question_id))
+            return len(ids) - used
+
+    def bound(self, category):
+        """One more than the highest question id in category; 0 when empty."""
+        with self._lock:
+            ids = self._pools().get(category, ())
+            return ids[-1] + 1 if len(ids) else 0
+
+    def count_below(self, category, bound):
+        """Number of questions in category with an id below bound."""
+        with self._lock:
+            return bisect.bisect_left(self._pools().get(category, ()), bound)
+
+    def first(self, category, candidates):
+        """First (position, question id) of candidates with the id in category."""
+        with self._lock:
+            ids = self._pools().get(category, ())
+            for position, question_id in candidates:
+                if self._contains(ids, question_id):
+                    return position, question_id
+            return None
+
+    def sample(self, category, previous):
+        """Random question id from category that is not in previous, or None."""
+        with self._lock:
+            ids = self._pools().get(category, ())
+            if len(ids) == 0:
+                return None
+
+            for _ in range(MAX_SAMPLE_TRIES):
+                question_id = ids[random.randrange(len(ids))]
+                if question_id not in previous:
+                    return question_id
+
+            # nearly every id has been played; pick from what is left
+            left = [question_id for question_id in ids if question_id not in previous]
+            return random.choice(left) if left else None
+
+    def discard(self, question_id):
+        with self._lock:
+            self.changes += 1
+            if self._ids is None:
+                return
+            for ids in self._ids.values():
+                i = bisect.bisect_left(ids, question_id)
+                if i < len(ids) and ids[i] == question_id:
+                    del ids[i]
+
+    def on_change(self, action, question):
+        if action == "delete":
+            self.discard(question.id)
+            return
+
+        key = self._key(question.category) if question is not None else None
+        with self._lock:
+            self.changes += 1
+            if self._ids is None:
+                return
+            if action == "insert":
+                for category in (ALL_CATEGORIES, key):
+                    bisect.insort(
+                        self._ids.setdefault(category, array("i")), question.id
+                    )
+            else:
+                # an update can move a question between categories; reload
+                self._ids = None
+
+
+quiz_pool = QuizPool()
+on_question_change(quiz_pool.on_change)
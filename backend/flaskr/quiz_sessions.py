@@ -0,0 +1,212 @@
+import json
+import random
+import secrets
+import threading
+import time
+
+from .cache import shared_cache
+from .quiz import quiz_pool
+from .serializers import encode
+
+QUIZ_SESSION_TTL = 1800
+MAX_QUIZ_SESSIONS = 10000
+SHUFFLE_ROUNDS = 4
+
+
+def shuffled_position(position, seed, half_bits):
+    """
+    position under a pseudo-random permutation of [0, 4 ** half_bits) keyed
+    by seed, a list of 32-bit round keys: a small Feistel network, so it
+    needs no table.
+    """
+    mask = (1 << half_bits) - 1
+    left, right = position >> half_bits, position & mask
+    for key in seed:
+        left, right = right, left ^ ((((right ^ key) * 0x9E3779B1) >> 16) & mask)
+    return (left << half_bits) | right
+
+
+class QuizSession:
+    __slots__ = (
+        "id", "category", "queue", "served", "expires_at", "seed", "bound", "cursor"
+    )
+
+    def __init__(
+        self, id, category, queue, expires_at, served=None, seed=None, bound=0, cursor=0
+    ):
+        self.id = id
+        self.category = category
+        self.queue = queue
+        self.served = served
+        self.expires_at = expires_at
+        self.seed = seed
+        self.bound = bound
+        self.cursor = cursor
+
+    @property
+    def half_bits(self):
+        return (max(self.bound - 1, 1).bit_length() + 1) // 2
+
+    def candidates(self):
+        """(position, id) of the ids below bound, in the session's order."""
+        for position in range(self.cursor, 1 << (2 * self.half_bits)):
+            question_id = shuffled_position(position, self.seed, self.half_bits)
+            if question_id < self.bound:
+                yield position, question_id
+
+
+## Server-side quiz sessions: a pre-shuffled id queue per player
+class QuizSessionStore:
+    """
+    Keeps quiz state on the server so clients no longer send the list of
+    previous questions. Each session owns a shuffled copy of the category's
+    question ids; a turn pops one id. Sessions expire after `ttl` seconds
+    without activity and the oldest one is dropped once `max_sessions` is hit.
+
+    When the shared cache has a store (CACHE_BACKEND mmap:// or redis://)
+    sessions live there instead, so any worker can serve the next turn. A
+    shared session is a few integers whatever its length: a seed that orders
+    the ids below the category's highest id at start, and a cursor into that
+    order. A turn walks the cursor to the next id still in the quiz pool;
+    questions added later are not served. The store expires a session after
+    `ttl` idle seconds. Turns of one session are expected one at a time.
+
+    Ids come from `pool`, the process-wide quiz pool unless given another.
+    """
+
+    def __init__(
+        self, ttl=QUIZ_SESSION_TTL, max_sessions=MAX_QUIZ_SESSIONS, pool=quiz_pool
+    ):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.pool = pool
+        self.store = None
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def init_app(self, app):
+        """QUIZ_SESSION_TTL; call after shared_cache.init_app()."""
+        self.ttl = app.config.get("QUIZ_SESSION_TTL", self.ttl)
+        self.store = shared_cache.shared
+        self.clear()
+
+    @staticmethod
+    def _key(session_id):
+        return "quiz_session:" + session_id
+
+    def _save(self, session):
+        data = encode(
+            {
+                "category": session.category,
+                "served": session.served,
+                "seed": session.seed,
+                "bound": session.bound,
+                "cursor": session.cursor,
+            }
+        )
+        # a session that outgrows an mmap slot ends rather than repeats
+        if not self.store.set(self._key(session.id), data, self.ttl):
+            self.store.delete(self._key(session.id))
+
+    def _purge(self, now):
+        expired = [id for id, s in self._sessions.items() if s.expires_at <= now]
+        for id in expired:
+            del self._sessions[id]
+
+    def start(self, category):
+        now = time.monotonic()
+        if self.store is not None:
+            session = QuizSession(
+                secrets.token_urlsafe(16),
+                category,
+                None,
+                now + self.ttl,
+                0,
+                [secrets.randbits(32) for _ in range(SHUFFLE_ROUNDS)],
+                self.pool.bound(category),
+            )
+            self._save(session)
+            return session
+
+        queue = self.pool.ids(category)
+        random.shuffle(queue)
+
+        with self._lock:
+            self._purge(now)
+            while len(self._sessions) >= self.max_sessions:
+                # dicts keep insertion order: drop the oldest session
+                del self._sessions[next(iter(self._sessions))]
+
+            session = QuizSession(
+                secrets.token_urlsafe(16), category, queue, now + self.ttl
+            )
+            self._sessions[session.id] = session
+            return session
+
+    def get(self, session_id):
+        now = time.monotonic()
+        if self.store is not None:
+            data = self.store.get(self._key(session_id))
+            if data is None:
+                return None
+            state = json.loads(data)
+            return QuizSession(
+                session_id,
+                state["category"],
+                None,
+                now + self.ttl,
+                state["served"],
+                state["seed"],
+                state["bound"],
+                state["cursor"],
+            )
+
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.expires_at <= now:
+                self._sessions.pop(session_id, None)
+                return None
+            session.expires_at = now + self.ttl
+            return session
+
+    def next_id(self, session):
+        """Pop the next question id of the session, None once exhausted."""
+        if self.store is not None:
+            found = self.pool.first(session.category, session.candidates())
+            if found is None:
+                session.cursor = 1 << (2 * session.half_bits)
+                question_id = None
+            else:
+                position, question_id = found
+                session.cursor = position + 1
+                session.served += 1
+            self._save(session)
+            return question_id
+
+        with self._lock:
+            return session.queue.pop() if session.queue else None
+
+    def remaining(self, session):
+        """Number of questions the session has not served yet."""
+        if self.store is not None:
+            # like the local queue, an estimate while questions are deleted
+            left = self.pool.count_below(session.category, session.bound)
+            return max(left - session.served, 0)
+        return len(session.queue)
+
+    def end(self, session_id):
+        if self.store is not None:
+            if self.store.get(self._key(session_id)) is None:
+                return False
+            self.store.delete(self._key(session_id))
+            return True
+
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+
+quiz_sessions = QuizSessionStore()
@@ -0,0 +1,309 @@
+import bisect
+import re
+import threading
+from collections import defaultdict
+
+from sqlalchemy import func
+from sqlalchemy.engine.url import make_url
+
+from models import (
+    db,
+    db_init_mode,
+    on_primary,
+    Question,
+    on_question_change,
+    search_document,
+)
+from .pagination import QUESTIONS_PER_PAGE
+from .metrics import request_metrics
+from .cache import LRUCache
+
+TOKEN_RE = re.compile(r"\w+")
+SEARCH_CACHE_ENTRIES = 1024
+SEARCH_CACHE_BYTES = 8 * 1024 * 1024
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def page_bounds(page):
+    start = (page - 1) * QUESTIONS_PER_PAGE
+    return start, start + QUESTIONS_PER_PAGE
+
+
+def full_text_match(term, prefix=False):
+    """
+    The Postgres full-text WHERE clause for term and its rank expression.
+    With prefix the last word also matches as a prefix.
+    """
+    document = search_document()
+    if prefix:
+        # tokens are \w+ only, safe to join into tsquery syntax
+        tokens = tokenize(term)
+        query = func.to_tsquery("english", " & ".join(tokens) + ":*")
+    else:
+        query = func.plainto_tsquery("english", term)
+    return document.op("@@")(query), func.ts_rank(document, query)
+
+
+## Postgres backend: tsvector @@ plainto_tsquery, backed by ix_questions_search
+class PostgresSearch:
+    name = "postgres"
+
+    def search(self, term, page=1, prefix=False):
+        if page < 1:
+            return [], 0
+
+        match, rank = full_text_match(term, prefix)
+        selection = Question.query.filter(match)
+
+        start, _ = page_bounds(page)
+        current = (
+            selection.order_by(rank.desc(), Question.id)
+            .offset(start)
+            .limit(QUESTIONS_PER_PAGE)
+        )
+        return [question.format() for question in current], selection.count()
+
+    def on_change(self, action, question):
+        pass
+
+
+## In-process backend: inverted index token -> {question id: term frequency}
+class InvertedIndexSearch:
+    """
+    Built from a column-only scan of question and answer text and patched by
+    the Question change listeners. All query tokens must match; results are
+    ranked by summed term frequency, then id, and only the rows of the
+    requested page are loaded by primary key. A sorted list of the indexed
+    terms answers prefix queries with two bisects.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = None
+        self._terms = []
+        self.changes = 0
+
+    @staticmethod
+    def _document(question, answer):
+        return tokenize(question) + tokenize(answer)
+
+    @staticmethod
+    def _add(postings, question_id, tokens, terms=None):
+        for token in tokens:
+            if terms is not None and token not in postings:
+                bisect.insort(terms, token)
+            ids = postings[token]
+            ids[question_id] = ids.get(question_id, 0) + 1
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Postings from (id, question, answer) rows."""
+        postings = defaultdict(dict)
+        for question_id, question, answer in rows:
+            cls._add(postings, question_id, cls._document(question, answer))
+        return postings
+
+    def build(self):
+        with on_primary():
+            postings = self.from_rows(
+                db.session.query(Question.id, Question.question, Question.answer)
+            )
+        with self._lock:
+            self._postings = postings
+            self._terms = sorted(postings)
+        return postings
+
+    def generation(self):
+        """Token for install(): how many changes have been applied."""
+        return self.changes
+
+    def install(self, postings, generation):
+        """Swap in from_rows() postings unless a change was applied meanwhile."""
+        with self._lock:
+            if self.changes != generation:
+                return False
+            self._postings = postings
+            self._terms = sorted(postings)
+            return True
+
+    def loaded(self):
+        return self._postings is not None
+
+    def reset(self):
+        with self._lock:
+            self._postings = None
+            self._terms = []
+
+    def _expand(self, postings, token):
+        # union of the postings of every indexed term starting with token
+        lo = bisect.bisect_left(self._terms, token)
+        hi = bisect.bisect_left(self._terms, token + "\uffff")
+        ids = {}
+        for term in self._terms[lo:hi]:
+            for id, n in postings[term].items():
+                ids[id] = ids.get(id, 0) + n
+        return ids
+
+    def rank(self, tokens, prefix=False):
+        """
+        Matching question ids ordered by score, best first. With prefix the
+        last token also matches every term it is a prefix of.
+        """
+        postings = self._postings
+        if postings is None:
+            postings = self.build()
+
+        with self._lock:
+            scores = None
+            for i, token in enumerate(tokens):
+                if prefix and i == len(tokens) - 1:
+                    ids = self._expand(postings, token)
+                else:
+                    ids = postings.get(token)
+                if not ids:
+                    return []
+                if scores is None:
+                    scores = dict(ids)
+                else:
+                    scores = {id: n + ids[id] for id, n in scores.items() if id in ids}
+
+        if not scores:
+            return []
+        return sorted(scores, key=lambda id: (-scores[id], id))
+
+    def search(self, term, page=1, prefix=False):
+        if page < 1:
+            return [], 0
+
+        ranked = self.rank(tokenize(term), prefix)
+        start, end = page_bounds(page)
+        page_ids = ranked[start:end]
+
+        if not page_ids:
+            return [], len(ranked)
+
+        rows = {q.id: q for q in Question.query.filter(Question.id.in_(page_ids))}
+        current = [rows[id].format() for id in page_ids if id in rows]
+        return current, len(ranked)
+
+    def on_change(self, action, question):
+        with self._lock:
+            self.changes += 1
+            if self._postings is None:
+                return
+            if action == "insert":
+                self._add(
+                    self._postings,
+                    question.id,
+                    self._document(question.question, question.answer),
+                    self._terms,
+                )
+            elif action == "delete":
+                for token in set(self._document(question.question, question.answer)):
+                    ids = self._postings.get(token)
+                    if ids is not None:
+                        ids.pop(question.id, None)
+                        if not ids:
+                            del self._postings[token]
+                            self._terms.pop(bisect.bisect_left(self._terms, token))
+            else:
+                # the old text of an updated question is gone; rebuild lazily
+                self._postings = None
+                self._terms = []
+
+
+## Bounded LRU of search results keyed on normalised term + page
+class SearchResultCache(LRUCache):
+    """
+    Sized by the question text it holds. Cleared on every question change,
+    since any insert/delete can alter a result.
+    """
+
+    def __init__(self, max_entries=SEARCH_CACHE_ENTRIES, max_bytes=SEARCH_CACHE_BYTES):
+        super().__init__(max_entries, max_bytes)
+
+    @staticmethod
+    def _size(value):
+        questions, _ = value
+        return 64 + sum(
+            64 + len(q["question"] or "") + len(q["answer"] or "") for q in questions
+        )
+
+
+SEARCH_BACKENDS = {
+    PostgresSearch.name: PostgresSearch,
+    InvertedIndexSearch.name: InvertedIndexSearch,
+}
+
+
+def search_backend_name(config):
+    """
+    SEARCH_BACKEND, or by default "postgres" for Postgres databases and
+    "memory" for anything else (SQLite in tests and benchmarks).
+    """
+    name = config.get("SEARCH_BACKEND")
+    if name is None:
+        url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+        name = "postgres" if url.get_backend_name() == "postgresql" else "memory"
+    return name
+
+
+## Search facade the handlers talk to; the backend is chosen in create_app
+class QuestionSearch:
+    def __init__(self):
+        self.backend = InvertedIndexSearch()
+        self.cache = SearchResultCache()
+
+    def init_app(self, app):
+        """
+        SEARCH_BACKEND picks "postgres" or "memory" (see
+        search_backend_name()); the in-process index is built right away
+        unless DB_INIT defers database work to the first request.
+        """
+        self.backend = SEARCH_BACKENDS[search_backend_name(app.config)]()
+        self.cache = SearchResultCache(
+            app.config.get("SEARCH_CACHE_ENTRIES", SEARCH_CACHE_ENTRIES),
+            app.config.get("SEARCH_CACHE_BYTES", SEARCH_CACHE_BYTES),
+        )
+        eager = db_init_mode(app) == "eager"
+        if isinstance(self.backend, InvertedIndexSearch) and eager:
+            with app.app_context():
+                self.backend.build()
+
+    def search(self, term, page=1):
+        return self.backend.search(term, page)
+
+    def prefix_search(self, term, page=1):
+        """Search-as-you-type: last word matches as a prefix, results cached."""
+        key = (" ".join(tokenize(term)), page)
+        result = self.cache.get(key)
+        if result is None:
+            # cached until the next change: read from the primary
+            with on_primary():
+                result = self.backend.search(term, page, prefix=True)
+            self.cache.put(key, result)
+        return result
+
+    def on_change(self, action, question):
+        self.backend.on_change(action, question)
+        self.cache.clear()
+
+
+question_search = QuestionSearch()
+on_question_change(question_search.on_change)
+
+
+def _cache_gauges():
+    cache = question_search.cache
+    return [
+        ("trivia_search_cache_hits", "Prefix search cache hits.", cache.hits),
+        ("trivia_search_cache_misses", "Prefix search cache misses.", cache.misses),
+    ]
+
+
+request_metrics.add_gauges(_cache_gauges)
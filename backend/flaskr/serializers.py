@@ -0,0 +1,69 @@
+import json
+import time
+
+from flask import current_app
+
+from models import Question
+from .metrics import record_rows, record_serialization
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, stdlib json otherwise
+    orjson = None
+
+QUESTION_COLUMNS = (
+    Question.id,
+    Question.question,
+    Question.answer,
+    Question.category,
+    Question.difficulty,
+)
+QUESTION_KEYS = tuple(column.key for column in QUESTION_COLUMNS)
+
+
+## Sparse fieldsets: ?fields=id,question trims every question object
+def question_fields(value):
+    """Question keys named in a fields= value, in QUESTION_KEYS order."""
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = names - set(QUESTION_KEYS)
+    if not names or unknown:
+        raise ValueError("unknown fields " + ", ".join(sorted(unknown)))
+    return tuple(key for key in QUESTION_KEYS if key in names)
+
+
+def select_fields(questions, fields):
+    if fields is None:
+        return questions
+    return [{key: question[key] for key in fields} for question in questions]
+
+
+## Lean read path: column-only rows, no ORM instances, fast JSON encoder
+def lean_questions(selection, fields=QUESTION_KEYS):
+    """
+    Run a Question query as a column-only SELECT and return the same dicts
+    as Question.format(), without building ORM objects or identity-map state.
+    With fields only those columns are selected.
+    """
+    columns = [column for column in QUESTION_COLUMNS if column.key in fields]
+    rows = selection.with_entities(*columns).all()
+    record_rows(len(rows))
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS)
+    return json.dumps(payload, separators=(",", ":"), sort_keys=True)
+
+
+def encode(payload):
+    """dumps() as bytes, whichever encoder is installed."""
+    encoded = dumps(payload)
+    return encoded if isinstance(encoded, bytes) else encoded.encode()
+
+
+def json_response(payload, status=200):
+    start = time.perf_counter()
+    body = dumps(payload)
+    record_serialization(time.perf_counter() - start)
+    return current_app.response_class(body, status=status, mimetype="application/json")
@@ -0,0 +1,257 @@
+import bisect
+import threading
+from array import array
+from collections import OrderedDict
+
+from models import db, on_primary, Question, on_question_change
+from .metrics import request_metrics
+from .pagination import QUESTIONS_PER_PAGE
+from .serializers import QUESTION_COLUMNS, QUESTION_KEYS, encode
+
+SNAPSHOT_MAX_BYTES = 32 * 1024 * 1024
+# rough per-question cost of the id array, dict slot and bytes object
+ROW_OVERHEAD = 100
+
+
+class CategorySnapshot:
+    """
+    One category's questions, ordered by id: every question encoded once as
+    JSON, plus page blobs joined from those rows on first use. A change
+    drops the page blobs from the changed position on, which later pages
+    rebuild from the encoded rows without touching the database.
+    """
+
+    __slots__ = ("ids", "rows", "pages", "size")
+
+    def __init__(self):
+        self.ids = array("i")
+        self.rows = {}
+        self.pages = []
+        self.size = 0
+
+    def add(self, question_id, row):
+        i = bisect.bisect_left(self.ids, question_id)
+        if i < len(self.ids) and self.ids[i] == question_id:
+            self.size -= len(self.rows[question_id])
+        else:
+            self.ids.insert(i, question_id)
+            self.size += ROW_OVERHEAD
+        self.rows[question_id] = row
+        self.size += len(row)
+        self._invalidate_from(i)
+
+    def remove(self, question_id):
+        row = self.rows.pop(question_id, None)
+        if row is None:
+            return
+        i = bisect.bisect_left(self.ids, question_id)
+        del self.ids[i]
+        self.size -= len(row) + ROW_OVERHEAD
+        self._invalidate_from(i)
+
+    def _invalidate_from(self, position):
+        first = position // QUESTIONS_PER_PAGE
+        for blob in self.pages[first:]:
+            if blob is not None:
+                self.size -= len(blob)
+        del self.pages[first:]
+
+    def page(self, number):
+        """JSON array of page `number` (1-based); "[]" past the end."""
+        index = number - 1
+        if index < 0 or index * QUESTIONS_PER_PAGE >= len(self.ids):
+            return b"[]"
+        if index >= len(self.pages):
+            self.pages.extend([None] * (index + 1 - len(self.pages)))
+        blob = self.pages[index]
+        if blob is None:
+            start = index * QUESTIONS_PER_PAGE
+            ids = self.ids[start : start + QUESTIONS_PER_PAGE]
+            blob = b"[" + b",".join(self.rows[id] for id in ids) + b"]"
+            self.pages[index] = blob
+            self.size += len(blob)
+        return blob
+
+
+## Snapshot store: pre-encoded category pages, patched on insert/delete
+class CategorySnapshots:
+    """
+    CategorySnapshot per category, loaded with one column-only query on
+    first use and patched by the Question change listeners, so a category
+    page is a dictionary lookup plus a byte copy. The snapshots share a
+    max_bytes budget; the least recently read categories are evicted past
+    it, and a category that alone exceeds it is never snapshotted.
+
+    The listeners only see this process's writes; the precompute worker
+    reloads the held categories with build() and install(), which is how
+    other workers' writes reach them.
+    """
+
+    def __init__(self, max_bytes=SNAPSHOT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.changes = 0
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()
+        self._oversized = set()
+        self._size = 0
+
+    @staticmethod
+    def _key(category):
+        try:
+            return int(category)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _row(values):
+        return encode(dict(zip(QUESTION_KEYS, values)))
+
+    def reset(self):
+        with self._lock:
+            self.changes += 1
+            self._snapshots.clear()
+            self._oversized.clear()
+            self._size = 0
+
+    def size(self):
+        with self._lock:
+            return self._size
+
+    def _load(self, category):
+        snapshot = CategorySnapshot()
+        with on_primary():
+            rows = (
+                db.session.query(*QUESTION_COLUMNS)
+                .filter(Question.category == category)
+                .order_by(Question.id)
+            )
+            for row in rows:
+                snapshot.ids.append(row[0])
+                snapshot.rows[row[0]] = encoded = self._row(row)
+                snapshot.size += len(encoded) + ROW_OVERHEAD
+        return snapshot
+
+    def _evict(self):
+        # callers hold self._lock
+        while self._size > self.max_bytes and self._snapshots:
+            _, snapshot = self._snapshots.popitem(last=False)
+            self._size -= snapshot.size
+
+    def _page(self, snapshot, number):
+        # callers hold self._lock
+        before = snapshot.size
+        blob = snapshot.page(number)
+        self._size += snapshot.size - before
+        self._evict()
+        return blob
+
+    def _keep(self, category, snapshot):
+        # callers hold self._lock
+        old = self._snapshots.get(category)
+        self._snapshots[category] = snapshot
+        self._size += snapshot.size - (old.size if old is not None else 0)
+
+    def page(self, category, number):
+        """Page blob of category, or None when it is not snapshotted."""
+        with self._lock:
+            if category in self._oversized:
+                return None
+
+            snapshot = self._snapshots.get(category)
+            if snapshot is not None:
+                self.hits += 1
+                self._snapshots.move_to_end(category)
+                return self._page(snapshot, number)
+            self.misses += 1
+            generation = self.changes
+
+        # the query runs without the lock, so other categories keep serving
+        snapshot = self._load(category)
+
+        with self._lock:
+            if snapshot.size > self.max_bytes:
+                self._oversized.add(category)
+                return None
+            if self.changes != generation:
+                # a change landed during the query, which may have missed
+                # it: answer this request only
+                return snapshot.page(number)
+            self._keep(category, snapshot)
+            return self._page(snapshot, number)
+
+    def build(self):
+        """Reloaded snapshots of the held categories, without taking the lock."""
+        with self._lock:
+            categories = list(self._snapshots)
+        return {category: self._load(category) for category in categories}
+
+    def generation(self):
+        """Token for install(): how many changes have been applied."""
+        return self.changes
+
+    def install(self, built, generation):
+        """Swap in build()'s snapshots unless a change was applied meanwhile."""
+        with self._lock:
+            if self.changes != generation:
+                return False
+            for category, snapshot in built.items():
+                if category not in self._snapshots:
+                    # evicted since build() read the list
+                    continue
+                if snapshot.size > self.max_bytes:
+                    self._size -= self._snapshots.pop(category).size
+                    self._oversized.add(category)
+                    continue
+                self._keep(category, snapshot)
+            self._evict()
+            return True
+
+    def on_change(self, action, question):
+        with self._lock:
+            self.changes += 1
+            if action in ("insert", "delete"):
+                snapshot = self._snapshots.get(self._key(question.category))
+                if snapshot is None:
+                    return
+                before = snapshot.size
+                if action == "insert":
+                    values = [getattr(question, key) for key in QUESTION_KEYS]
+                    snapshot.add(question.id, self._row(values))
+                else:
+                    snapshot.remove(question.id)
+                self._size += snapshot.size - before
+                self._evict()
+            else:
+                # an update can move a question between categories; reload
+                self._snapshots.clear()
+                self._oversized.clear()
+                self._size = 0
+
+
+category_snapshots = CategorySnapshots()
+on_question_change(category_snapshots.on_change)
+
+
+def _snapshot_gauges():
+    return [
+        (
+            "trivia_snapshot_bytes",
+            "Bytes held by category snapshots.",
+            category_snapshots.size(),
+        ),
+        (
+            "trivia_snapshot_hits",
+            "Category pages served from snapshots.",
+            category_snapshots.hits,
+        ),
+        (
+            "trivia_snapshot_misses",
+            "Category snapshots loaded.",
+            category_snapshots.misses,
+        ),
+    ]
+
+
+request_metrics.add_gauges(_snapshot_gauges)
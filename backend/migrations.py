@@ -0,0 +1,216 @@
+"""
+Schema migrations
+
+Numbered steps applied in order by migrate(engine), each in the same
+transaction as the schema_version row that records it. The steps are
+frozen DDL rather than the current models, so a database created by any
+earlier version of the app (db.create_all() or trivia.psql) is brought
+to the same schema. On Postgres an advisory lock serialises concurrent
+migrators.
+"""
+import time
+
+from sqlalchemy import (
+    Column,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    inspect,
+    select,
+    text,
+)
+
+MIGRATION_LOCK = 7235401
+
+"""
+schema_version
+    one row per applied migration
+"""
+version_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String),
+    Column("applied_at", Float),
+)
+
+MIGRATIONS = []
+
+def migration(version, description):
+    def register(upgrade):
+        MIGRATIONS.append((version, description, upgrade))
+        MIGRATIONS.sort(key=lambda step: step[0])
+        return upgrade
+    return register
+
+"""
+1: the original tables, as db.create_all() used to create them
+"""
+@migration(1, "create questions and categories")
+def create_tables(connection):
+    metadata = MetaData()
+    Table(
+        "categories",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("type", String),
+    )
+    Table(
+        "questions",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("question", String),
+        Column("answer", String),
+        Column("category", String),
+        Column("difficulty", Integer),
+    )
+    metadata.create_all(connection, checkfirst=True)
+
+"""
+2: questions.category becomes an integer foreign key to categories.id;
+   values that name no category become NULL. trivia.psql databases already
+   have this column and constraint and are left alone.
+"""
+@migration(2, "questions.category integer foreign key")
+def category_foreign_key(connection):
+    inspector = inspect(connection)
+    column = next(
+        c for c in inspector.get_columns("questions") if c["name"] == "category"
+    )
+    is_integer = isinstance(column["type"], Integer)
+    has_foreign_key = any(
+        fk["referred_table"] == "categories"
+        for fk in inspector.get_foreign_keys("questions")
+    )
+    if is_integer and has_foreign_key:
+        return
+
+    if connection.dialect.name == "sqlite":
+        # SQLite cannot alter a column: rebuild the table
+        connection.execute(text(
+            "CREATE TABLE questions_migrated ("
+            "id INTEGER NOT NULL PRIMARY KEY, "
+            "question VARCHAR, "
+            "answer VARCHAR, "
+            "category INTEGER REFERENCES categories (id) "
+            "ON UPDATE CASCADE ON DELETE SET NULL, "
+            "difficulty INTEGER)"
+        ))
+        connection.execute(text(
+            "INSERT INTO questions_migrated "
+            "(id, question, answer, category, difficulty) "
+            "SELECT id, question, answer, "
+            "(SELECT categories.id FROM categories "
+            "WHERE CAST(categories.id AS TEXT) = trim(questions.category)), "
+            "difficulty FROM questions"
+        ))
+        connection.execute(text("DROP TABLE questions"))
+        connection.execute(text("ALTER TABLE questions_migrated RENAME TO questions"))
+        return
+
+    if not is_integer:
+        connection.execute(text(
+            "ALTER TABLE questions ALTER COLUMN category TYPE integer USING "
+            "CASE WHEN trim(category) ~ '^[0-9]+$' "
+            "THEN trim(category)::integer END"
+        ))
+    if not has_foreign_key:
+        connection.execute(text(
+            "UPDATE questions SET category = NULL "
+            "WHERE category NOT IN (SELECT id FROM categories)"
+        ))
+        connection.execute(text(
+            "ALTER TABLE questions ADD CONSTRAINT category "
+            "FOREIGN KEY (category) REFERENCES categories (id) "
+            "ON UPDATE CASCADE ON DELETE SET NULL"
+        ))
+
+"""
+3: composite indexes for category pages (category, id) and quiz / bulk
+   filters (category, difficulty)
+"""
+@migration(3, "question category indexes")
+def category_indexes(connection):
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_questions_category_id "
+        "ON questions (category, id)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_questions_category_difficulty "
+        "ON questions (category, difficulty)"
+    ))
+
+"""
+4: GIN index over models.search_document() for Postgres full-text and
+   prefix search; the expressions must stay identical
+"""
+@migration(4, "question full-text search index")
+def search_index(connection):
+    if connection.dialect.name != "postgresql":
+        return
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_questions_search ON questions USING gin "
+        "(to_tsvector('english', coalesce(question, '') || ' ' || coalesce(answer, '')))"
+    ))
+
+"""
+5: data_version, the one-row counter behind the ETags of conditional GETs
+   (flaskr/conditional.py), shared by every worker
+"""
+@migration(5, "data version counter")
+def data_version_counter(connection):
+    metadata = MetaData()
+    data_version = Table(
+        "data_version",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("version", Integer, nullable=False),
+        Column("modified_at", Float, nullable=False),
+    )
+    metadata.create_all(connection, checkfirst=True)
+    connection.execute(
+        data_version.insert(), {"id": 1, "version": 0, "modified_at": time.time()}
+    )
+
+"""
+migrate(engine, target=None)
+    applies every migration above the recorded version (up to target) and
+    returns the versions applied
+"""
+def migrate(engine, target=None):
+    applied = []
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(
+                text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK}
+            )
+        version_metadata.create_all(connection, checkfirst=True)
+        current = connection.scalar(select(func.max(schema_version.c.version))) or 0
+
+        for version, description, upgrade in MIGRATIONS:
+            if version <= current or (target is not None and version > target):
+                continue
+            upgrade(connection)
+            connection.execute(
+                schema_version.insert(),
+                {
+                    "version": version,
+                    "description": description,
+                    "applied_at": time.time(),
+                },
+            )
+            applied.append(version)
+    return applied
+
+def current_version(engine):
+    with engine.connect() as connection:
+        if not inspect(connection).has_table("schema_version"):
+            return 0
+        return connection.scalar(select(func.max(schema_version.c.version))) or 0
+
+def latest_version():
+    return MIGRATIONS[-1][0]
@@ -1,23 +1,230 @@
-import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
-import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import Column, ForeignKey, Index, String, Integer, func, orm
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+from flask import g, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 
+import settings
 from settings import DB_PATH
+from migrations import migrate
 
 database_path = DB_PATH
-db = SQLAlchemy()
+REPLICA_BIND = "replica"
+
+logger = logging.getLogger(__name__)
+
+"""
+PoolStats
+    connection checkout wait times of the TimedQueuePool engines
+"""
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def observe(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "wait_seconds_total": self.wait_seconds,
+                "wait_seconds_max": self.max_wait_seconds,
+            }
+
+pool_stats = PoolStats()
+
+class TimedQueuePool(QueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.observe(time.perf_counter() - start)
+
+"""
+RoutingSession
+    sends reads to the replica bind while g.use_replica is set (see
+    use_replica()); flushes and writes always go to the primary
+"""
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        if (
+            not self._flushing
+            and has_app_context()
+            and g.get("use_replica")
+            and REPLICA_BIND in (self.app.config.get("SQLALCHEMY_BINDS") or {})
+        ):
+            return db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+"""
+TriviaSQLAlchemy
+    routing sessions, and one engine per database URL and options shared by
+    every app in the process, so another create_app() reuses its pool
+"""
+class TriviaSQLAlchemy(SQLAlchemy):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._engines = {}
+        self._engines_lock = threading.Lock()
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        key = (sa_url, repr(sorted(engine_opts.items())))
+        with self._engines_lock:
+            engine = self._engines.get(key)
+            if engine is None:
+                engine = super().create_engine(sa_url, engine_opts)
+                self._engines[key] = engine
+            return engine
+
+db = TriviaSQLAlchemy()
+
+def use_replica():
+    g.use_replica = True
+
+"""
+on_primary()
+    reads inside the block go to the primary even in a request routed to the
+    replica; process-wide and shared caches are filled this way, since the
+    listeners only ever patch them and a lagging replica's rows would stay
+"""
+@contextmanager
+def on_primary():
+    if not has_app_context() or not g.get("use_replica"):
+        yield
+        return
+    g.use_replica = False
+    try:
+        yield
+    finally:
+        g.use_replica = True
+
+"""
+engine_options(app, database_path)
+    pool and connection options from app.config (test_config) falling back
+    to the DB_* environment settings; SQLALCHEMY_ENGINE_OPTIONS wins
+"""
+def engine_options(app, database_path):
+    options = {}
+    url = make_url(database_path)
+
+    if url.get_backend_name() != "sqlite":
+        def config(key):
+            return app.config.get(key, getattr(settings, key))
+
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=config("DB_POOL_SIZE"),
+            max_overflow=config("DB_MAX_OVERFLOW"),
+            pool_timeout=config("DB_POOL_TIMEOUT"),
+            pool_recycle=config("DB_POOL_RECYCLE"),
+            pool_pre_ping=config("DB_POOL_PRE_PING"),
+        )
+        statement_timeout = config("DB_STATEMENT_TIMEOUT")
+        if statement_timeout and url.get_backend_name() == "postgresql":
+            options["connect_args"] = {
+                "options": "-c statement_timeout=%d" % statement_timeout
+            }
+
+    options.update(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    return options
+
+"""
+init_schema(engine, force=False)
+    runs the migrations once per database per process (every time with
+    force) and returns the versions applied
+"""
+schema_ready = set()
+schema_lock = threading.Lock()
+
+def init_schema(engine, force=False):
+    if engine.url in schema_ready and not force:
+        return []
+    with schema_lock:
+        if engine.url in schema_ready and not force:
+            return []
+        applied = migrate(engine)
+        schema_ready.add(engine.url)
+        return applied
 
 """
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service. DB_INIT picks when
+    the schema is brought up to date (see migrations.py):
+        "eager"   in setup_db (default)
+        "lazy"    on the first request, so startup opens no connection
+        "manual"  never; run `flask init-db`
 """
+def db_init_mode(app):
+    return app.config.get("DB_INIT", settings.DB_INIT)
+
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app, database_path)
+    replica_path = app.config.get("DB_REPLICA_PATH", settings.DB_REPLICA_PATH)
+    if replica_path:
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        binds[REPLICA_BIND] = replica_path
+        app.config["SQLALCHEMY_BINDS"] = binds
     db.app = app
     db.init_app(app)
-    db.create_all()
+
+    mode = db_init_mode(app)
+    if mode == "eager":
+        init_schema(db.get_engine(app))
+    elif mode == "lazy":
+        @app.before_request
+        def init_schema_on_first_request():
+            init_schema(db.get_engine(app))
+
+"""
+search_document()
+    text search document of a question (question and answer text), for
+    Postgres full-text search; migration 4 in migrations.py builds the
+    matching GIN index, so the expressions must stay identical
+"""
+def search_document():
+    return func.to_tsvector(
+        "english",
+        func.coalesce(Question.question, "") + " " + func.coalesce(Question.answer, ""),
+    )
+
+"""
+Question change listeners
+    callables registered with on_question_change(listener) are called as
+    listener(action, question) once a question change has been committed.
+    action is "insert", "update" or "delete"; "reset" (question=None) means
+    many rows changed at once and derived state should be rebuilt. The
+    change is already committed, so a failing listener is logged and the
+    others still run.
+"""
+question_listeners = []
+
+def on_question_change(listener):
+    question_listeners.append(listener)
+    return listener
+
+def notify_question_change(action, question=None):
+    for listener in question_listeners:
+        try:
+            listener(action, question)
+        except Exception:
+            logger.exception("question change listener %r failed", listener)
 
 """
 Question
@@ -25,11 +232,19 @@ Question
 """
 class Question(db.Model):
     __tablename__ = 'questions'
+    # created by migrations.py, declared here to keep the metadata accurate
+    __table_args__ = (
+        Index("ix_questions_category_id", "category", "id"),
+        Index("ix_questions_category_difficulty", "category", "difficulty"),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(
+        Integer,
+        ForeignKey("categories.id", onupdate="CASCADE", ondelete="SET NULL"),
+    )
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
@@ -41,13 +256,16 @@ class Question(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        notify_question_change("insert", self)
 
     def update(self):
         db.session.commit()
+        notify_question_change("update", self)
 
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        notify_question_change("delete", self)
 
     def format(self):
         return {
@@ -10,4 +10,22 @@ DB_USER = os.environ.get("DB_USER")
 DB_PASSWORD = os.environ.get("DB_PASSWORD")
 DB_NAME = os.environ.get("DB_NAME")
 
-DB_PATH = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
\ No newline at end of file
+DB_PATH = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+# ----------------------------------------------------------------------------#
+# Engine / connection pool (ignored for SQLite).
+# ----------------------------------------------------------------------------#
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# milliseconds, 0 disables (Postgres only)
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", 0))
+# optional read replica for the read-only endpoints
+DB_REPLICA_PATH = os.getenv("DB_REPLICA_PATH")
+# when the schema is migrated: "eager" (startup), "lazy" (first request)
+# or "manual" (flask init-db)
+DB_INIT = os.getenv("DB_INIT", "eager")
+# cache shared by the workers: "" (off), "memory" (per worker),
+# "mmap:///dev/shm/trivia-cache" (per node) or "redis://host:6379/0"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "")
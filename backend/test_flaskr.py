@@ -1,10 +1,21 @@
+import gzip
 import os
+import tempfile
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from sqlalchemy import create_engine, event, text
+
+from models import db, question_listeners, Question, Category
+from migrations import current_version, latest_version, migrate
+from flaskr.bank import export_bank
+from flaskr.categories import category_cache
+from flaskr.conditional import data_version_table
+from flaskr.cache import FakeRedis, RedisStore, TieredCache, shared_cache
+from flaskr.group_commit import group_commit_stats
+from flaskr.precompute import precompute_stats, rebuild
+from flaskr.snapshots import category_snapshots
 
 from dotenv import load_dotenv
 
@@ -19,24 +30,35 @@ DATABASE_HOST = os.environ.get('DATABASE_HOST')
 TEST_DATABASE_NAME = os.getenv('TEST_DATABASE_NAME')
 
 
+def select_data_version(engine):
+    with engine.connect() as connection:
+        return connection.scalar(data_version_table.select().with_only_columns(
+            data_version_table.c.version
+        ))
+
+
+def category_snapshot_questions(client, category=0, pages=3):
+    """Questions on the first pages of a category page listing."""
+    return [
+        question
+        for page in range(1, pages + 1)
+        for question in json.loads(client.get(
+            "/categories/%d/questions?page=%d" % (category, page)
+        ).data)["questions"]
+    ]
+
+
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
         self.database_name = "trivia_test"
-        self.database_path = "postgres://{}/{}".format('localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
+        self.database_path = "postgresql://{}/{}".format('localhost:5432', self.database_name)
+        # the engine and the migrated schema are shared by every test's app
+        self.app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path})
+        self.client = self.app.test_client
 
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
-    
     def tearDown(self):
         """Executed after reach test"""
         pass
@@ -54,6 +76,110 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], True)
         self.assertTrue(data["categories"])
 
+    def test_categories_served_from_cache(self):
+        self.client().get("/categories")
+        hits, misses = category_cache.hits, category_cache.misses
+        res = self.client().get("/categories")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["total_categories"], len(data["categories"]))
+        self.assertEqual(category_cache.hits, hits + 1)
+        self.assertEqual(category_cache.misses, misses)
+
+    def test_category_cache_invalidated_on_commit(self):
+        self.client().get("/categories")
+        with self.app.app_context():
+            category = Category(type="Pending")
+            db.session.add(category)
+            db.session.flush()
+            # flushed but not committed: the cached table still stands
+            cached = category_cache.fragments()
+            db.session.commit()
+            res = self.client().get("/categories")
+            db.session.delete(category)
+            db.session.commit()
+
+        self.assertNotIn(category.id, cached[0])
+        self.assertIn(str(category.id), json.loads(res.data)["categories"])
+
+    ## category pages come from snapshots, patched when questions change
+    def snapshot_app(self):
+        return create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "SNAPSHOTS_ENABLED": True,
+        })
+
+    def test_category_page_snapshot_matches_query(self):
+        client = self.snapshot_app().test_client()
+        misses = category_snapshots.misses
+        res = client.get("/categories/0/questions?page=1")
+        plain = self.client().get("/categories/0/questions?page=1")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data), json.loads(plain.data))
+        self.assertEqual(category_snapshots.misses, misses + 1)
+
+    def test_category_page_snapshot_follows_insert(self):
+        client = self.snapshot_app().test_client()
+        client.get("/categories/0/questions")
+        question = Question(question="Snapshot?", answer="Yes", category=1, difficulty=1)
+        question.insert()
+
+        pages = [
+            json.loads(client.get("/categories/0/questions?page=%d" % page).data)
+            for page in range(1, 4)
+        ]
+        ids = [q['id'] for data in pages for q in data['questions']]
+        question.delete()
+
+        self.assertIn(question.id, ids)
+
+    def test_snapshot_query_runs_without_lock(self):
+        client = self.snapshot_app().test_client()
+        held = []
+        load = category_snapshots._load
+
+        def checked_load(category):
+            held.append(category_snapshots._lock.locked())
+            return load(category)
+
+        category_snapshots._load = checked_load
+        try:
+            res = client.get("/categories/0/questions")
+        finally:
+            del category_snapshots._load
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(held, [False])
+
+    def test_snapshots_off_by_default(self):
+        misses = category_snapshots.misses
+        res = self.client().get("/categories/0/questions")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(category_snapshots.misses, misses)
+
+    ## another worker's write reaches the snapshots on the next precompute pass
+    def test_precompute_reloads_snapshots(self):
+        app = self.snapshot_app()
+        client = app.test_client()
+        client.get("/categories/0/questions")
+        with app.app_context():
+            result = db.session.execute(text(
+                "INSERT INTO questions (question, answer, category, difficulty)"
+                " VALUES ('Snapshot elsewhere?', 'yes', 1, 1) RETURNING id"
+            ))
+            question_id = result.scalar()
+            db.session.commit()
+            stale = [q['id'] for q in category_snapshot_questions(client)]
+            rebuild()
+            fresh = [q['id'] for q in category_snapshot_questions(client)]
+            Question.query.get(question_id).delete()
+
+        self.assertNotIn(question_id, stale)
+        self.assertIn(question_id, fresh)
+
     def test_error_get_all_categories(self):
         res = self.client().get("/categorie")
         data = json.loads(res.data)
@@ -91,6 +217,23 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'resource not found')
         
+    ## keyset pagination with after_id cursor
+
+    def test_get_questions_after_id(self):
+        res = self.client().get("/questions?after_id=1")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertTrue(all(q["id"] > 1 for q in data["list_of_questions"]))
+
+    def test_422_sent_after_id_beyond_last_question(self):
+        res = self.client().get("/questions?after_id=100000")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data["success"], False)
+
     ####### Tests for /questions method = ['POST']
 
     def test_add_a_new_question(self):
@@ -110,6 +253,36 @@ class TriviaTestCase(unittest.TestCase):
         ## print("\n\nadd new question: ", data, '\n\n')
         self.assertTrue(data['success'], True)
 
+    ## total_questions is kept in step with inserts without recounting
+    def test_total_questions_follows_insert(self):
+        before = json.loads(self.client().get("/questions").data)["total_questions"]
+
+        res = self.client().post('/questions', json={
+            'question':  'Test counted question string',
+            'answer':  'Counted answer string',
+            'difficulty': 1,
+            'category': 1
+        })
+        data = json.loads(res.data)
+        Question.query.get(data['created']).delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], before + 1)
+
+    def test_add_question_without_refresh(self):
+        res = self.client().post("/questions?refresh=false", json={
+            'question': 'Which planet is known as the red planet?',
+            'answer': 'Mars',
+            'category': 1,
+            'difficulty': 1
+        })
+        data = json.loads(res.data)
+        Question.query.get(data['created']).delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['created'])
+        self.assertNotIn('questions', data)
+
     ## test 422_body incomplete (body has no question)
     def test_422_adding_question_without_a_required_field(self):
         testQuestion = {
@@ -126,6 +299,121 @@ class TriviaTestCase(unittest.TestCase):
         self.assertIsNone(question)
         self.assertTrue(res.status_code, 422)
         
+    ####### Tests for bulk /questions/import and /questions/export
+
+    def test_import_questions_reports_bad_lines(self):
+        body = "\n".join([
+            json.dumps({'question': 'Imported question', 'answer': 'Imported',
+                        'difficulty': 2, 'category': 1}),
+            json.dumps({'answer': 'no question', 'difficulty': 2, 'category': 1}),
+        ])
+        res = self.client().post('/questions/import', data=body,
+                                 content_type='application/x-ndjson')
+        data = json.loads(res.data)
+        for question in Question.query.filter_by(question='Imported question').all():
+            question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['imported'], 1)
+        self.assertEqual(data['failed'], 1)
+        self.assertEqual(data['errors'][0]['line'], 2)
+
+    def test_import_rejects_bool_and_float_numbers(self):
+        body = "\n".join([
+            json.dumps({'question': 'Bool category?', 'answer': 'no',
+                        'difficulty': 1, 'category': True}),
+            json.dumps({'question': 'Float difficulty?', 'answer': 'no',
+                        'difficulty': 2.5, 'category': 1}),
+        ])
+        res = self.client().post('/questions/import', data=body,
+                                 content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual((data['imported'], data['failed']), (0, 2))
+        self.assertEqual([error['line'] for error in data['errors']], [1, 2])
+
+    def test_400_import_empty_body(self):
+        res = self.client().post('/questions/import', data='',
+                                 content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 400)
+
+    def test_export_questions(self):
+        res = self.client().get('/questions/export')
+        lines = res.data.decode().splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(lines), Question.query.count())
+        self.assertIn('question', json.loads(lines[0]))
+
+    ####### Tests for bulk /questions method = ['DELETE', 'PATCH']
+
+    def test_bulk_delete_questions(self):
+        question = Question(question='Bulk delete me', answer='gone',
+                            category='1', difficulty=1)
+        question.insert()
+        question_id = question.id
+
+        res = self.client().delete('/questions', json={'ids': [question_id]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], 1)
+        self.assertIsNone(Question.query.get(question_id))
+
+    def test_400_bulk_delete_without_filter(self):
+        res = self.client().delete('/questions', json={})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_400_bulk_delete_with_malformed_filter(self):
+        total = Question.query.count()
+
+        for body in ({'ids': str(Question.query.first().id)}, {'ids': [True]},
+                     {'ids': [1.5]}, {'ids': 1}, {'category': False},
+                     {'difficulty': 2.5}):
+            res = self.client().delete('/questions', json=body)
+
+            self.assertEqual(res.status_code, 400, body)
+        self.assertEqual(Question.query.count(), total)
+
+    def test_bulk_update_questions(self):
+        question = Question(question='Bulk update me', answer='updated',
+                            category=1, difficulty=1)
+        question.insert()
+        question_id = question.id
+
+        res = self.client().patch('/questions', json={
+            'ids': [question_id], 'set': {'difficulty': 4}
+        })
+        data = json.loads(res.data)
+        db.session.expire_all()
+        difficulty = Question.query.get(question_id).difficulty
+        Question.query.get(question_id).delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['updated'], 1)
+        self.assertEqual(difficulty, 4)
+
+    def test_422_bulk_update_with_null_or_mistyped_value(self):
+        question = Question.query.order_by(Question.id).first()
+        text = question.question
+
+        for values in ({'question': None}, {'difficulty': 'hard'},
+                       {'category': True}, {'answer': 42}):
+            res = self.client().patch('/questions', json={
+                'ids': [question.id], 'set': values
+            })
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 422, values)
+            self.assertEqual(data['success'], False)
+        db.session.expire_all()
+        self.assertEqual(Question.query.get(question.id).question, text)
+
     ####### Test /questions/{id} method = ['DELETE']
 
     def test_delete_question(self):
@@ -171,6 +459,57 @@ class TriviaTestCase(unittest.TestCase):
         # confirm number of questions are valid
         self.assertEqual(len(data['questions']), data['totalQuestions'])
 
+    ## sparse fieldsets and compression
+    def test_questions_fields(self):
+        res = self.client().get("/questions?fields=id,question")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(set(data['list_of_questions'][0]), {'id', 'question'})
+
+    ## lean serialization: column-only rows give the same JSON as the ORM
+    def test_lean_responses_match_orm(self):
+        def client(lean_endpoints):
+            return create_app({
+                "SQLALCHEMY_DATABASE_URI": self.database_path,
+                "LEAN_ENDPOINTS": lean_endpoints,
+                "SNAPSHOTS_ENABLED": False,
+            }).test_client()
+
+        lean = client({"available_questions", "category_question_list"})
+        orm = client(())
+        off = client(False)
+        for url in (
+            "/questions?page=1",
+            "/questions?after_id=5",
+            "/questions?fields=id,answer",
+            "/categories/0/questions",
+            "/categories/3/questions?fields=question,category",
+        ):
+            expected = orm.get(url)
+            res = lean.get(url)
+
+            self.assertEqual(expected.status_code, 200, url)
+            self.assertEqual(res.status_code, 200, url)
+            self.assertEqual(json.loads(res.data), json.loads(expected.data), url)
+            self.assertEqual(off.get(url).data, expected.data, url)
+
+    def test_400_unknown_question_field(self):
+        res = self.client().get("/questions?fields=id,secret")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data["success"], False)
+
+    def test_gzip_questions(self):
+        res = self.client().get("/questions", headers={"Accept-Encoding": "gzip"})
+        data = json.loads(gzip.decompress(res.data))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", res.headers["Vary"])
+        self.assertTrue(data['list_of_questions'])
+
     ## request if beyond valid page number
 
     def test_404_sent_requesting_beyond_valid_page(self):
@@ -181,6 +520,410 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'resource not found')
         
+    ####### Conditional GETs: ETag, If-None-Match and 304
+
+    def test_etag_answers_304(self):
+        res = self.client().get("/questions")
+        etag = res.headers["ETag"]
+        again = self.client().get("/questions", headers={"If-None-Match": etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertEqual(res.headers["Cache-Control"], "no-cache")
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.headers["ETag"], etag)
+        self.assertEqual(again.data, b"")
+
+    def test_etag_changes_after_write(self):
+        etag = self.client().get("/categories").headers["ETag"]
+        res = self.client().post("/questions?refresh=false", json={
+            'question': 'Does the ETag change?',
+            'answer': 'Yes',
+            'category': 1,
+            'difficulty': 1
+        })
+        created = json.loads(res.data)["created"]
+        after = self.client().get("/categories", headers={"If-None-Match": etag})
+        self.client().delete("/questions/%d?refresh=false" % created)
+
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after.headers["ETag"], etag)
+
+    ## the version is in the database, so every worker agrees on the tags
+    def test_etag_shared_between_workers(self):
+        config = {"SQLALCHEMY_DATABASE_URI": self.database_path, "DATA_VERSION_TTL": 0}
+        first = create_app(config).test_client()
+        etag = first.get("/questions").headers["ETag"]
+        second = create_app(config).test_client()
+        same = second.get("/questions", headers={"If-None-Match": etag})
+
+        # a write that bypasses this process's listeners entirely
+        with self.app.app_context():
+            db.session.execute(text(
+                "UPDATE data_version SET version = version + 1 WHERE id = 1"
+            ))
+            db.session.commit()
+        changed = first.get("/questions", headers={"If-None-Match": etag})
+
+        self.assertEqual(same.status_code, 304)
+        self.assertEqual(changed.status_code, 200)
+
+    ## the version is bumped inside the write's own transaction
+    def test_write_bumps_version_without_extra_commit(self):
+        commits = []
+        with self.app.app_context():
+            engine = db.engine
+            version = select_data_version(engine)
+            listener = lambda connection: commits.append(connection)
+            event.listen(engine, "commit", listener)
+            try:
+                question = Question("One commit?", "yes", 1, 1)
+                question.insert()
+                inserted = select_data_version(engine)
+                res = self.client().delete("/questions", json={"ids": [question.id]})
+            finally:
+                event.remove(engine, "commit", listener)
+            deleted = select_data_version(engine)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(commits), 2)
+        self.assertEqual(inserted, version + 1)
+        self.assertEqual(deleted, version + 2)
+
+    ## a failing listener neither fails the request nor starves the others
+    def test_failing_change_listener_is_isolated(self):
+        def broken(action, question):
+            raise RuntimeError("listener failed")
+
+        before = json.loads(self.client().get("/questions").data)["total_questions"]
+        question_listeners.insert(0, broken)
+        try:
+            res = self.client().post("/questions?refresh=false", json={
+                'question': 'Still counted?', 'answer': 'yes',
+                'category': 1, 'difficulty': 1
+            })
+        finally:
+            question_listeners.remove(broken)
+        data = json.loads(res.data)
+        Question.query.get(data['created']).delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], before + 1)
+
+    ####### Test /metrics
+
+    def test_metrics_count_sql_per_endpoint(self):
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "METRICS_ENABLED": True,
+        })
+        client = app.test_client()
+        client.get("/questions")
+        res = client.get("/metrics")
+        body = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('trivia_request_duration_seconds_count{endpoint="available_questions"} 1', body)
+        self.assertIn('trivia_sql_statements_total{endpoint="available_questions"}', body)
+
+    def test_404_metrics_when_disabled(self):
+        res = self.client().get("/metrics")
+        self.assertEqual(res.status_code, 404)
+
+    ## admission control sheds load with 429/503 and Retry-After
+    def test_429_client_over_rate_limit(self):
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "ADMISSION_ENABLED": True,
+            "CLIENT_RATE_LIMIT": (1, 2),
+        })
+        client = app.test_client()
+        statuses = [client.get("/categories").status_code for _ in range(3)]
+        res = client.get("/categories")
+        data = json.loads(res.data)
+
+        self.assertEqual(statuses[:2], [200, 200])
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(data["success"], False)
+        self.assertTrue(res.headers["Retry-After"])
+
+    def test_503_endpoint_at_concurrency_limit(self):
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "ADMISSION_ENABLED": True,
+            "CONCURRENCY_LIMITS": {"search_questions_prefix": 0},
+        })
+        res = app.test_client().get("/questions/search?q=anc")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(res.headers["Retry-After"], "1")
+
+    ## group commit: concurrent creates share transactions
+    def test_group_commit_creates_questions(self):
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "GROUP_COMMIT_ENABLED": True,
+            "GROUP_COMMIT_MAX_DELAY": 0.05,
+        })
+        writer = app.extensions["group_commit"]
+        futures = [
+            writer.submit(Question("Group commit %d?" % i, "yes", 1, 1))
+            for i in range(5)
+        ]
+        ids = [future.result(10) for future in futures]
+
+        res = app.test_client().post("/questions?refresh=false", json={
+            "question": "Committed with the writer?",
+            "answer": "yes",
+            "category": 1,
+            "difficulty": 1,
+        })
+        created = json.loads(res.data)["created"]
+        with app.app_context():
+            stored = Question.query.filter(Question.id.in_(ids + [created])).count()
+            Question.query.filter(Question.id.in_(ids + [created])).delete(
+                synchronize_session=False
+            )
+            db.session.commit()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(set(ids)), 5)
+        self.assertEqual(stored, 6)
+        self.assertLess(group_commit_stats.batch_sizes.count, 6)
+
+    ## form posts send numbers as strings; the listeners must see integers
+    def test_group_commit_files_form_values_as_integers(self):
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "GROUP_COMMIT_ENABLED": True,
+        })
+        client = app.test_client()
+        with app.app_context():
+            others = [q.id for q in Question.query.filter(Question.category == 2)]
+        body = {'previous_questions': others, 'quiz_category': {'id': 2},
+                'answers': [{'difficulty': 3, 'correct': True}]}
+        # load the adaptive buckets before the insert patches them
+        client.post("/quizzes", json=body)
+
+        res = client.post("/questions?refresh=false", json={
+            "question": "Filed under strings?", "answer": "no",
+            "category": "2", "difficulty": "3",
+        })
+        created = json.loads(res.data)["created"]
+        picked = json.loads(client.post("/quizzes", json=body).data)["question"]
+        client.delete("/questions/%d?refresh=false" % created)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(picked["id"], created)
+
+    def test_503_group_commit_timeout(self):
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "GROUP_COMMIT_ENABLED": True,
+            "GROUP_COMMIT_MAX_DELAY": 0.5,
+            "GROUP_COMMIT_TIMEOUT": 0.01,
+        })
+        res = app.test_client().post("/questions?refresh=false", json={
+            "question": "Committed too late?", "answer": "yes",
+            "category": 1, "difficulty": 1,
+        })
+        # the row is still committed once the batch closes
+        app.extensions["group_commit"].close()
+        with app.app_context():
+            Question.query.filter_by(question="Committed too late?").delete()
+            db.session.commit()
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers["Retry-After"], "1")
+
+    def test_group_commit_writer_closed_by_next_app(self):
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "GROUP_COMMIT_ENABLED": True,
+        })
+        writer = app.extensions["group_commit"]
+        create_app({"SQLALCHEMY_DATABASE_URI": self.database_path})
+        res = app.test_client().post("/questions", json={
+            "question": "Anyone there?", "answer": "no",
+            "category": 1, "difficulty": 1,
+        })
+
+        self.assertTrue(writer.closed)
+        self.assertFalse(writer._thread.is_alive())
+        self.assertEqual(res.status_code, 503)
+
+    def test_group_commit_batch_is_one_commit(self):
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "GROUP_COMMIT_ENABLED": True,
+            "GROUP_COMMIT_MAX_DELAY": 0.5,
+        })
+        writer = app.extensions["group_commit"]
+        commits = []
+        with app.app_context():
+            engine = db.engine
+            version = select_data_version(engine)
+            listener = lambda connection: commits.append(connection)
+            event.listen(engine, "commit", listener)
+            try:
+                futures = [
+                    writer.submit(Question("Batched %d?" % i, "yes", 1, 1))
+                    for i in range(8)
+                ]
+                ids = [future.result(10) for future in futures]
+            finally:
+                event.remove(engine, "commit", listener)
+            bumped = select_data_version(engine)
+            Question.query.filter(Question.id.in_(ids)).delete(
+                synchronize_session=False
+            )
+            db.session.commit()
+
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(bumped, version + 1)
+
+    def test_group_commit_survives_failing_listener(self):
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "GROUP_COMMIT_ENABLED": True,
+        })
+        writer = app.extensions["group_commit"]
+
+        def broken(action, question):
+            raise RuntimeError("listener failed")
+
+        question_listeners.append(broken)
+        try:
+            first = writer.insert(Question("Heard by a broken listener?", "yes", 1, 1))
+        finally:
+            question_listeners.remove(broken)
+        second = writer.insert(Question("Still flushed?", "yes", 1, 1))
+        with app.app_context():
+            Question.query.filter(Question.id.in_([first, second])).delete(
+                synchronize_session=False
+            )
+            db.session.commit()
+
+        self.assertTrue(writer._thread.is_alive())
+        self.assertNotEqual(first, second)
+
+    ## precompute: rebuilds pick up rows written by other processes
+    def test_precompute_rebuild_sees_other_writers(self):
+        client = self.client()
+        before = json.loads(client.get("/questions").data)["total_questions"]
+        with self.app.app_context():
+            result = db.session.execute(text(
+                "INSERT INTO questions (question, answer, category, difficulty)"
+                " VALUES ('Written elsewhere?', 'yes', 1, 1) RETURNING id"
+            ))
+            question_id = result.scalar()
+            db.session.commit()
+            rebuild()
+        after = json.loads(client.get("/questions").data)["total_questions"]
+        with self.app.app_context():
+            Question.query.get(question_id).delete()
+
+        self.assertEqual(after, before + 1)
+        self.assertEqual(precompute_stats.skipped, 0)
+
+    def test_precompute_command(self):
+        res = self.app.test_cli_runner().invoke(args=["precompute", "--once"])
+
+        self.assertEqual(res.exit_code, 0)
+        self.assertIn("Rebuilt 5 structures", res.output)
+
+    ## shared cache tier: versioned keys, single-flight, broadcast invalidation
+    def test_shared_cache_invalidated_on_insert(self):
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "CACHE_BACKEND": RedisStore(FakeRedis()),
+        })
+        client = app.test_client()
+        before = json.loads(client.get("/questions").data)
+        self.assertEqual(json.loads(client.get("/questions").data), before)
+
+        res = client.post("/questions", json={
+            "question": "Which planet is the largest?",
+            "answer": "Jupiter",
+            "category": 1,
+            "difficulty": 2,
+        })
+        created = json.loads(res.data)["created"]
+        after = json.loads(client.get("/questions").data)
+        client.delete("/questions/%d?refresh=false" % created)
+
+        self.assertEqual(after["total_questions"], before["total_questions"] + 1)
+        self.assertGreater(shared_cache.local_hits, 0)
+
+    def test_shared_cache_across_workers(self):
+        server = FakeRedis()
+        first, second = TieredCache(), TieredCache()
+        first.configure(RedisStore(server))
+        second.configure(RedisStore(server))
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {"total": len(calls)}
+
+        self.assertEqual(first.get_or_compute("counts", "total", compute), {"total": 1})
+        self.assertEqual(second.get_or_compute("counts", "total", compute), {"total": 1})
+        first.invalidate("counts")
+        self.assertEqual(second.get_or_compute("counts", "total", compute), {"total": 2})
+        self.assertEqual(len(calls), 2)
+
+    ####### Test /metrics/pool
+
+    def test_pool_metrics(self):
+        client = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "METRICS_ENABLED": True,
+        }).test_client()
+        client.get("/questions")
+        res = client.get("/metrics/pool")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['checkout']['checkouts'])
+        self.assertIn('wait_seconds_max', data['checkout'])
+
+    def test_pool_metrics_off_by_default(self):
+        res = self.client().get("/metrics/pool")
+
+        self.assertEqual(res.status_code, 404)
+
+    ## read replica: page reads go to the replica bind, caches to the primary
+    def test_reads_routed_to_replica(self):
+        fd, replica_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        replica = create_engine("sqlite:///" + replica_path)
+        migrate(replica)
+        with replica.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO questions (id, question, answer, category, difficulty)"
+                " VALUES (1000000, 'Only on the replica?', 'yes', NULL, 1)"
+            ))
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "DB_REPLICA_PATH": "sqlite:///" + replica_path,
+        })
+        client = app.test_client()
+
+        res = client.get("/questions?after_id=999999")
+        data = json.loads(res.data)
+        with app.app_context():
+            total = Question.query.count()
+        db.get_engine(app, bind="replica").dispose()
+        replica.dispose()
+        os.remove(replica_path)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["list_of_questions"][0]["question"], "Only on the replica?")
+        # the cached totals were counted on the primary, not the replica
+        self.assertEqual(data["total_questions"], total)
+
     ####### Tests for /quizzes method = ['POST']
     
     ## successful
@@ -198,6 +941,54 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], True)
         self.assertTrue(data['question'])
 
+    ## previous questions are never picked again
+    def test_quizzes_excludes_previous_questions(self):
+        ids = [q.id for q in Question.query.with_entities(Question.id).all()]
+        sendData = {
+            'previous_questions': ids[1:],
+            'quiz_category': {'type': 'All', 'id': 0}
+        }
+        res = self.client().post("/quizzes", json=sendData)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], ids[0])
+        self.assertEqual(data['total_questions'], 1)
+
+    ## adaptive quizzes aim at the difficulty the player's answers point to
+    def test_adaptive_quiz_follows_answers(self):
+        # trivia.psql has no difficulty 5 question; bring one
+        question = Question("Hardest?", "yes", 1, 5)
+        question.insert()
+        answers = [{'difficulty': 5, 'correct': True}] * 10
+        sendData = {
+            'previous_questions': [],
+            'quiz_category': {'type': 'All', 'id': 0},
+            'answers': answers
+        }
+        try:
+            res = self.client().post("/quizzes", json=sendData)
+        finally:
+            question.delete()
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['skill'], 5)
+        self.assertEqual(data['question']['difficulty'], 5)
+
+    def test_adaptive_quiz_excludes_previous_questions(self):
+        ids = [q.id for q in Question.query.with_entities(Question.id).all()]
+        sendData = {
+            'previous_questions': ids[1:],
+            'quiz_category': {'type': 'All', 'id': 0},
+            'answers': [{'difficulty': 1, 'correct': False}]
+        }
+        res = self.client().post("/quizzes", json=sendData)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], ids[0])
+
     ## successful
     def test_400_missing_request_data_quizzes(self):
         sendData = {
@@ -211,6 +1002,83 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 400)
         self.assertEqual(data["success"], False)
     
+    ####### Tests for /quizzes/sessions
+
+    def test_quiz_session_serves_each_question_once(self):
+        res = self.client().post("/quizzes/sessions", json={
+            'quiz_category': {'type': 'Art', 'id': 2}
+        })
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        session_id = data['session_id']
+
+        seen = []
+        for _ in range(data['total_questions']):
+            res = self.client().post("/quizzes/sessions/{}/next".format(session_id))
+            seen.append(json.loads(res.data)['question']['id'])
+        self.assertEqual(len(seen), len(set(seen)))
+
+        res = self.client().post("/quizzes/sessions/{}/next".format(session_id))
+        self.assertIsNone(json.loads(res.data)['question'])
+
+        res = self.client().delete("/quizzes/sessions/{}".format(session_id))
+        self.assertEqual(res.status_code, 200)
+
+    ## with a shared store any worker can serve the next turn
+    def test_quiz_session_shared_between_workers(self):
+        server = FakeRedis()
+        first = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "CACHE_BACKEND": RedisStore(server),
+        }).test_client()
+        res = first.post("/quizzes/sessions", json={
+            'quiz_category': {'type': 'Art', 'id': 2}
+        })
+        data = json.loads(res.data)
+        session_id = data['session_id']
+
+        # a second worker: the first one's process state is gone
+        second = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "CACHE_BACKEND": RedisStore(server),
+        }).test_client()
+        seen = []
+        for _ in range(data['total_questions']):
+            res = second.post("/quizzes/sessions/{}/next".format(session_id))
+            seen.append(json.loads(res.data)['question']['id'])
+        res = first.post("/quizzes/sessions/{}/next".format(session_id))
+
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertIsNone(json.loads(res.data)['question'])
+        self.assertEqual(second.delete("/quizzes/sessions/{}".format(session_id)).status_code, 200)
+        self.assertEqual(first.delete("/quizzes/sessions/{}".format(session_id)).status_code, 404)
+
+    def test_shared_quiz_session_state_does_not_grow(self):
+        store = RedisStore(FakeRedis())
+        client = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "CACHE_BACKEND": store,
+        }).test_client()
+        data = json.loads(client.post("/quizzes/sessions", json={
+            'quiz_category': {'type': 'All', 'id': 0}
+        }).data)
+        key = "quiz_session:" + data['session_id']
+
+        sizes = []
+        for _ in range(data['total_questions']):
+            client.post("/quizzes/sessions/{}/next".format(data['session_id']))
+            sizes.append(len(store.get(key)))
+        client.delete("/quizzes/sessions/{}".format(data['session_id']))
+
+        self.assertLessEqual(max(sizes) - min(sizes), 4)
+
+    def test_404_next_question_of_unknown_session(self):
+        res = self.client().post("/quizzes/sessions/unknown/next")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data["success"], False)
+
     ####### Test search /questions method = ['POST']
     ## successful 
     def test_search(self):
@@ -223,6 +1091,32 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['questions'])
         self.assertTrue(data['currentCategory'])
 
+    ## search also matches answer text
+    def test_search_matches_answer(self):
+        res = self.client().post("/questions", json={"searchTerm": "Maya Angelou"})
+
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['total_questions'])
+        self.assertEqual(data['questions'][0]['answer'], 'Maya Angelou')
+
+    ## search-as-you-type matches the last word as a prefix
+    def test_prefix_search(self):
+        res = self.client().get("/questions/search?q=anc")
+
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertTrue(data['total_questions'])
+        self.assertTrue(data['questions'])
+
+    def test_400_prefix_search_without_term(self):
+        res = self.client().get("/questions/search?q=")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data["success"], False)
+
     ## unsuccessful
     def test_search_empty_results(self):
         res = self.client().post("/questions", 
@@ -234,6 +1128,303 @@ class TriviaTestCase(unittest.TestCase):
 
 
 
+class TriviaSchemaTestCase(unittest.TestCase):
+    """Migrations and the query plans of the hot queries (Postgres)"""
+
+    def setUp(self):
+        self.database_path = "postgresql://{}/{}".format('localhost:5432', "trivia_test")
+        self.app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path})
+
+    def explain(self, statement):
+        with self.app.app_context():
+            db.session.execute(text("SET enable_seqscan = off"))
+            plan = db.session.execute(text("EXPLAIN " + statement)).scalars().all()
+            db.session.rollback()
+        return "\n".join(plan)
+
+    def test_schema_is_migrated(self):
+        with self.app.app_context():
+            self.assertEqual(current_version(db.engine), latest_version())
+            self.assertEqual(migrate(db.engine), [])
+
+    def test_apps_share_one_engine(self):
+        other = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path})
+        self.assertIs(db.get_engine(other), db.get_engine(self.app))
+
+    def test_init_db_command(self):
+        app = create_app({"SQLALCHEMY_DATABASE_URI": self.database_path, "DB_INIT": "manual"})
+        result = app.test_cli_runner().invoke(args=["init-db"])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("up to date", result.output)
+
+    def test_category_page_uses_index(self):
+        plan = self.explain(
+            "SELECT id FROM questions WHERE category = 1 ORDER BY id LIMIT 10"
+        )
+        self.assertIn("ix_questions_category_id", plan)
+
+    def test_category_difficulty_uses_index(self):
+        plan = self.explain(
+            "SELECT id FROM questions WHERE category = 1 AND difficulty = 2"
+        )
+        self.assertIn("ix_questions_category_difficulty", plan)
+
+    def test_search_uses_gin_index(self):
+        plan = self.explain(
+            "SELECT id FROM questions WHERE to_tsvector('english', "
+            "coalesce(question, '') || ' ' || coalesce(answer, '')) "
+            "@@ plainto_tsquery('english', 'soccer')"
+        )
+        self.assertIn("ix_questions_search", plan)
+
+
+try:
+    from starlette.testclient import TestClient
+    from flaskr.asgi import create_asgi_app
+except ImportError:
+    create_asgi_app = None
+
+
+@unittest.skipIf(create_asgi_app is None, "async extras not installed")
+class TriviaAsgiTestCase(unittest.TestCase):
+    """The ASGI app serves the same JSON contracts as the Flask app"""
+
+    def setUp(self):
+        self.database_path = "postgresql://{}/{}".format('localhost:5432', "trivia_test")
+        self.client = TestClient(
+            create_asgi_app({"SQLALCHEMY_DATABASE_URI": self.database_path})
+        )
+        self.flask_client = create_app(
+            {"SQLALCHEMY_DATABASE_URI": self.database_path}
+        ).test_client()
+
+    def test_same_questions_page(self):
+        res = self.client.get("/questions?page=1")
+        expected = json.loads(self.flask_client.get("/questions?page=1").data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), expected)
+
+    def test_404_unknown_quiz_category(self):
+        res = self.client.post("/quizzes", json={
+            'previous_questions': [], 'quiz_category': {'id': 1000}
+        })
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(res.json()["success"], False)
+
+    def test_same_read_responses(self):
+        for url in (
+            "/categories",
+            "/questions?after_id=5&fields=id,question",
+            "/questions?fields=nope",
+            "/categories/0/questions?page=2",
+            "/categories/1000/questions",
+            "/questions/search?q=titl",
+            "/questions/search?q=the+wor&fields=id",
+            "/questions/search?q=",
+        ):
+            res = self.client.get(url)
+            expected = self.flask_client.get(url)
+
+            self.assertEqual(res.status_code, expected.status_code, url)
+            self.assertEqual(res.json(), json.loads(expected.data), url)
+
+    def test_same_search_results(self):
+        body = {'searchTerm': 'title'}
+        res = self.client.post("/questions", json=body)
+        expected = self.flask_client.post("/questions", json=body)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), json.loads(expected.data))
+
+    def test_same_export(self):
+        res = self.client.get("/questions/export")
+        expected = self.flask_client.get("/questions/export")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers["content-type"], "application/x-ndjson")
+        self.assertEqual(
+            [json.loads(line) for line in res.text.splitlines()],
+            [json.loads(line) for line in expected.data.decode().splitlines()],
+        )
+
+    def test_quiz_from_pool(self):
+        body = {'previous_questions': [], 'quiz_category': {'id': 2}}
+        expected = json.loads(self.flask_client.post("/quizzes", json=body).data)
+
+        seen = []
+        for _ in range(expected['total_questions']):
+            res = self.client.post("/quizzes", json=body)
+            question = res.json()['question']
+            self.assertEqual(question['category'], 2)
+            seen.append(question['id'])
+            body['previous_questions'] = seen
+        res = self.client.post("/quizzes", json=body)
+
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertIsNone(res.json()['question'])
+        self.assertEqual(res.json()['total_questions'], 0)
+
+    def test_adaptive_quiz(self):
+        res = self.client.post("/quizzes", json={
+            'previous_questions': [], 'quiz_category': {'id': 0},
+            'answers': [{'difficulty': 1, 'correct': True}],
+        })
+        data = res.json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNotNone(data['question'])
+        self.assertIn('skill', data)
+
+    def test_quiz_session(self):
+        res = self.client.post("/quizzes/sessions", json={
+            'quiz_category': {'type': 'Art', 'id': 2}
+        })
+        data = res.json()
+        expected = json.loads(self.flask_client.post("/quizzes/sessions", json={
+            'quiz_category': {'type': 'Art', 'id': 2}
+        }).data)
+        self.assertEqual(data['total_questions'], expected['total_questions'])
+        session_id = data['session_id']
+
+        seen = []
+        for _ in range(data['total_questions']):
+            res = self.client.post("/quizzes/sessions/{}/next".format(session_id))
+            seen.append(res.json()['question']['id'])
+        res = self.client.post("/quizzes/sessions/{}/next".format(session_id))
+
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertIsNone(res.json()['question'])
+        self.assertEqual(self.client.delete("/quizzes/sessions/{}".format(session_id)).status_code, 200)
+        self.assertEqual(self.client.delete("/quizzes/sessions/{}".format(session_id)).status_code, 404)
+        self.assertEqual(self.client.post("/quizzes/sessions", json={}).status_code, 400)
+
+    def test_import_update_and_delete(self):
+        body = "\n".join([
+            json.dumps({'question': 'Async imported question', 'answer': 'Imported',
+                        'difficulty': 2, 'category': 1}),
+            json.dumps({'answer': 'no question', 'difficulty': 2, 'category': 1}),
+        ])
+        res = self.client.post('/questions/import', content=body,
+                               headers={'Content-Type': 'application/x-ndjson'})
+        data = res.json()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual((data['imported'], data['failed']), (1, 1))
+        self.assertEqual(data['errors'][0]['line'], 2)
+
+        res = self.client.get('/questions/search?q=async+import')
+        question_id = res.json()['questions'][0]['id']
+
+        res = self.client.patch('/questions', json={
+            'ids': [question_id], 'set': {'difficulty': None}
+        })
+        self.assertEqual(res.status_code, 422)
+        res = self.client.patch('/questions', json={
+            'ids': [question_id], 'set': {'difficulty': 4}
+        })
+        self.assertEqual(res.json()['updated'], 1)
+
+        res = self.client.post("/quizzes", json={
+            'previous_questions': [], 'quiz_category': {'id': 1},
+            'answers': [{'difficulty': 4, 'correct': True}] * 10,
+        })
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client.request('DELETE', '/questions', json={'ids': [question_id]})
+        self.assertEqual(res.json()['deleted'], 1)
+        res = self.client.request('DELETE', '/questions', json={})
+        self.assertEqual(res.status_code, 400)
+        res = self.client.get('/questions/search?q=async+import')
+        self.assertEqual(res.json()['total_questions'], 0)
+
+    ## ASGI writes reach the ETags and the shared cache of the Flask app
+    def test_writes_invalidate_flask_caches(self):
+        flask_client = create_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "CACHE_BACKEND": RedisStore(FakeRedis()),
+            "DATA_VERSION_TTL": 60,
+        }).test_client()
+        first = flask_client.get("/questions")
+        etag = first.headers["ETag"]
+        total = json.loads(first.data)["total_questions"]
+
+        res = self.client.post("/questions?refresh=false", json={
+            'question': 'Written through ASGI?', 'answer': 'yes',
+            'category': 1, 'difficulty': 1
+        })
+        created = res.json()["created"]
+        inserted = flask_client.get("/questions", headers={"If-None-Match": etag})
+        self.client.request('DELETE', '/questions', json={'ids': [created]})
+        deleted = flask_client.get("/questions")
+
+        self.assertEqual(inserted.status_code, 200)
+        self.assertNotEqual(inserted.headers["ETag"], etag)
+        self.assertEqual(json.loads(inserted.data)["total_questions"], total + 1)
+        self.assertEqual(json.loads(deleted.data)["total_questions"], total)
+
+    def test_pool_metrics(self):
+        client = TestClient(create_asgi_app({
+            "SQLALCHEMY_DATABASE_URI": self.database_path,
+            "METRICS_ENABLED": True,
+        }))
+        client.get("/categories")
+        res = client.get("/metrics/pool")
+        data = res.json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertGreater(data['checkout']['checkouts'], 0)
+        self.assertIsInstance(data['status'], str)
+        self.assertEqual(self.client.get("/metrics/pool").status_code, 404)
+
+
+class TriviaOfflineTestCase(unittest.TestCase):
+    """Offline mode serves the read-only endpoints from a bank file"""
+
+    def setUp(self):
+        self.database_path = "postgresql://{}/{}".format('localhost:5432', "trivia_test")
+        self.flask_client = create_app(
+            {"SQLALCHEMY_DATABASE_URI": self.database_path}
+        ).test_client()
+        fd, self.bank_path = tempfile.mkstemp(suffix=".bin")
+        os.close(fd)
+        with self.flask_client.application.app_context():
+            export_bank(self.bank_path)
+        self.client = create_app({"SNAPSHOT_PATH": self.bank_path}).test_client()
+
+    def tearDown(self):
+        os.remove(self.bank_path)
+
+    def test_same_read_only_responses(self):
+        for url in (
+            "/categories",
+            "/questions?page=1",
+            "/questions?after_id=5&fields=id,question",
+            "/categories/0/questions",
+            "/categories/1000/questions",
+        ):
+            res = self.client.get(url)
+            expected = self.flask_client.get(url)
+
+            self.assertEqual(res.status_code, expected.status_code, url)
+            self.assertEqual(json.loads(res.data), json.loads(expected.data), url)
+
+    def test_quiz_from_bank(self):
+        res = self.client.post("/quizzes", json={
+            'previous_questions': [], 'quiz_category': {'id': 1}
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["question"]["category"], 1)
+
+    def test_404_write_endpoints_offline(self):
+        res = self.client.delete("/questions/1")
+
+        self.assertEqual(res.status_code, 404)
+
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -77,11 +77,9 @@ class QuestionView extends Component {
   };
   submitSearch = (searchTerm) => {
     $.ajax({
-      url: `/questions`, //TODO: update request URL
-      type: "POST",
+      url: `/questions/search?q=${encodeURIComponent(searchTerm)}`,
+      type: "GET",
       dataType: "json",
-      contentType: "application/json",
-      data: JSON.stringify({ searchTerm: searchTerm }),
       xhrFields: {
         withCredentials: true,
       },
@@ -104,7 +102,7 @@ class QuestionView extends Component {
     if (action === "DELETE") {
       if (window.confirm("are you sure you want to delete the question?")) {
         $.ajax({
-          url: `/questions/${id}`, //TODO: update request URL
+          url: `/questions/${id}?refresh=false`, //TODO: update request URL
           type: "DELETE",
           success: (result) => {
             this.getQuestions();
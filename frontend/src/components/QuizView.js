@@ -9,7 +9,8 @@ class QuizView extends Component {
     super();
     this.state = {
       quizCategory: null,
-      previousQuestions: [],
+      sessionId: null,
+      questionsPlayed: 0,
       showAnswer: false,
       categories: {},
       numCorrect: 0,
@@ -35,7 +36,28 @@ class QuizView extends Component {
   }
 
   selectCategory = ({ type, id = 0 }) => {
-    this.setState({ quizCategory: { type, id } }, this.getNextQuestion);
+    $.ajax({
+      url: '/quizzes/sessions',
+      type: 'POST',
+      dataType: 'json',
+      contentType: 'application/json',
+      data: JSON.stringify({ quiz_category: { type, id } }),
+      xhrFields: {
+        withCredentials: true,
+      },
+      crossDomain: true,
+      success: (result) => {
+        this.setState(
+          { quizCategory: { type, id }, sessionId: result.session_id },
+          this.getNextQuestion
+        );
+        return;
+      },
+      error: (error) => {
+        alert('Unable to start the quiz. Please try your request again');
+        return;
+      },
+    });
   };
 
   handleChange = (event) => {
@@ -43,20 +65,14 @@ class QuizView extends Component {
   };
 
   getNextQuestion = () => {
-    const previousQuestions = [...this.state.previousQuestions];
-    if (this.state.currentQuestion.id) {
-      previousQuestions.push(this.state.currentQuestion.id);
-    }
+    const questionsPlayed = this.state.currentQuestion.id
+      ? this.state.questionsPlayed + 1
+      : this.state.questionsPlayed;
 
     $.ajax({
-      url: '/quizzes', //TODO: update request URL
+      url: `/quizzes/sessions/${this.state.sessionId}/next`,
       type: 'POST',
       dataType: 'json',
-      contentType: 'application/json',
-      data: JSON.stringify({
-        previous_questions: previousQuestions,
-        quiz_category: this.state.quizCategory,
-      }),
       xhrFields: {
         withCredentials: true,
       },
@@ -64,7 +80,7 @@ class QuizView extends Component {
       success: (result) => {
         this.setState({
           showAnswer: false,
-          previousQuestions: previousQuestions,
+          questionsPlayed: questionsPlayed,
           currentQuestion: result.question,
           guess: '',
           forceEnd: result.question ? false : true,
@@ -88,9 +104,16 @@ class QuizView extends Component {
   };
 
   restartGame = () => {
+    if (this.state.sessionId) {
+      $.ajax({
+        url: `/quizzes/sessions/${this.state.sessionId}`,
+        type: 'DELETE',
+      });
+    }
     this.setState({
       quizCategory: null,
-      previousQuestions: [],
+      sessionId: null,
+      questionsPlayed: 0,
       showAnswer: false,
       numCorrect: 0,
       currentQuestion: {},
@@ -170,7 +193,7 @@ class QuizView extends Component {
   }
 
   renderPlay() {
-    return this.state.previousQuestions.length === questionsPerPlay ||
+    return this.state.questionsPlayed === questionsPerPlay ||
       this.state.forceEnd ? (
       this.renderFinalScore()
     ) : this.state.showAnswer ? (
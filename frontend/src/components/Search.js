@@ -1,5 +1,7 @@
 import React, { Component } from 'react';
 
+const searchDelay = 150;
+
 class Search extends Component {
   state = {
     query: '',
@@ -14,8 +16,21 @@ class Search extends Component {
     this.setState({
       query: this.search.value,
     });
+
+    // search as you type, once the user pauses
+    clearTimeout(this.timer);
+    if (this.search.value.trim()) {
+      this.timer = setTimeout(
+        () => this.props.submitSearch(this.state.query),
+        searchDelay
+      );
+    }
   };
 
+  componentWillUnmount() {
+    clearTimeout(this.timer);
+  }
+
   render() {
     return (
       <form onSubmit={this.getInfo}>